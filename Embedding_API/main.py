@@ -9,11 +9,12 @@ import re
 from fastapi import HTTPException
 from typing import List, Dict, Any
 from fastapi.middleware.cors import CORSMiddleware
+from shared.chunking import get_chunker
+from shared.embedding_cache import open_embedding_cache
+from shared.metrics import Metrics
 
 load_dotenv()
 
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-
 # Инициализация FastAPI
 app = FastAPI(title="Text Chunking & Embedding API")
 app.add_middleware(
@@ -23,6 +24,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+metrics = Metrics("embedding_api")
+metrics.instrument(app)  # GET /metrics
 
 # Настройка Gemini API
 GEMINI_APIKEY = os.getenv("GEMINI_APIKEY")
@@ -31,6 +34,43 @@ if not GEMINI_APIKEY:
 
 client = genai.Client(api_key=GEMINI_APIKEY)
 
+EMBED_MODEL = "gemini-embedding-001"
+# Общий с gemini_rag / ExtractAPI кэш эмбеддингов на диске (включается через EMBED_CACHE_PATH)
+embedding_cache = open_embedding_cache()
+
+def embed_chunks(chunks: List[str]) -> List[List[float]]:
+    def embed(texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for text in texts:
+            metrics.call("gemini_embed")
+            try:
+                with metrics.in_flight("gemini_embed"):
+                    result = client.models.embed_content(
+                        model=EMBED_MODEL,
+                        contents=text,
+                        config=types.EmbedContentConfig(task_type="RETRIEVAL_DOCUMENT"),
+                    )
+            except Exception:
+                metrics.failure("gemini_embed")
+                raise
+            vectors.append(result.embeddings[0].values)
+        return vectors
+
+    if embedding_cache is None:
+        return embed(chunks)
+    # dim=0: размерность модели по умолчанию
+    return embedding_cache.embed_cached(chunks, embed, EMBED_MODEL, 0, "RETRIEVAL_DOCUMENT")
+
+# API считает chunk_size/overlap в токенах по 4 символа (как и раньше), а не по shared CHARS_PER_TOKEN
+API_CHARS_PER_TOKEN = 4
+
+def chunker_for(request: "DocumentRequest"):
+    """Общий (кэшированный) чанкер для размеров из запроса; размеры в токенах по API_CHARS_PER_TOKEN символов"""
+    try:
+        return get_chunker(request.chunk_size * API_CHARS_PER_TOKEN, request.overlap * API_CHARS_PER_TOKEN, "chars")
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=422, detail=f"Неверные chunk_size/overlap: {e}")
+
 # Модели данных
 class DocumentRequest(BaseModel):
     text: str
@@ -41,6 +81,8 @@ class DocumentRequest(BaseModel):
 class ChunkInfo(BaseModel):
     chunk_id: int
     text: str
+    start: int  # смещение в символах в исходном тексте
+    end: int
     embedding: List[float]
 
 class DocumentEmbeddingResponse(BaseModel):
@@ -125,24 +167,19 @@ class DocumentEmbeddingResponse(BaseModel):
 
 @app.post("/chunks_get")
 async def chunks_get(request: DocumentRequest):
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=request.chunk_size * 4,
-        chunk_overlap=request.overlap * 4,
-        separators=["\n\n", "\n", " ", ""],
-        keep_separator=False,
-    )
-
-    chunks = splitter.split_text(request.text)
+    chunker = chunker_for(request)
 
     docs = [
         {
-            "content": chunk,
+            "content": chunk.text,
             "meta": {
                 "title": request.title,
-                "chunk": i
+                "chunk": chunk.index,
+                "start": chunk.start,
+                "end": chunk.end,
             }
         }
-        for i, chunk in enumerate(chunks)
+        for chunk in chunker.iter_chunks(request.text)
     ]
 
     return docs
@@ -159,31 +196,24 @@ async def process_document(request: DocumentRequest):
     - overlap: размер перекрытия в токенах (по умолчанию 250)
     - title: опциональный заголовок документа
     """
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=request.chunk_size*4,
-        chunk_overlap=request.overlap*4,
-        separators=["\n\n", "\n", " ", ""],
-        keep_separator=False,
-    )
+    chunker = chunker_for(request)
     try:
         # Разбиваем текст на чанки
-        chunks = text_splitter.split_text(request.text)
+        with metrics.stage("chunking"):
+            chunks = list(chunker.iter_chunks(request.text))
         
-        # Создаем эмбеддинги для каждого чанка
+        # Создаем эмбеддинги для каждого чанка (из кэша, если уже считали)
         chunk_infos = []
+        with metrics.stage("embed"):
+            embeddings = embed_chunks([chunk.text for chunk in chunks])
         
-        for i, chunk in enumerate(chunks):
-            # Получаем эмбеддинг
-            result = client.models.embed_content(
-                model="gemini-embedding-001",
-                contents=chunk,
-                config=types.EmbedContentConfig(task_type="RETRIEVAL_DOCUMENT"),
-            )
-            
+        for chunk, embedding in zip(chunks, embeddings):
             chunk_infos.append(ChunkInfo(
-                chunk_id=i,
-                text=chunk,
-                embedding=result.embeddings[0].values,
+                chunk_id=chunk.index,
+                text=chunk.text,
+                start=chunk.start,
+                end=chunk.end,
+                embedding=embedding,
             ))
         
         return DocumentEmbeddingResponse(
@@ -203,24 +233,20 @@ async def get_chunks_only(request: DocumentRequest):
     Только разбивает текст на чанки без создания эмбеддингов
     Полезно для тестирования разбиения
     """
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=request.chunk_size*4,
-        chunk_overlap=request.overlap*4,
-        separators=["\n\n", "\n", " ", ""],
-        keep_separator=False,
-    )
+    chunker = chunker_for(request)
     try:
-        print(type(request.text))
-        chunks = text_splitter.split_text(request.text)
+        chunks = list(chunker.iter_chunks(request.text))
         
         return {
             "chunks": [
                 {
-                    "chunk_id": i,
-                    "text": chunk,
-                    "length": len(chunk)
+                    "chunk_id": chunk.index,
+                    "text": chunk.text,
+                    "start": chunk.start,
+                    "end": chunk.end,
+                    "length": len(chunk.text)
                 }
-                for i, chunk in enumerate(chunks)
+                for chunk in chunks
             ],
             "total_chunks": len(chunks),
             "original_length": len(request.text)
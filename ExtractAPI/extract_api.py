@@ -1,13 +1,36 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException
-from text_utils import extract_text_from_pdf, extract_text_from_docx, clean_text, chunk_text
+from text_utils import extract_text_from_pdf, extract_text_from_docx, clean_text, chunk_spans
 import tempfile
 import google.generativeai as genai
 import os
 from fastapi.middleware.cors import CORSMiddleware
+from shared.embedding_cache import open_embedding_cache
+from shared.metrics import Metrics
 
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 emb_model = "models/text-embedding-004"
 
+# Общий с gemini_rag / Embedding_API кэш эмбеддингов на диске (включается через EMBED_CACHE_PATH)
+embedding_cache = open_embedding_cache()
+
+
+def embed_chunks(chunks):
+    def embed(texts):
+        vectors = []
+        for t in texts:
+            metrics.call("gemini_embed")
+            try:
+                with metrics.in_flight("gemini_embed"):
+                    vectors.append(genai.embed_content(model=emb_model, content=t, task_type="retrieval_document")["embedding"])
+            except Exception:
+                metrics.failure("gemini_embed")
+                raise
+        return vectors
+
+    if embedding_cache is None:
+        return embed(chunks)
+    return embedding_cache.embed_cached(chunks, embed, emb_model, 0, "retrieval_document")
+
 app = FastAPI(title="Ingest & Extract API")
 app.add_middleware(
     CORSMiddleware,
@@ -16,10 +39,17 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+metrics = Metrics("extract_api")
+metrics.instrument(app)  # GET /metrics
 
 
 # --- helper: сохранить файл и вернуть очищенный текст ---
 async def load_and_extract(file: UploadFile) -> str:
+    with metrics.stage("extract"):
+        return await _load_and_extract(file)
+
+
+async def _load_and_extract(file: UploadFile) -> str:
     suffix = os.path.splitext(file.filename)[1].lower()
 
     with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
@@ -63,18 +93,18 @@ async def extract_text(file: UploadFile = File(...)):
 async def ingest_file(file: UploadFile = File(...)):
     text = await load_and_extract(file)
 
-    chunks = chunk_text(text)
+    with metrics.stage("chunking"):
+        chunks = chunk_spans(text)
+    with metrics.stage("embed"):
+        embeddings = embed_chunks([ch.text for ch in chunks])
 
     vectors = []
-    for ch in chunks:
-        resp = genai.embed_content(
-            model=emb_model,
-            content=ch,
-            task_type="retrieval_document"
-        )
+    for ch, embedding in zip(chunks, embeddings):
         vectors.append({
-            "text": ch,
-            "embedding": resp["embedding"]
+            "text": ch.text,
+            "start": ch.start,
+            "end": ch.end,
+            "embedding": embedding
         })
 
     return {
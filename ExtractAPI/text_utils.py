@@ -3,6 +3,8 @@ from typing import List
 from PyPDF2 import PdfReader
 import docx
 
+from shared.chunking import Chunk, get_chunker
+
 def extract_text_from_pdf(file_path: str) -> str:
     reader = PdfReader(file_path)
     return "\n".join(page.extract_text() or "" for page in reader.pages)
@@ -15,18 +17,9 @@ def clean_text(text: str) -> str:
     text = re.sub(r'\s+', ' ', text)  # убрать лишние пробелы/переносы
     return text.strip()
 
-def chunk_text(text: str, chunk_size: int = 800) -> List[str]:
-    words = text.split()
-    chunks = []
-    current = []
-
-    for w in words:
-        current.append(w)
-        if len(current) >= chunk_size:
-            chunks.append(" ".join(current))
-            current = []
+def chunk_spans(text: str, chunk_size: int = 800) -> List[Chunk]:
+    """Чанки до chunk_size слов по границам предложений, со смещениями start/end в text"""
+    return list(get_chunker(chunk_size, 0, "words").iter_chunks(text))
 
-    if current:
-        chunks.append(" ".join(current))
-
-    return chunks
\ No newline at end of file
+def chunk_text(text: str, chunk_size: int = 800) -> List[str]:
+    return [chunk.text for chunk in chunk_spans(text, chunk_size)]
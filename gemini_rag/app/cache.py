@@ -0,0 +1,257 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def normalize_query(text: str) -> str:
+    """Collapse whitespace and case so trivially different questions share a cache key"""
+    return " ".join(text.split()).casefold()
+
+
+class LRUTTLCache:
+    """Bounded in-process cache with LRU eviction, per-entry TTL and hit/miss counters"""
+
+    def __init__(self, max_size: int = 1024, ttl_seconds: float = 3600.0):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            expires_at, value = item
+            if expires_at <= now:
+                del self._data[key]
+                self.evictions += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class SemanticAnswerCache:
+    """
+    Caches generated answers by query embedding. A lookup hits when a cached query lies within
+    `max_distance` cosine distance of the new one AND retrieval returned the same document ids,
+    so paraphrases of an already answered question skip the Gemini generation call.
+    """
+
+    def __init__(self, max_size: int = 512, max_distance: float = 0.05, ttl_seconds: float = 3600.0):
+        self.max_size = max_size
+        self.max_distance = max_distance
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._vectors = None  # (n, dim) float32 matrix of unit-normalized query embeddings
+        self._entries: List[Dict[str, Any]] = []
+        self.generation = 0  # bumped on every invalidation
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    @staticmethod
+    def _unit(embedding: Sequence[float]) -> np.ndarray:
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else vec
+
+    def _drop(self, indices: List[int]):
+        dropped = set(indices)
+        keep = [i for i in range(len(self._entries)) if i not in dropped]
+        self._entries = [self._entries[i] for i in keep]
+        self._vectors = self._vectors[keep] if keep else None
+
+    def lookup(self, embedding: Sequence[float], doc_ids: Sequence[str]) -> Optional[Dict[str, Any]]:
+        query = self._unit(embedding)
+        doc_ids = tuple(doc_ids)
+        now = time.monotonic()
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != query.shape[0]:
+                self.misses += 1
+                return None
+
+            expired = [i for i, e in enumerate(self._entries) if e["expires_at"] <= now]
+            if expired:
+                self._drop(expired)
+                if self._vectors is None:
+                    self.misses += 1
+                    return None
+
+            distances = 1.0 - self._vectors @ query
+            for i in np.argsort(distances):
+                if distances[i] > self.max_distance:
+                    break
+                entry = self._entries[i]
+                if entry["doc_ids"] == doc_ids:
+                    entry["last_used"] = now
+                    self.hits += 1
+                    self.saved_seconds += entry["latency"]
+                    return {"answer": entry["answer"], "distance": float(distances[i])}
+
+            self.misses += 1
+            return None
+
+    def put(
+            self,
+            embedding: Sequence[float],
+            doc_ids: Sequence[str],
+            answer: str,
+            latency: float,
+            generation: Optional[int] = None,
+    ):
+        """Store an answer. Pass the `generation` read before retrieval so answers computed
+        against a collection that changed in the meantime are dropped instead of cached."""
+        if self.max_size <= 0:
+            return
+        vec = self._unit(embedding)
+        now = time.monotonic()
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            if self._vectors is not None and self._vectors.shape[1] != vec.shape[0]:
+                self._entries, self._vectors = [], None
+
+            if len(self._entries) >= self.max_size:
+                lru = min(range(len(self._entries)), key=lambda i: self._entries[i]["last_used"])
+                self._drop([lru])
+
+            self._entries.append({
+                "doc_ids": tuple(doc_ids),
+                "answer": answer,
+                "latency": latency,
+                "expires_at": now + self.ttl_seconds,
+                "last_used": now,
+            })
+            row = vec[np.newaxis, :]
+            self._vectors = row if self._vectors is None else np.vstack([self._vectors, row])
+
+    def invalidate(self):
+        with self._lock:
+            self._entries, self._vectors = [], None
+            self.generation += 1
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "max_distance": self.max_distance,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "latency_saved_seconds": round(self.saved_seconds, 3),
+            "invalidations": self.generation,
+        }
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one execution: the first caller (leader) runs it,
+    callers arriving while it is in flight wait for and share its result (or exception).
+    Nothing is kept once the call finishes - this is deduplication of in-flight work, not a cache.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sync_calls: Dict[Hashable, "_Call"] = {}
+        self._async_calls: Dict[Hashable, "asyncio.Task"] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Run fn() once per in-flight key; returns (result, shared) where shared=True for followers"""
+        with self._lock:
+            call = self._sync_calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._sync_calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._sync_calls[key]
+            call.done.set()
+        return call.result, False
+
+    async def ado(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Async variant. The work runs as its own task, so a disconnecting leader does not cancel it for the others"""
+        task = self._async_calls.get(key)
+        shared = task is not None
+        if shared:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(factory())
+            self._async_calls[key] = task
+            self.leaders += 1
+            task.add_done_callback(lambda _: self._async_calls.pop(key, None))
+        return await asyncio.shield(task), shared
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.leaders + self.coalesced
+        return {
+            "in_flight": len(self._sync_calls) + len(self._async_calls),
+            "executed": self.leaders,
+            "coalesced": self.coalesced,
+            "coalesced_rate": round(self.coalesced / total, 4) if total else 0.0,
+        }
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
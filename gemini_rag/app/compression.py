@@ -0,0 +1,164 @@
+import asyncio
+import re
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .cache import LRUTTLCache
+from .sparse import BM25Index
+from .tokens import estimate_tokens
+
+COMPRESSION_MODES = ("none", "lexical", "embedding")
+
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+
+
+def split_sentences(text: str, min_chars: int = 20) -> List[str]:
+    """Sentences of one line; fragments shorter than min_chars are glued to the previous one"""
+    sentences: List[str] = []
+    for piece in _SENTENCE_END.split(text):
+        piece = piece.strip()
+        if not piece:
+            continue
+        if sentences and len(piece) < min_chars:
+            sentences[-1] = f"{sentences[-1]} {piece}"
+        else:
+            sentences.append(piece)
+    return sentences
+
+
+class SentenceCompressor:
+    """
+    Extractive compression of the built context: split passages into sentences, score each against the
+    query and keep the best ones (in their original order) while they fit `token_budget`.
+
+    - "lexical": BM25 of the query over the sentences, no API calls.
+    - "embedding": cosine to the query embedding. Sentence vectors come from `embed_fn` (the document
+      embedder, so the persistent embedding cache applies) behind an in-process LRU.
+    """
+
+    def __init__(
+            self,
+            mode: str = "lexical",
+            token_budget: int = 800,
+            embed_fn: Optional[Callable[[List[str]], List[List[float]]]] = None,
+            aembed_fn=None,
+            cache_size: int = 20000,
+    ):
+        if mode not in COMPRESSION_MODES or mode == "none":
+            raise ValueError(f"Unknown compression mode: {mode} (expected lexical or embedding)")
+        if mode == "embedding" and embed_fn is None:
+            raise ValueError("embedding compression needs an embed_fn")
+        self.mode = mode
+        self.token_budget = token_budget
+        self.embed_fn = embed_fn
+        self.aembed_fn = aembed_fn
+        self.cache = LRUTTLCache(max_size=cache_size, ttl_seconds=24 * 3600)
+
+    @staticmethod
+    def _units(context: str) -> List[Tuple[Tuple[int, int], str]]:
+        """((passage, line), sentence) pairs with exact duplicates (chunk overlaps) removed.
+        Lines are kept apart so tables and lists survive compression"""
+        seen = set()
+        units = []
+        for p, passage in enumerate(context.split("\n\n")):
+            for l, line in enumerate(passage.split("\n")):
+                for sentence in split_sentences(line):
+                    if sentence not in seen:
+                        seen.add(sentence)
+                        units.append(((p, l), sentence))
+        return units
+
+    @staticmethod
+    def _lexical_scores(query_text: str, sentences: Sequence[str]) -> np.ndarray:
+        index = BM25Index()
+        index.add([SimpleNamespace(id=str(i), content=s, meta=None) for i, s in enumerate(sentences)])
+        scores = np.zeros(len(sentences), dtype=np.float32)
+        for doc_id, score in index.search(query_text, top_k=len(sentences)):
+            scores[int(doc_id)] = score
+        return scores
+
+    def _lookup(self, sentences: Sequence[str]) -> Tuple[Dict[str, tuple], List[str]]:
+        known, missing = {}, []
+        for sentence in dict.fromkeys(sentences):
+            vector = self.cache.get(sentence)
+            if vector is None:
+                missing.append(sentence)
+            else:
+                known[sentence] = vector
+        return known, missing
+
+    def _remember(self, known: Dict[str, tuple], missing: List[str], vectors: List[List[float]]):
+        for sentence, vector in zip(missing, vectors):
+            known[sentence] = tuple(vector)
+            self.cache.put(sentence, known[sentence])
+
+    @staticmethod
+    def _embedding_scores(query_emb: Sequence[float], sentences: Sequence[str], known: Dict[str, tuple]) -> np.ndarray:
+        vectors = np.asarray([known[s] for s in sentences], dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        query = np.asarray(query_emb, dtype=np.float32)
+        return vectors @ (query / max(float(np.linalg.norm(query)), 1e-12))
+
+    def _select(self, units: List[Tuple[Tuple[int, int], str]], scores: np.ndarray) -> Tuple[str, int]:
+        kept, used = [], 0
+        for i in np.argsort(-scores, kind="stable"):
+            tokens = estimate_tokens(units[i][1])
+            if kept and used + tokens > self.token_budget:
+                continue
+            kept.append(int(i))
+            used += tokens
+        kept.sort()
+        passages: Dict[int, Dict[int, List[str]]] = {}
+        for i in kept:
+            (p, l), sentence = units[i]
+            passages.setdefault(p, {}).setdefault(l, []).append(sentence)
+        text = "\n\n".join(
+            "\n".join(" ".join(sentences) for _, sentences in sorted(lines.items()))
+            for _, lines in sorted(passages.items())
+        )
+        return text, len(kept)
+
+    def _result(self, context: str, compressed: str, sentences_kept: int, sentences_in: int) -> Tuple[str, Dict[str, Any]]:
+        before, after = estimate_tokens(context), estimate_tokens(compressed)
+        return compressed, {
+            "mode": self.mode,
+            "tokens_before": before,
+            "tokens_after": after,
+            "ratio": round(after / before, 3) if before else 1.0,
+            "sentences_in": sentences_in,
+            "sentences_kept": sentences_kept,
+        }
+
+    def _fits(self, context: str, units) -> bool:
+        return estimate_tokens(context) <= self.token_budget or len(units) < 2
+
+    def compress(self, query_text: str, query_emb: Sequence[float], context: str) -> Tuple[str, Dict[str, Any]]:
+        units = self._units(context)
+        if self._fits(context, units):
+            return self._result(context, context, len(units), len(units))
+        sentences = [s for _, s in units]
+        if self.mode == "lexical":
+            scores = self._lexical_scores(query_text, sentences)
+        else:
+            known, missing = self._lookup(sentences)
+            if missing:
+                self._remember(known, missing, self.embed_fn(missing))
+            scores = self._embedding_scores(query_emb, sentences, known)
+        return self._result(context, *self._select(units, scores), len(units))
+
+    async def acompress(self, query_text: str, query_emb: Sequence[float], context: str) -> Tuple[str, Dict[str, Any]]:
+        if self.mode == "lexical":
+            return self.compress(query_text, query_emb, context)
+        if self.aembed_fn is None:
+            return await asyncio.to_thread(self.compress, query_text, query_emb, context)
+        units = self._units(context)
+        if self._fits(context, units):
+            return self._result(context, context, len(units), len(units))
+        sentences = [s for _, s in units]
+        known, missing = self._lookup(sentences)
+        if missing:
+            self._remember(known, missing, await self.aembed_fn(missing))
+        scores = self._embedding_scores(query_emb, sentences, known)
+        return self._result(context, *self._select(units, scores), len(units))
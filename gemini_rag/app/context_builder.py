@@ -0,0 +1,154 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from haystack import Document
+
+from .tokens import CHARS_PER_TOKEN, estimate_tokens
+
+MIN_OVERLAP_CHARS = 20
+MAX_OVERLAP_CHARS = 1000
+
+
+def mmr_order(query_emb: Sequence[float], hits: List[Document], mmr_lambda: float = 0.7) -> List[Document]:
+    """
+    Order hits by maximal marginal relevance: lambda * sim(query, d) - (1 - lambda) * max sim(d, already picked).
+    Hits without embeddings keep their retrieval order.
+    """
+    if len(hits) < 2 or any(h.embedding is None for h in hits):
+        return list(hits)
+
+    vectors = np.asarray([h.embedding for h in hits], dtype=np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_emb, dtype=np.float32)
+    query /= max(float(np.linalg.norm(query)), 1e-12)
+
+    relevance = vectors @ query
+    pairwise = vectors @ vectors.T
+    picked: List[int] = []
+    remaining = list(range(len(hits)))
+    while remaining:
+        if picked:
+            redundancy = pairwise[np.ix_(remaining, picked)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining), dtype=np.float32)
+        scores = mmr_lambda * relevance[remaining] - (1 - mmr_lambda) * redundancy
+        best = remaining[int(np.argmax(scores))]
+        picked.append(best)
+        remaining.remove(best)
+    return [hits[i] for i in picked]
+
+
+def _overlap(left: str, right: str) -> int:
+    """Length of the longest suffix of `left` that is also a prefix of `right`"""
+    for size in range(min(len(left), len(right), MAX_OVERLAP_CHARS), MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _source_key(doc: Document) -> Optional[str]:
+    meta = doc.meta or {}
+    return meta.get("source") or meta.get("title")
+
+
+def _chunk_no(doc: Document) -> Optional[int]:
+    chunk = (doc.meta or {}).get("chunk")
+    return chunk if isinstance(chunk, int) else None
+
+
+def _span(doc: Document) -> Optional[Tuple[int, int]]:
+    """[start, end) character offsets of the chunk in its source, when the ingest stored them"""
+    meta = doc.meta or {}
+    start, end = meta.get("start"), meta.get("end")
+    return (start, end) if isinstance(start, int) and isinstance(end, int) else None
+
+
+def _order_in_source(doc: Document) -> Tuple[int, int]:
+    chunk, span = _chunk_no(doc), _span(doc)
+    return (chunk if chunk is not None else -1, span[0] if span else 0)
+
+
+def merge_passages(docs: List[Document]) -> List[str]:
+    """
+    Merge neighbouring chunks of the same source into one passage with their overlap removed,
+    drop exact duplicates, and keep passages in the order of their best-ranked chunk.
+
+    With stored start/end offsets, chunks are joined only when their spans overlap (the shared part is
+    cut by offset) or they are consecutive chunks of the source. Without offsets, consecutive chunk
+    numbers are joined and the overlap is found by comparing text. Chunks that share no text are
+    separated by a newline.
+    """
+    seen_content = set()
+    groups: Dict[Any, List[Tuple[int, Document]]] = {}
+    order: List[Any] = []
+    for rank, doc in enumerate(docs):
+        if doc.content in seen_content:
+            continue
+        seen_content.add(doc.content)
+        key = _source_key(doc) if _chunk_no(doc) is not None or _span(doc) is not None else None
+        key = key if key is not None else ("__single__", doc.id)
+        if key not in groups:
+            groups[key] = []
+            order.append(key)
+        groups[key].append((rank, doc))
+
+    passages: List[Tuple[int, str]] = []
+    for key in order:
+        members = sorted(groups[key], key=lambda item: _order_in_source(item[1]))
+        run_rank, run_text, run_end, prev_chunk = None, "", None, None
+        for rank, doc in members:
+            chunk, span = _chunk_no(doc), _span(doc)
+            consecutive = chunk is not None and prev_chunk is not None and chunk == prev_chunk + 1
+            if run_rank is not None and span is not None and run_end is not None and span[0] <= run_end:
+                run_text += doc.content[run_end - span[0]:]
+                run_rank, run_end = min(run_rank, rank), max(run_end, span[1])
+            elif run_rank is not None and consecutive:
+                overlap = 0 if span is not None and run_end is not None else _overlap(run_text, doc.content)
+                run_text += doc.content[overlap:] if overlap else "\n" + doc.content
+                run_rank, run_end = min(run_rank, rank), span[1] if span else None
+            else:
+                if run_rank is not None:
+                    passages.append((run_rank, run_text))
+                run_rank, run_text, run_end = rank, doc.content, span[1] if span else None
+            prev_chunk = chunk
+        if run_rank is not None:
+            passages.append((run_rank, run_text))
+
+    return [text for _, text in sorted(passages, key=lambda item: item[0])]
+
+
+def build_context(
+        query_emb: Sequence[float],
+        hits: List[Document],
+        token_budget: int,
+        mmr_lambda: float = 0.7,
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Pick hits in MMR order while the merged, de-overlapped context still fits `token_budget`.
+    Returns the context string and token accounting (naive join vs. built context).
+    """
+    tokens_before = estimate_tokens("\n\n".join(h.content for h in hits))
+
+    ordered = mmr_order(query_emb, hits, mmr_lambda)
+    selected: List[Document] = []
+    passages: List[str] = []
+    for doc in ordered:
+        candidate = merge_passages(selected + [doc])
+        if token_budget > 0 and estimate_tokens("\n\n".join(candidate)) > token_budget:
+            continue
+        selected.append(doc)
+        passages = candidate
+
+    if not selected and ordered:
+        # Even the best chunk alone is over budget: send its head rather than nothing
+        selected = ordered[:1]
+        passages = [ordered[0].content[:token_budget * CHARS_PER_TOKEN]]
+
+    context = "\n\n".join(passages)
+    return context, {
+        "tokens_before": tokens_before,
+        "tokens_after": estimate_tokens(context),
+        "chunks_in": len(hits),
+        "chunks_used": len(selected),
+        "passages": len(passages),
+    }
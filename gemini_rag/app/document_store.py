@@ -0,0 +1,313 @@
+from typing import Any, Dict, List, Optional, Tuple
+from haystack import Document
+from haystack_integrations.document_stores.qdrant import QdrantDocumentStore
+from haystack_integrations.document_stores.qdrant.converters import convert_id
+from haystack_integrations.document_stores.qdrant.filters import convert_filters_to_qdrant
+from qdrant_client.http import models
+
+
+# A meta_filter value may be {operator: value, ...} instead of a plain value to match
+FILTER_OPERATORS = ("==", "!=", ">", ">=", "<", "<=", "in", "not in")
+
+
+def filter_conditions(meta_filter: Dict[str, Any]) -> List[Tuple[str, str, Any]]:
+    """(key, operator, value) for {"title": "a.txt", "chunk": {">=": 5}}; plain values mean ==, all are ANDed"""
+    conditions = []
+    for key, value in meta_filter.items():
+        if isinstance(value, dict) and value and all(op in FILTER_OPERATORS for op in value):
+            conditions += [(key, op, operand) for op, operand in value.items()]
+        else:
+            conditions.append((key, "==", value))
+    return conditions
+
+
+def meta_filters(meta_filter: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """{"title": "a.txt", "chunk": {">=": 5}} -> haystack filter on meta.title / meta.chunk (AND over all keys)"""
+    conditions = [
+        {"field": f"meta.{key}", "operator": op, "value": value} for key, op, value in filter_conditions(meta_filter)
+    ]
+    return {"operator": "AND", "conditions": conditions} if conditions else None
+
+
+_COMPARE = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    ">": lambda a, b: a is not None and a > b,
+    ">=": lambda a, b: a is not None and a >= b,
+    "<": lambda a, b: a is not None and a < b,
+    "<=": lambda a, b: a is not None and a <= b,
+    "in": lambda a, b: a in b,
+    "not in": lambda a, b: a not in b,
+}
+
+
+def meta_matches(meta: Dict[str, Any], meta_filter: Dict[str, Any]) -> bool:
+    """Whether a document's meta passes meta_filter, for stores that filter in Python"""
+    for key, op, value in filter_conditions(meta_filter):
+        try:
+            if not _COMPARE[op](meta.get(key), value):
+                return False
+        except TypeError:  # e.g. comparing a string field with a number
+            return False
+    return True
+
+
+class KBQdrantDocumentStore(QdrantDocumentStore):
+    """
+    QdrantDocumentStore with filter-based count/delete executed inside Qdrant,
+    so removing a whole source never pulls its payloads or vectors into Python.
+
+    `search_params` (e.g. quantization oversampling/rescore) are applied to every dense query.
+    `query_by_embeddings` runs many dense queries in one query_batch_points round trip.
+    `get_meta_by_id` reads stored meta without transferring vectors or content.
+    `query_point_ids` / `query_among` are the two stages of Matryoshka search over a prefix sidecar:
+    candidate point ids from one collection, then an exact search restricted to them in another.
+    """
+
+    def __init__(self, *args, search_params: Optional[models.SearchParams] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.search_params = search_params
+
+    def _query_by_embedding(
+            self,
+            query_embedding: List[float],
+            filters=None,
+            top_k: int = 10,
+            scale_score: bool = False,
+            return_embedding: bool = False,
+            score_threshold: Optional[float] = None,
+            group_by: Optional[str] = None,
+            group_size: Optional[int] = None,
+    ) -> List[Document]:
+        if self.search_params is None or group_by:
+            return super()._query_by_embedding(
+                query_embedding, filters, top_k, scale_score, return_embedding, score_threshold, group_by, group_size
+            )
+        self._initialize_client()
+        points = self._client.query_points(
+            collection_name=self.index,
+            query=query_embedding,
+            query_filter=convert_filters_to_qdrant(filters),
+            limit=top_k,
+            with_vectors=return_embedding,
+            score_threshold=score_threshold,
+            search_params=self.search_params,
+        ).points
+        return self._process_query_point_results(points, scale_score=scale_score)
+
+    async def _query_by_embedding_async(
+            self,
+            query_embedding: List[float],
+            filters=None,
+            top_k: int = 10,
+            scale_score: bool = False,
+            return_embedding: bool = False,
+            score_threshold: Optional[float] = None,
+            group_by: Optional[str] = None,
+            group_size: Optional[int] = None,
+    ) -> List[Document]:
+        if self.search_params is None or group_by:
+            return await super()._query_by_embedding_async(
+                query_embedding, filters, top_k, scale_score, return_embedding, score_threshold, group_by, group_size
+            )
+        await self._initialize_async_client()
+        response = await self._async_client.query_points(
+            collection_name=self.index,
+            query=query_embedding,
+            query_filter=convert_filters_to_qdrant(filters),
+            limit=top_k,
+            with_vectors=return_embedding,
+            score_threshold=score_threshold,
+            search_params=self.search_params,
+        )
+        return self._process_query_point_results(response.points, scale_score=scale_score)
+
+    def _batch_requests(self, query_embeddings: List[List[float]], top_k: int, return_embedding: bool) -> List[models.QueryRequest]:
+        return [
+            models.QueryRequest(
+                query=embedding,
+                limit=top_k,
+                params=self.search_params,
+                with_vector=return_embedding,
+                with_payload=True,
+            )
+            for embedding in query_embeddings
+        ]
+
+    def query_by_embeddings(
+            self,
+            query_embeddings: List[List[float]],
+            top_k: int = 10,
+            return_embedding: bool = False,
+    ) -> List[List[Document]]:
+        if not query_embeddings:
+            return []
+        self._initialize_client()
+        responses = self._client.query_batch_points(
+            collection_name=self.index,
+            requests=self._batch_requests(query_embeddings, top_k, return_embedding),
+        )
+        return [self._process_query_point_results(r.points) for r in responses]
+
+    async def query_by_embeddings_async(
+            self,
+            query_embeddings: List[List[float]],
+            top_k: int = 10,
+            return_embedding: bool = False,
+    ) -> List[List[Document]]:
+        if not query_embeddings:
+            return []
+        await self._initialize_async_client()
+        responses = await self._async_client.query_batch_points(
+            collection_name=self.index,
+            requests=self._batch_requests(query_embeddings, top_k, return_embedding),
+        )
+        return [self._process_query_point_results(r.points) for r in responses]
+
+    @staticmethod
+    def _id_requests(query_embeddings: List[List[float]], limit: int) -> List[models.QueryRequest]:
+        return [
+            models.QueryRequest(query=embedding, limit=limit, with_payload=False, with_vector=False)
+            for embedding in query_embeddings
+        ]
+
+    def query_point_ids(self, query_embeddings: List[List[float]], limit: int) -> List[List[models.ExtendedPointId]]:
+        """Point ids of the `limit` nearest points per query, nothing else transferred"""
+        if not query_embeddings:
+            return []
+        self._initialize_client()
+        responses = self._client.query_batch_points(
+            collection_name=self.index, requests=self._id_requests(query_embeddings, limit)
+        )
+        return [[p.id for p in r.points] for r in responses]
+
+    async def query_point_ids_async(self, query_embeddings: List[List[float]], limit: int) -> List[List[models.ExtendedPointId]]:
+        if not query_embeddings:
+            return []
+        await self._initialize_async_client()
+        responses = await self._async_client.query_batch_points(
+            collection_name=self.index, requests=self._id_requests(query_embeddings, limit)
+        )
+        return [[p.id for p in r.points] for r in responses]
+
+    @staticmethod
+    def _among_requests(
+            query_embeddings: List[List[float]],
+            point_ids: List[List[models.ExtendedPointId]],
+            top_k: int,
+            return_embedding: bool,
+    ) -> List[models.QueryRequest]:
+        # Exact full-precision scoring of the candidates, inside Qdrant
+        params = models.SearchParams(exact=True, quantization=models.QuantizationSearchParams(ignore=True))
+        return [
+            models.QueryRequest(
+                query=embedding,
+                filter=models.Filter(must=[models.HasIdCondition(has_id=ids)]),
+                limit=top_k,
+                params=params,
+                with_vector=return_embedding,
+                with_payload=True,
+            )
+            for embedding, ids in zip(query_embeddings, point_ids)
+        ]
+
+    def query_among(
+            self,
+            query_embeddings: List[List[float]],
+            point_ids: List[List[models.ExtendedPointId]],
+            top_k: int = 10,
+            return_embedding: bool = False,
+    ) -> List[List[Document]]:
+        """Per query, the top_k of its candidate `point_ids` by exact similarity"""
+        requests = self._among_requests(query_embeddings, point_ids, top_k, return_embedding)
+        if not requests:
+            return []
+        self._initialize_client()
+        responses = self._client.query_batch_points(collection_name=self.index, requests=requests)
+        return [self._process_query_point_results(r.points) for r in responses]
+
+    async def query_among_async(
+            self,
+            query_embeddings: List[List[float]],
+            point_ids: List[List[models.ExtendedPointId]],
+            top_k: int = 10,
+            return_embedding: bool = False,
+    ) -> List[List[Document]]:
+        requests = self._among_requests(query_embeddings, point_ids, top_k, return_embedding)
+        if not requests:
+            return []
+        await self._initialize_async_client()
+        responses = await self._async_client.query_batch_points(collection_name=self.index, requests=requests)
+        return [self._process_query_point_results(r.points) for r in responses]
+
+    @staticmethod
+    def _meta_of(records) -> Dict[str, Dict[str, Any]]:
+        return {r.payload["id"]: r.payload.get("meta") or {} for r in records if r.payload and "id" in r.payload}
+
+    def get_meta_by_id(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """{id: meta} of the stored documents among `ids` (payload fields "id" and "meta" only, no vectors)"""
+        if not ids:
+            return {}
+        self._initialize_client()
+        records = self._client.retrieve(
+            collection_name=self.index,
+            ids=[convert_id(i) for i in ids],
+            with_payload=["id", "meta"],
+            with_vectors=False,
+        )
+        return self._meta_of(records)
+
+    async def get_meta_by_id_async(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        if not ids:
+            return {}
+        await self._initialize_async_client()
+        records = await self._async_client.retrieve(
+            collection_name=self.index,
+            ids=[convert_id(i) for i in ids],
+            with_payload=["id", "meta"],
+            with_vectors=False,
+        )
+        return self._meta_of(records)
+
+    @staticmethod
+    def _qdrant_filter(meta_filter: Dict[str, Any]) -> models.Filter:
+        # An empty meta_filter matches every point, same as filter_documents(filters=None)
+        return convert_filters_to_qdrant(meta_filters(meta_filter)) or models.Filter()
+
+    def count_by_meta(self, meta_filter: Dict[str, Any]) -> int:
+        self._initialize_client()
+        return self._client.count(
+            collection_name=self.index,
+            count_filter=self._qdrant_filter(meta_filter),
+            exact=True,
+        ).count
+
+    async def count_by_meta_async(self, meta_filter: Dict[str, Any]) -> int:
+        await self._initialize_async_client()
+        result = await self._async_client.count(
+            collection_name=self.index,
+            count_filter=self._qdrant_filter(meta_filter),
+            exact=True,
+        )
+        return result.count
+
+    def delete_by_meta(self, meta_filter: Dict[str, Any]) -> int:
+        """Delete every point matching meta_filter, returns how many matched"""
+        matched = self.count_by_meta(meta_filter)
+        if matched:
+            self._client.delete(
+                collection_name=self.index,
+                points_selector=models.FilterSelector(filter=self._qdrant_filter(meta_filter)),
+                wait=self.wait_result_from_api,
+            )
+        return matched
+
+    async def delete_by_meta_async(self, meta_filter: Dict[str, Any]) -> int:
+        matched = await self.count_by_meta_async(meta_filter)
+        if matched:
+            await self._async_client.delete(
+                collection_name=self.index,
+                points_selector=models.FilterSelector(filter=self._qdrant_filter(meta_filter)),
+                wait=self.wait_result_from_api,
+            )
+        return matched
@@ -1,36 +1,264 @@
-from typing import List
+from typing import Any, Dict, List, Optional
+import asyncio
 import os
+import random
+import threading
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import requests
+from requests.adapters import HTTPAdapter
+from .cache import normalize_query
+from .metrics import metrics
 
 BGE_EMBED_URL = os.environ.get("BGE_EMBED_URL", "https://api.example.com/bge/embed")
 BGE_API_KEY = os.environ.get("BGE_API_KEY", "")
-BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", "16"))
+BGE_MODEL = os.environ.get("BGE_MODEL", "bge-m3")
+BGE_EMBED_DIM = int(os.environ.get("BGE_EMBED_DIM", "1024"))
+BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", "16"))  # starting batch size, adapted at runtime
+MIN_BATCH_SIZE = int(os.environ.get("EMBED_MIN_BATCH_SIZE", "1"))
+MAX_BATCH_SIZE = int(os.environ.get("EMBED_MAX_BATCH_SIZE", "128"))
+TARGET_BATCH_LATENCY = float(os.environ.get("EMBED_TARGET_LATENCY", "1.0"))  # seconds per batch request
+CONCURRENCY = int(os.environ.get("BGE_CONCURRENCY", "4"))  # batches in flight
+POOL_SIZE = int(os.environ.get("BGE_POOL_SIZE", "8"))  # keep-alive connections
 TIMEOUT = int(os.environ.get("EMBED_TIMEOUT", "30"))
 RETRIES = int(os.environ.get("EMBED_RETRIES", "3"))
 RETRY_BACKOFF = float(os.environ.get("EMBED_RETRY_BACKOFF", "0.8"))
 
-headers = {"Authorization": f"Bearer {BGE_API_KEY}", "Content-Type": "application/json"}
+# Worth retrying: throttling and server-side failures. Other 4xx are our fault and fail fast.
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
 
-def _call_embed_api(texts: List[str]) -> List[List[float]]:
-    payload = {"inputs": texts}
-    for attempt in range(1, RETRIES + 1):
+
+class PayloadTooLarge(Exception):
+    pass
+
+
+class AdaptiveBatchSize:
+    """
+    Batch size steered by observed request latency: grows while batches come back well under
+    `target_latency`, shrinks when they take too long, and halves (and caps itself) on 413.
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int, target_latency: float):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.target_latency = target_latency
+        self.value = min(max(initial, self.minimum), self.maximum)
+        self._lock = threading.Lock()
+
+    def observe(self, batch_len: int, latency: float):
+        with self._lock:
+            if batch_len < self.value:
+                return  # tail batches say nothing about the current size
+            if latency > self.target_latency * 1.5:
+                self.value = max(self.minimum, self.value // 2)
+            elif latency < self.target_latency * 0.5:
+                self.value = min(self.maximum, self.value + max(1, self.value // 4))
+
+    def too_large(self, batch_len: int):
+        with self._lock:
+            self.maximum = max(self.minimum, batch_len // 2)
+            self.value = min(self.value, self.maximum)
+
+
+class BGEEmbeddingClient:
+    """
+    HTTP client for the BGE embedding endpoint: one keep-alive session with a connection pool,
+    up to `concurrency` batches in flight across all callers (one shared worker pool, and a semaphore
+    around each request), jittered retries, and adaptive batch sizing.
+    Response shape: {"embeddings": [[float, ...], ...]} for {"inputs": [str, ...]}.
+    """
+
+    def __init__(
+            self,
+            url: str = BGE_EMBED_URL,
+            api_key: str = BGE_API_KEY,
+            batch_size: int = BATCH_SIZE,
+            min_batch_size: int = MIN_BATCH_SIZE,
+            max_batch_size: int = MAX_BATCH_SIZE,
+            target_latency: float = TARGET_BATCH_LATENCY,
+            concurrency: int = CONCURRENCY,
+            pool_size: int = POOL_SIZE,
+            timeout: float = TIMEOUT,
+            retries: int = RETRIES,
+            retry_backoff: float = RETRY_BACKOFF,
+    ):
+        self.url = url
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.concurrency = max(1, concurrency)
+        self.batch_size = AdaptiveBatchSize(batch_size, min_batch_size, max_batch_size, target_latency)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(pool_size, self.concurrency), max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"})
+        self._pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="bge-embed")
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+        self.requests_sent = 0
+        self.retried = 0
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+
+    def _post(self, texts: List[str]) -> List[List[float]]:
+        with self._slots:
+            self.requests_sent += 1
+            metrics.call("bge_embed")
+            resp = self.session.post(self.url, json={"inputs": texts}, timeout=self.timeout)
+        if resp.status_code == 413:
+            raise PayloadTooLarge(f"{len(texts)} texts rejected as too large")
+        resp.raise_for_status()
+        embeddings = resp.json()["embeddings"]
+        if len(embeddings) != len(texts):
+            raise ValueError(f"Expected {len(texts)} embeddings, got {len(embeddings)}")
+        return embeddings
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        for attempt in range(1, self.retries + 1):
+            started = time.perf_counter()
+            try:
+                embeddings = self._post(texts)
+                self.batch_size.observe(len(texts), time.perf_counter() - started)
+                return embeddings
+            except PayloadTooLarge:
+                if len(texts) == 1:
+                    raise
+                self.batch_size.too_large(len(texts))
+                half = len(texts) // 2
+                return self._embed_batch(texts[:half]) + self._embed_batch(texts[half:])
+            except Exception as e:
+                status = getattr(getattr(e, "response", None), "status_code", None)
+                if attempt == self.retries or (status is not None and status not in RETRYABLE_STATUS):
+                    metrics.failure("bge_embed")
+                    raise
+                metrics.retry("bge_embed")
+                delay = self.retry_backoff * attempt * random.uniform(0.5, 1.5)
+                print(f"BGE embed batch of {len(texts)} failed (attempt {attempt}): {e} → retrying in {delay:.2f}s...")
+                self.retried += 1
+                time.sleep(delay)
+        raise RuntimeError("Unreachable")
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts in order. Batches are cut at the current adaptive size when they are dispatched."""
+        if not texts:
+            return []
+        if len(texts) <= self.batch_size.value:
+            return self._embed_batch(texts)
+
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        in_flight = {}
+        offset = 0
         try:
-            resp = requests.post(BGE_EMBED_URL, json=payload, headers=headers, timeout=TIMEOUT)
-            resp.raise_for_status()
-            data = resp.json()
-            # adapt to your provider response shape; assume data["embeddings"] is list[list[float]]
-            return data["embeddings"]
-        except Exception as e:
-            if attempt == RETRIES:
-                raise
-            time.sleep(RETRY_BACKOFF * attempt)
-    raise RuntimeError("Unreachable")
+            while offset < len(texts) or in_flight:
+                while offset < len(texts) and len(in_flight) < self.concurrency:
+                    end = min(len(texts), offset + self.batch_size.value)
+                    in_flight[self._pool.submit(self._embed_batch, texts[offset:end])] = offset
+                    offset = end
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    start = in_flight.pop(future)
+                    embeddings = future.result()
+                    results[start:start + len(embeddings)] = embeddings
+        finally:
+            for future in in_flight:
+                future.cancel()
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batch_size": self.batch_size.value,
+            "max_batch_size": self.batch_size.maximum,
+            "requests": self.requests_sent,
+            "retries": self.retried,
+        }
+
+
+_default_client: Optional[BGEEmbeddingClient] = None
+
 
 def bge_m3_embed(texts: List[str]) -> List[List[float]]:
-    all_embs = []
-    for i in range(0, len(texts), BATCH_SIZE):
-        batch = texts[i : i + BATCH_SIZE]
-        embs = _call_embed_api(batch)
-        all_embs.extend(embs)
-    return all_embs
\ No newline at end of file
+    global _default_client
+    if _default_client is None:
+        _default_client = BGEEmbeddingClient()
+    return _default_client.embed(texts)
+
+
+# ================== RAGService EMBEDDERS ==================
+class BGETextEmbedder:
+    """Query embedder with the same interface as GeminiTextEmbedder"""
+    task_type = "query"
+
+    def __init__(self, client: BGEEmbeddingClient, model: str = BGE_MODEL, dim: int = BGE_EMBED_DIM, cache=None):
+        self.client = client
+        self.model = model
+        self.dim = dim
+        self.cache = cache
+
+    def _cache_key(self, text: str):
+        return (normalize_query(text), self.model, self.dim, self.task_type)
+
+    def run(self, text: str) -> Dict[str, Any]:
+        key = self._cache_key(text)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return {"embedding": list(cached)}
+        emb = self.client.embed([text])[0]
+        if self.cache is not None:
+            self.cache.put(key, tuple(emb))
+        return {"embedding": emb}
+
+    async def run_async(self, text: str) -> Dict[str, Any]:
+        return await asyncio.to_thread(self.run, text)
+
+    def run_batch(self, texts: List[str]) -> Dict[str, Any]:
+        """Same contract as GeminiTextEmbedder.run_batch_async; the client does the batching and concurrency"""
+        embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        missing = []
+        for i, text in enumerate(texts):
+            cached = self.cache.get(self._cache_key(text)) if self.cache is not None else None
+            if cached is None:
+                missing.append(i)
+            else:
+                embeddings[i] = list(cached)
+        if not missing:
+            return {"embeddings": embeddings, "errors": {}}
+        try:
+            vectors = self.client.embed([texts[i] for i in missing])
+        except Exception as e:
+            return {"embeddings": embeddings, "errors": {i: f"Embedding failed: {e}" for i in missing}}
+        for i, emb in zip(missing, vectors):
+            embeddings[i] = emb
+            if self.cache is not None:
+                self.cache.put(self._cache_key(texts[i]), tuple(emb))
+        return {"embeddings": embeddings, "errors": {}}
+
+    async def run_batch_async(self, texts: List[str]) -> Dict[str, Any]:
+        return await asyncio.to_thread(self.run_batch, texts)
+
+    def warm_up(self):
+        self.run("warmup query")
+
+
+class BGEDocumentEmbedder:
+    """Document embedder with the same interface as GeminiDocumentEmbedder"""
+    task_type = "document"
+
+    def __init__(self, client: BGEEmbeddingClient, model: str = BGE_MODEL, dim: int = BGE_EMBED_DIM):
+        self.client = client
+        self.model = model
+        self.dim = dim
+
+    def run(self, documents: List[Any]) -> Dict[str, List[Any]]:
+        embeddings = self.client.embed([doc.content for doc in documents])
+        for doc, emb in zip(documents, embeddings):
+            doc.embedding = emb
+        return {"documents": documents}
+
+    async def run_async(self, documents: List[Any]) -> Dict[str, List[Any]]:
+        return await asyncio.to_thread(self.run, documents)
+
+    def warm_up(self):
+        self.client.embed(["warmup document"])
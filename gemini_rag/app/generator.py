@@ -1,67 +1,303 @@
 import os
 import time
+import asyncio
 import google.generativeai as genai
-from typing import Optional
+from typing import Any, AsyncIterator, Dict, List, Optional
+from .metrics import metrics
+from .tokens import estimate_tokens
 
 # ================== CONFIG ==================
-GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    raise ValueError("❌ GEMINI_API_KEY environment variable is required")
-
 GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "gemini-2.5-flash")  # gemini-2.5-flash-lite or gemini-2.5-flash
 
 RETRIES = int(os.environ.get("GEN_RETRIES", "5"))
 RETRY_BACKOFF = float(os.environ.get("GEN_RETRY_BACKOFF", "2.0"))
-TIMEOUT_SECONDS = int(os.environ.get("GEN_TIMEOUT", "120"))
+TIMEOUT_SECONDS = int(os.environ.get("GEN_TIMEOUT", "120"))  # per attempt, never more than what is left of the budget
 
-genai.configure(api_key=GEMINI_API_KEY)
+# Latency budget for the whole generation (all attempts + backoff), e.g. 30; 0 = unbounded (default)
+LATENCY_BUDGET = float(os.environ.get("GEN_LATENCY_BUDGET", "0"))
+# Cheaper/faster models tried in order once the previous one failed or ran out of its share of the budget,
+# e.g. "gemini-2.5-flash-lite"; empty (default) = GEMINI_MODEL only
+FALLBACK_MODELS = [m.strip() for m in os.environ.get("GEN_FALLBACK_MODELS", "").split(",") if m.strip()]
+# Seconds kept back from each non-last model for the ones after it
+FALLBACK_RESERVE = float(os.environ.get("GEN_FALLBACK_RESERVE", "8"))
+# Async only: if the primary has not answered after this many seconds, also ask the fallback and take the first answer; 0 = off
+HEDGE_AFTER = float(os.environ.get("GEN_HEDGE_AFTER", "0"))
 
-def generate_answer(
-        prompt: str,
-        max_tokens: int = 1024,
-        temperature: float = 0.1,
-) -> str:
-    model = genai.GenerativeModel(GEMINI_MODEL)
+_configured = False
+
+def _configure():
+    """Configure genai on first use, so importing this module never fails on a missing key"""
+    global _configured
+    if not _configured:
+        api_key = os.environ.get("GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError("❌ GEMINI_API_KEY environment variable is required")
+        genai.configure(api_key=api_key)
+        _configured = True
+
+_models: Dict[str, genai.GenerativeModel] = {}
+
+def _model(name: str) -> genai.GenerativeModel:
+    """One GenerativeModel per model name for the life of the process"""
+    model = _models.get(name)
+    if model is None:
+        _configure()
+        model = _models[name] = genai.GenerativeModel(name)
+    return model
+
+def _cascade() -> List[str]:
+    return [GEMINI_MODEL] + [m for m in FALLBACK_MODELS if m != GEMINI_MODEL]
 
-    generation_config = genai.GenerationConfig(
+class _Budget:
+    def __init__(self, seconds: Optional[float]):
+        self.deadline = time.monotonic() + seconds if seconds else None
+
+    def remaining(self) -> float:
+        return float("inf") if self.deadline is None else self.deadline - time.monotonic()
+
+def _attempt(model_name: str, started: float, error: Optional[BaseException] = None, cancelled: bool = False) -> Dict[str, Any]:
+    metrics.call(f"gemini:{model_name}")
+    record = {"model": model_name, "ms": round((time.perf_counter() - started) * 1000, 1), "ok": error is None and not cancelled}
+    if cancelled:
+        record["cancelled"] = True
+    elif error is not None:
+        record["error"] = str(error)[:200] or type(error).__name__
+    return record
+
+def _reserve(budget: _Budget, position: int, models: List[str]) -> float:
+    """Time a model must leave for the rest of the cascade: FALLBACK_RESERVE, but never more than half of what is left"""
+    if position == len(models) - 1:
+        return 0.0
+    return min(FALLBACK_RESERVE, budget.remaining() / 2)
+
+def _attempt_timeout(budget: _Budget, reserve: float) -> float:
+    return min(TIMEOUT_SECONDS, budget.remaining() - reserve)
+
+def _failure(attempts: List[Dict[str, Any]], last_error: Optional[BaseException]) -> RuntimeError:
+    if last_error is None:
+        error = RuntimeError("Gemini generation skipped: latency budget exhausted")
+    else:
+        error = RuntimeError(f"Gemini generation failed after {len(attempts)} attempts: {str(last_error)}")
+    error.attempts = attempts  # per-attempt timings, for the caller's response
+    return error
+
+def _record_tokens(prompt: str, text: str, response=None):
+    """Token counts from Gemini's usage metadata when present, estimated otherwise"""
+    usage = getattr(response, "usage_metadata", None)
+    metrics.tokens("prompt", getattr(usage, "prompt_token_count", 0) or estimate_tokens(prompt))
+    metrics.tokens("response", getattr(usage, "candidates_token_count", 0) or estimate_tokens(text))
+
+def _generation_config(max_tokens: int, temperature: float) -> genai.GenerationConfig:
+    return genai.GenerationConfig(
         temperature=temperature,
         max_output_tokens=max_tokens,
         top_p=0.95,
     )
 
+def _candidate_text(response) -> str:
+    # === SAFE TEXT EXTRACTION (fixes empty response crash) ===
+    text_parts = []
+    for candidate in response.candidates:
+        if candidate.content and candidate.content.parts:
+            for part in candidate.content.parts:
+                if part.text:
+                    text_parts.append(part.text)
+    return "".join(text_parts)
+
+def _extract_text(response) -> str:
+    # Safety block handling
+    if response.candidates is None or len(response.candidates) == 0:
+        raise ValueError("Gemini blocked the response (safety/filter)")
+
+    text = _candidate_text(response).strip()
+
+    # If still empty (very cautious model), return fallback
+    if not text:
+        return "No answer generated by the model."
+
+    return text
+
+async def _agenerate_with(
+        model_name: str,
+        prompt: str,
+        generation_config,
+        budget: _Budget,
+        reserve: float,
+        attempts: List[Dict[str, Any]],
+) -> str:
+    """Retries of one model within its share of the budget; raises the last error when it gives up"""
+    last_error = None
     for attempt in range(1, RETRIES + 1):
+        timeout = _attempt_timeout(budget, reserve)
+        if timeout <= 0:
+            break
+        started = time.perf_counter()
         try:
-            response = model.generate_content(
-                prompt,
-                generation_config=generation_config,
-                request_options={"timeout": TIMEOUT_SECONDS},
+            response = await asyncio.wait_for(
+                _model(model_name).generate_content_async(
+                    prompt,
+                    generation_config=generation_config,
+                    request_options={"timeout": timeout},
+                ),
+                timeout=timeout,
             )
+            text = _extract_text(response)
+            attempts.append(_attempt(model_name, started))
+            _record_tokens(prompt, text, response)
+            return text
+
+        except asyncio.CancelledError:
+            attempts.append(_attempt(model_name, started, cancelled=True))
+            raise
+        except Exception as e:
+            attempts.append(_attempt(model_name, started, e))
+            last_error = e
+            delay = RETRY_BACKOFF * attempt
+            if attempt == RETRIES or budget.remaining() - reserve <= delay:
+                break
+            metrics.retry(f"gemini:{model_name}")
+            print(f"Gemini {model_name} attempt {attempt} failed: {e} → retrying in {delay}s...")
+            await asyncio.sleep(delay)
+    if last_error is not None:
+        metrics.failure(f"gemini:{model_name}")
+    raise _failure(attempts, last_error)
+
+async def _acascade(models: List[str], prompt: str, generation_config, budget: _Budget, attempts) -> Dict[str, Any]:
+    last_error = None
+    for position, model_name in enumerate(models):
+        reserve = _reserve(budget, position, models)
+        try:
+            text = await _agenerate_with(model_name, prompt, generation_config, budget, reserve, attempts)
+            return {"text": text, "model": model_name, "attempts": attempts}
+        except RuntimeError as e:
+            last_error = e
+    raise last_error or _failure(attempts, None)
 
-            # Safety block handling
-            if response.candidates is None or len(response.candidates) == 0:
-                raise ValueError("Gemini blocked the response (safety/filter)")
+async def agenerate(
+        prompt: str,
+        max_tokens: int = 1024,
+        temperature: float = 0.1,
+        budget_seconds: Optional[float] = None,
+        hedge_after: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    Generate within a latency budget, walking the model cascade (GEMINI_MODEL, then GEN_FALLBACK_MODELS).
+    Each non-last model may retry only while FALLBACK_RESERVE seconds remain for the next one.
+    With hedging, the fallback cascade is started alongside the primary once it has been running for
+    `hedge_after` seconds (or as soon as it fails); the first answer wins and the other is cancelled.
+    Returns {"text", "model", "attempts": [{"model", "ms", "ok", "error"?}], "hedged"?}.
+    """
+    generation_config = _generation_config(max_tokens, temperature)
+    budget = _Budget(LATENCY_BUDGET if budget_seconds is None else budget_seconds)
+    hedge_after = HEDGE_AFTER if hedge_after is None else hedge_after
+    attempts: List[Dict[str, Any]] = []
+    models = _cascade()
+    if hedge_after <= 0 or len(models) < 2:
+        return await _acascade(models, prompt, generation_config, budget, attempts)
 
-            # === SAFE TEXT EXTRACTION (fixes empty response crash) ===
-            text_parts = []
-            for candidate in response.candidates:
-                if candidate.content and candidate.content.parts:
-                    for part in candidate.content.parts:
-                        if part.text:
-                            text_parts.append(part.text)
+    primary = asyncio.ensure_future(_acascade(models[:1], prompt, generation_config, budget, attempts))
+    await asyncio.wait({primary}, timeout=hedge_after)
+    if primary.done() and primary.exception() is None:
+        return primary.result()
 
-            text = "".join(text_parts).strip()
+    hedge = asyncio.ensure_future(_acascade(models[1:], prompt, generation_config, budget, attempts))
+    pending = {hedge} if primary.done() else {primary, hedge}
+    errors = [primary.exception()] if primary.done() else []
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    result = task.result()
+                    return {**result, "hedged": True}
+                errors.append(task.exception())
+    finally:
+        for task in pending:
+            task.cancel()
+    raise errors[-1]
 
-            # If still empty (very cautious model), return fallback
-            if not text:
-                return "No answer generated by the model."
+async def generate_answer_stream_async(
+        prompt: str,
+        max_tokens: int = 1024,
+        temperature: float = 0.1,
+        budget_seconds: Optional[float] = None,
+        info: Optional[Dict[str, Any]] = None,
+) -> AsyncIterator[str]:
+    """
+    Yields answer text as Gemini streams it. Retries and model fallback only happen before the first chunk
+    has been yielded - once text reached the caller a failure is raised as-is. Each attempt's timeout (at most
+    what is left of the budget) covers the call and the wait for the first chunk of text, not the rest. `info`, if given, receives the answering "model" and the "attempts".
+    """
+    generation_config = _generation_config(max_tokens, temperature)
+    budget = _Budget(LATENCY_BUDGET if budget_seconds is None else budget_seconds)
+    attempts: List[Dict[str, Any]] = []
+    if info is not None:
+        info["attempts"] = attempts
+    last_error = None
+    models = _cascade()
 
-            return text
+    for position, model_name in enumerate(models):
+        reserve = _reserve(budget, position, models)
+        failed = False
+        for attempt in range(1, RETRIES + 1):
+            timeout = _attempt_timeout(budget, reserve)
+            if timeout <= 0:
+                break
+            emitted = False
+            streamed: List[str] = []
+            started = time.perf_counter()
+            deadline = time.monotonic() + timeout  # for the call and every chunk up to the first text
+            try:
+                response = await asyncio.wait_for(
+                    _model(model_name).generate_content_async(
+                        prompt,
+                        generation_config=generation_config,
+                        request_options={"timeout": timeout},
+                        stream=True,
+                    ),
+                    timeout=timeout,
+                )
+                chunks = response.__aiter__()
+                while True:
+                    try:
+                        if emitted:
+                            chunk = await chunks.__anext__()
+                        else:
+                            chunk = await asyncio.wait_for(chunks.__anext__(), timeout=deadline - time.monotonic())
+                    except StopAsyncIteration:
+                        break
+                    if not chunk.candidates:
+                        continue
+                    text = _candidate_text(chunk)
+                    if text:
+                        if not emitted and info is not None:
+                            info["model"] = model_name
+                        emitted = True
+                        streamed.append(text)
+                        yield text
 
-        except Exception as e:
-            if attempt == RETRIES:
-                raise RuntimeError(f"Gemini generation failed after {RETRIES} attempts: {str(e)}") from e
+                if not emitted:
+                    if info is not None:
+                        info["model"] = model_name
+                    yield "No answer generated by the model."
+                attempts.append(_attempt(model_name, started))
+                _record_tokens(prompt, "".join(streamed))
+                return
 
-            print(f"Gemini attempt {attempt} failed: {e} → retrying in {RETRY_BACKOFF * attempt}s...")
-            time.sleep(RETRY_BACKOFF * attempt)
+            except Exception as e:
+                attempts.append(_attempt(model_name, started, e))
+                if emitted:
+                    metrics.failure(f"gemini:{model_name}")
+                    raise
+                last_error = e
+                failed = True
+                delay = RETRY_BACKOFF * attempt
+                if attempt == RETRIES or budget.remaining() - reserve <= delay:
+                    break
+                metrics.retry(f"gemini:{model_name}")
+                print(f"Gemini {model_name} attempt {attempt} failed: {e} → retrying in {delay}s...")
+                await asyncio.sleep(delay)
+        if failed:
+            metrics.failure(f"gemini:{model_name}")
 
-    raise RuntimeError("Unreachable")
+    raise _failure(attempts, last_error)
@@ -1,60 +1,389 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
 import requests
+from requests.adapters import HTTPAdapter
 from pathlib import Path
 
+from shared.chunking import get_chunker
+
 API_URL = "http://127.0.0.1:8000/ingest"
 DELETE_URL = "http://127.0.0.1:8000/delete"  # Assume you've added this endpoint to your backend
+JOBS_URL = "http://127.0.0.1:8000/jobs"
+STREAM_URL = "http://127.0.0.1:8000/ingest/stream"
+INGEST_TIMEOUT = 300  # seconds per /ingest batch
+DELETE_TIMEOUT = 120
+
+# 1000-char chunks with 200 overlap, cut at paragraph / line / sentence / word boundaries
+CHUNKER = get_chunker(1000, 200)
 
 def chunk_text(text: str, max_chars: int = 1000) -> list[str]:
-    """Simple chunking by ~1000 chars with overlap"""
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = start + max_chars
-        chunk = text[start:end]
-        chunks.append(chunk)
-        start = end - 200  # 200 char overlap
-    return chunks
+    """Chunk texts of ~max_chars with 200 char overlap"""
+    return get_chunker(max_chars, 200).split(text)
 
 def delete_documents(meta_filter: dict):
     """Delete existing documents matching the meta filter"""
     body = {"meta_filter": meta_filter}  # Wrap in expected structure
-    resp = requests.delete(DELETE_URL, json=body)
+    resp = requests.delete(DELETE_URL, json=body, timeout=DELETE_TIMEOUT)
     print(f"Delete response: {resp.json()}")
 
-def ingest_folder(folder_path: str, replace_existing: bool = False):
+def submit_background(batch: list) -> str:
+    """Enqueue a batch as a background ingest job; waits out 429 (queue full) as the server asks"""
+    while True:
+        resp = requests.post(API_URL, params={"background": "true"}, json=batch)
+        if resp.status_code == 429:
+            wait = int(resp.headers.get("Retry-After", "5"))
+            print(f"Ingest queue full, retrying in {wait}s...")
+            time.sleep(wait)
+            continue
+        resp.raise_for_status()
+        return resp.json()["job_id"]
+
+def wait_for_jobs(job_ids: list, poll_seconds: float = 2.0):
+    pending = list(job_ids)
+    while pending:
+        time.sleep(poll_seconds)
+        for job_id in list(pending):
+            job = requests.get(f"{JOBS_URL}/{job_id}").json()
+            if job["status"] in ("done", "failed"):
+                pending.remove(job_id)
+                print(f"Job {job_id[:8]} {job['status']}: {job['written']} written, {job['skipped']} unchanged, "
+                      f"{job['failed']} failed ({job['docs_per_s']} docs/s)")
+                for failure in job["failures"]:
+                    print(f"  ❌ {failure['title']} #{failure['chunk']}: {failure['error']}")
+            else:
+                print(f"Job {job_id[:8]}: {job['processed']}/{job['total']}")
+
+def ndjson_body(docs, compression: str = "gzip", chunk_bytes: int = 256 * 1024):
+    """Compressed NDJSON body chunks for a chunked upload; documents are encoded as they are consumed"""
+    if compression == "gzip":
+        compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    elif compression == "zstd":
+        import zstandard
+        compressor = zstandard.ZstdCompressor().compressobj()
+    elif compression == "none":
+        compressor = None
+    else:
+        raise ValueError(f"Unknown compression: {compression} (expected gzip, zstd or none)")
+
+    buffer = bytearray()
+    for doc in docs:
+        line = (json.dumps(doc, ensure_ascii=False) + "\n").encode("utf-8")
+        buffer += compressor.compress(line) if compressor else line
+        if len(buffer) >= chunk_bytes:
+            yield bytes(buffer)
+            buffer.clear()
+    if compressor:
+        buffer += compressor.flush()
+    if buffer:
+        yield bytes(buffer)
+
+def ingest_stream(docs, compression: str = "gzip"):
+    """Upload documents (any iterable, e.g. a generator) to /ingest/stream in one streamed request"""
+    headers = {"Content-Type": "application/x-ndjson"}
+    if compression != "none":
+        headers["Content-Encoding"] = compression
+    resp = requests.post(STREAM_URL, data=ndjson_body(docs, compression), headers=headers)
+    summary = resp.json()
+    print(f"Streamed {summary.get('lines')} lines: {summary.get('embedded')} embedded, {summary.get('skipped')} unchanged, "
+          f"{summary.get('invalid')} invalid, {summary.get('failed')} failed in {summary.get('seconds')}s")
+    for error in summary.get("errors", []):
+        print(f"  ❌ {error}")
+    if resp.status_code != 200:
+        print(f"❌ Upload aborted ({resp.status_code}): {summary.get('error') or summary.get('detail')}")
+    return summary
+
+def chunk_documents(folder: Path, path: Path, text: str):
+    """/ingest documents for one file. The title is the path relative to the folder: the server hashes
+    title + chunk into the document id, so same-named files in different subfolders do not collide"""
+    for chunk in CHUNKER.iter_chunks(text):
+        yield {
+            "content": chunk.text,
+            "meta": {
+                "title": path.relative_to(folder).as_posix(),
+                "chunk": chunk.index + 1,
+                "source": str(path),
+                "start": chunk.start,  # character offsets in the file
+                "end": chunk.end,
+            },
+        }
+
+def iter_documents(folder_path: str, pattern: str = "*.txt"):
     folder = Path(folder_path)
-    docs = []
-
-    for txt_file in folder.rglob("*.txt"):  # supports subfolders
-        print(f"Processing {txt_file}")
-
-        if replace_existing:
-            # Delete existing chunks for this file
-            meta_filter = {"title": txt_file.name}  # Adjust based on how your backend queries/deletes
-            delete_documents(meta_filter)
-
-        text = txt_file.read_text(encoding="utf-8")
-        chunks = chunk_text(text)
-
-        for i, chunk in enumerate(chunks):
-            docs.append({
-                "content": chunk,
-                "meta": {
-                    "title": txt_file.name,
-                    "chunk": i + 1,
-                    "source": str(txt_file)
-                }
-            })
-
-    # Send in batches of 50 to avoid timeout
-    batch_size = 50
-    for i in range(0, len(docs), batch_size):
-        batch = docs[i:i + batch_size]
-        resp = requests.post(API_URL, json=batch)
-        print(f"Ingested batch {i//batch_size + 1}: {resp.json()}")
+    for path in sorted(folder.rglob(pattern)):  # supports subfolders
+        print(f"Processing {path}")
+        yield from chunk_documents(folder, path, path.read_text(encoding="utf-8"))
 
-if __name__ == "__main__":
-    # Change this to your folder with TXT files
-    ingest_folder(r"data", replace_existing=True)  # Set to True to replace previous sources
+def ingest_folder(folder_path: str, background: bool = False, stream: bool = False, compression: str = "gzip"):
+    """
+    Upload a folder. By default this is sync_folder (incremental, parallel, purges stale chunks).
+    stream=True sends everything as one compressed NDJSON upload, background=True as queued jobs;
+    both read the folder lazily and rely on the server skipping unchanged chunks.
+    """
+    if stream:
+        ingest_stream(iter_documents(folder_path), compression)
+        return
+    if background:
+        # The server queues the work, so requests return at once and batches can be large
+        docs, job_ids = iter_documents(folder_path), []
+        while batch := list(islice(docs, 1000)):
+            job_ids.append(submit_background(batch))
+        print(f"Queued {len(job_ids)} jobs")
+        wait_for_jobs(job_ids)
+        return
+    return sync_folder(folder_path)
+
+# ================== INCREMENTAL, PARALLEL FOLDER INGEST ==================
+MANIFEST_NAME = ".ingest_manifest.json"
+MANIFEST_SAVE_INTERVAL = 2.0  # seconds; a crash re-sends at most this much work (the server skips unchanged chunks)
+
+
+class Manifest:
+    """
+    What was ingested from a folder, per relative path: size, mtime, sha256 and chunk count.
+    Saved atomically (temp file + rename), so a crash leaves the previous or the new version, never half of one.
+    """
+
+    def __init__(self, path: Path, api_url: str):
+        self.path = path
+        self.api_url = api_url
+        self.files = {}
+        self._saved_at = 0.0
+        if path.exists():
+            data = json.loads(path.read_text(encoding="utf-8"))
+            if data.get("api_url") == api_url:  # a manifest of another server says nothing about this one
+                self.files = data.get("files", {})
+
+    def save(self, force: bool = True):
+        if not force and time.monotonic() - self._saved_at < MANIFEST_SAVE_INTERVAL:
+            return
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps({"api_url": self.api_url, "files": self.files}, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.path)
+        self._saved_at = time.monotonic()
+
+
+def scan_changes(folder: Path, manifest: Manifest, pattern: str = "*.txt", full: bool = False, stats: dict = None):
+    """
+    Yields (relative path, file entry, text) for new or changed files, reading each file once.
+    Unchanged size + mtime skips without reading; a touched file with the same hash only refreshes its entry.
+    A file that cannot be read or decoded is counted as failed instead of aborting the run; one that is not
+    UTF-8 is recorded with an "error" in the manifest and reported again on later runs until it changes.
+    """
+    for path in sorted(folder.rglob(pattern)):
+        rel = path.relative_to(folder).as_posix()
+        known = manifest.files.get(rel)
+        entry = None
+        try:
+            st = path.stat()
+            if not full and known and known["size"] == st.st_size and known["mtime"] == st.st_mtime:
+                if "error" in known:
+                    print(f"❌ {rel}: {known['error']} (unchanged since the last run)")
+                    stats["failed_files"] += 1
+                else:
+                    stats["unchanged"] += 1
+                continue
+            raw = path.read_bytes()
+            digest = hashlib.sha256(raw).hexdigest()
+            entry = {"size": st.st_size, "mtime": st.st_mtime, "sha256": digest}
+            if not full and known and known["sha256"] == digest and "error" not in known:
+                manifest.files[rel] = {**known, **entry}
+                stats["unchanged"] += 1
+                continue
+            text = raw.decode("utf-8")
+        except (OSError, UnicodeDecodeError) as e:
+            error = f"not UTF-8: {e}" if isinstance(e, UnicodeDecodeError) else f"unreadable: {e}"
+            print(f"❌ {rel}: {error}")
+            stats["failed_files"] += 1
+            if entry is not None:  # read but not decodable: remembered until the file changes
+                manifest.files[rel] = {**(known or {}), **entry, "error": error}
+            continue
+        yield rel, entry, text
+
+
+def file_batches(folder: Path, changes, batch_size: int):
+    """(relative path, entry, batch index, batch count, documents) per upload batch, file by file"""
+    for rel, entry, text in changes:
+        docs = list(chunk_documents(folder, folder / rel, text))
+        entry["chunks"] = len(docs)
+        batches = [docs[i:i + batch_size] for i in range(0, len(docs), batch_size)] or [[]]
+        for n, batch in enumerate(batches):
+            yield rel, entry, n, len(batches), batch
+
+
+def pooled_session(concurrency: int) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, concurrency), max_retries=0)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
 
-    print("✅ All TXT files ingested! Now use /query")
\ No newline at end of file
+
+def _post_batch(session: requests.Session, url: str, batch: list, retries: int = 3) -> dict:
+    """POST one batch; 429 (after its Retry-After), 5xx, connection errors and timeouts are retried"""
+    if not batch:
+        return {"embedded": 0, "skipped": 0}
+    for attempt in range(1, retries + 1):
+        delay = attempt * 1.0
+        try:
+            resp = session.post(url, json=batch, timeout=INGEST_TIMEOUT)
+            if resp.status_code != 429 and resp.status_code < 500:
+                resp.raise_for_status()
+                return resp.json()
+            error = f"{resp.status_code} {resp.text[:200]}"
+            retry_after = resp.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                delay = max(delay, int(retry_after))
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = str(e)
+        if attempt == retries:
+            raise RuntimeError(error)
+        time.sleep(delay)
+    raise RuntimeError("Unreachable")
+
+
+def _delete(session: requests.Session, url: str, meta_filter: dict) -> int:
+    resp = session.delete(url, json={"meta_filter": meta_filter}, timeout=DELETE_TIMEOUT)
+    resp.raise_for_status()
+    return resp.json().get("deleted", 0)
+
+
+def sync_folder(
+        folder_path: str,
+        api: str = "http://127.0.0.1:8000",
+        manifest_path: str = None,
+        pattern: str = "*.txt",
+        concurrency: int = 4,
+        batch_size: int = 50,
+        full: bool = False,
+        purge: bool = True,
+        dry_run: bool = False,
+) -> dict:
+    """
+    Bring the index in line with a folder: ingest new/changed files, purge chunks of deleted files and
+    stale trailing chunks of files that shrank. Files stream through read → chunk → upload; uploads run
+    `concurrency` at a time over one pooled session. A file enters the manifest only once all its batches
+    were accepted, so re-running after a crash resumes with whatever was not finished.
+    """
+    folder = Path(folder_path)
+    manifest = Manifest(Path(manifest_path) if manifest_path else folder / MANIFEST_NAME, api)
+    ingest_url, delete_url = f"{api}/ingest", f"{api}/delete"
+    stats = {"unchanged": 0, "ingested_files": 0, "failed_files": 0, "embedded": 0, "skipped": 0, "purged_files": 0, "purged_chunks": 0}
+    started = time.perf_counter()
+    present = {p.relative_to(folder).as_posix() for p in folder.rglob(pattern)}
+    changes = scan_changes(folder, manifest, pattern, full, stats)
+
+    if dry_run:
+        changed = [rel for rel, _, _ in changes]
+        removed = [rel for rel in manifest.files if rel not in present]
+        print(f"{len(changed)} new/changed, {stats['unchanged']} unchanged, {len(removed) if purge else 0} to purge")
+        for rel in changed:
+            print(f"  + {rel}")
+        for rel in removed if purge else []:
+            print(f"  - {rel}")
+        return stats
+
+    session = pooled_session(concurrency)
+    remaining, failed = {}, set()  # rel -> batches not yet accepted; files with a failed batch
+
+    def finish(rel: str, entry: dict):
+        old_chunks = manifest.files.get(rel, {}).get("chunks", 0)
+        source = str(folder / rel)
+        try:
+            if old_chunks > entry["chunks"]:  # the file shrank: drop its old tail in one filtered delete
+                stats["purged_chunks"] += _delete(session, delete_url, {"source": source, "chunk": {">": entry["chunks"]}})
+        except Exception as e:
+            print(f"❌ {rel}: could not remove stale chunks: {e}")
+            stats["failed_files"] += 1
+            return
+        manifest.files[rel] = entry
+        stats["ingested_files"] += 1
+        print(f"✅ {rel} ({entry['chunks']} chunks)")
+        manifest.save(force=False)
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        in_flight = {}
+
+        def collect(done):
+            for future in done:
+                rel, entry = in_flight.pop(future)
+                try:
+                    result = future.result()
+                    stats["embedded"] += result.get("embedded", 0)
+                    stats["skipped"] += result.get("skipped", 0)
+                except Exception as e:
+                    if rel not in failed:
+                        failed.add(rel)
+                        stats["failed_files"] += 1
+                        print(f"❌ {rel}: {e}")
+                remaining[rel] -= 1
+                if remaining[rel] == 0:
+                    del remaining[rel]
+                    if rel not in failed:
+                        finish(rel, entry)
+
+        for rel, entry, n, count, batch in file_batches(folder, changes, batch_size):
+            remaining.setdefault(rel, count)
+            # Bounded read-ahead: at most 2 batches per upload slot are held in memory
+            while len(in_flight) >= 2 * concurrency:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+            in_flight[pool.submit(_post_batch, session, ingest_url, batch)] = (rel, entry)
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            collect(done)
+
+    if purge:
+        for rel in [rel for rel in manifest.files if rel not in present]:
+            try:
+                stats["purged_chunks"] += _delete(session, delete_url, {"source": str(folder / rel)})
+            except Exception as e:
+                print(f"❌ could not purge {rel}: {e}")
+                continue
+            del manifest.files[rel]
+            stats["purged_files"] += 1
+            print(f"🗑 {rel}")
+
+    manifest.save()
+    session.close()
+    stats["seconds"] = round(time.perf_counter() - started, 2)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental, parallel ingest of a folder of text files")
+    parser.add_argument("folder", nargs="?", default="data")
+    parser.add_argument("--api", default="http://127.0.0.1:8000", help="gemini_rag base URL")
+    parser.add_argument("--manifest", help=f"manifest file, default <folder>/{MANIFEST_NAME}")
+    parser.add_argument("--pattern", default="*.txt")
+    parser.add_argument("--concurrency", type=int, default=4, help="uploads in flight")
+    parser.add_argument("--batch-size", type=int, default=50, help="chunks per /ingest request")
+    parser.add_argument("--full", action="store_true", help="ignore the manifest and send every file")
+    parser.add_argument("--no-purge", action="store_true", help="keep chunks of files deleted from the folder")
+    parser.add_argument("--dry-run", action="store_true", help="only list what would be ingested / purged")
+    args = parser.parse_args()
+    stats = sync_folder(
+        args.folder,
+        api=args.api.rstrip("/"),
+        manifest_path=args.manifest,
+        pattern=args.pattern,
+        concurrency=args.concurrency,
+        batch_size=args.batch_size,
+        full=args.full,
+        purge=not args.no_purge,
+        dry_run=args.dry_run,
+    )
+    print(json.dumps(stats))
+    if stats["failed_files"]:
+        print("❌ Some files failed; run again to retry them (files that are not UTF-8 once they were fixed)")
+    elif not args.dry_run:
+        print("✅ Folder in sync! Now use /query")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+import asyncio
+import math
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+INGEST_QUEUE_MAX_DOCS = int(os.environ.get("INGEST_QUEUE_MAX_DOCS", "20000"))  # accepted, not yet embedded; beyond → 429
+INGEST_JOB_BATCH = int(os.environ.get("INGEST_JOB_BATCH", "64"))  # documents per embed call
+INGEST_EMBED_WORKERS = int(os.environ.get("INGEST_EMBED_WORKERS", "2"))
+INGEST_WRITE_BATCH = int(os.environ.get("INGEST_WRITE_BATCH", "256"))  # embedded documents coalesced into one upsert
+INGEST_WRITE_QUEUE = int(os.environ.get("INGEST_WRITE_QUEUE", "8"))  # embedded batches waiting for the writer
+INGEST_JOBS_KEPT = int(os.environ.get("INGEST_JOBS_KEPT", "1000"))  # finished jobs still answerable by /jobs/{id}
+MAX_FAILURES_REPORTED = 100
+
+
+class QueueFull(Exception):
+    def __init__(self, queued: int, limit: int, retry_after: int):
+        super().__init__(f"Ingest queue full: {queued} of {limit} documents waiting")
+        self.retry_after = retry_after
+
+
+class IngestJob:
+    def __init__(self, total: int):
+        self.id = uuid.uuid4().hex
+        self.total = total
+        self.status = "queued"  # queued | running | done | failed
+        self.embedded = 0
+        self.skipped = 0  # unchanged since the last ingest
+        self.written = 0
+        self.failed = 0
+        self.failures: List[Dict[str, Any]] = []  # first MAX_FAILURES_REPORTED, with payload index
+        self.pending_batches = 0
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def fail(self, index: int, document: Dict[str, Any], error: Exception):
+        self.failed += 1
+        if len(self.failures) < MAX_FAILURES_REPORTED:
+            meta = document.get("meta") or {}
+            self.failures.append({"index": index, "title": meta.get("title"), "chunk": meta.get("chunk"), "error": str(error)})
+
+    @property
+    def processed(self) -> int:
+        return self.written + self.skipped + self.failed
+
+    def to_dict(self, with_failures: bool = True) -> Dict[str, Any]:
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        info = {
+            "job_id": self.id,
+            "status": self.status,
+            "total": self.total,
+            "processed": self.processed,
+            "progress": round(self.processed / self.total, 4) if self.total else 1.0,
+            "embedded": self.embedded,
+            "written": self.written,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "elapsed_s": round(elapsed, 3),
+            "docs_per_s": round(self.processed / elapsed, 2) if elapsed > 0 else None,
+        }
+        if with_failures:
+            info["failures"] = self.failures
+        return info
+
+
+class IngestJobQueue:
+    """
+    Background ingest for POST /ingest?background=true.
+
+    submit() splits a job into batches on the embed queue and returns at once. `embed_workers` tasks
+    take batches, skip unchanged documents and embed the rest; a single writer coalesces embedded
+    batches (across jobs) into upserts of up to `write_batch` documents, so writing overlaps with the
+    next embed calls. Backpressure: the bounded write queue holds back the embed workers when writes
+    lag, and submit() raises QueueFull once `max_queued_docs` documents wait to be embedded.
+
+    A failed embed batch is retried one document at a time, so only the offending documents are
+    reported in the job's failures. Jobs live in memory: a restart drops queued work.
+    """
+
+    def __init__(
+            self,
+            get_service: Callable[[], Awaitable[Any]],
+            max_queued_docs: int = INGEST_QUEUE_MAX_DOCS,
+            batch_size: int = INGEST_JOB_BATCH,
+            embed_workers: int = INGEST_EMBED_WORKERS,
+            write_batch: int = INGEST_WRITE_BATCH,
+            write_queue: int = INGEST_WRITE_QUEUE,
+            jobs_kept: int = INGEST_JOBS_KEPT,
+    ):
+        self._get_service = get_service
+        self.max_queued_docs = max_queued_docs
+        self.batch_size = max(1, batch_size)
+        self.embed_workers = max(1, embed_workers)
+        self.write_batch = max(1, write_batch)
+        self.write_queue_size = max(1, write_queue)
+        self.jobs_kept = jobs_kept
+        self.jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+        self.queued_docs = 0
+        self._rate = 0.0  # docs/s per embed worker, EWMA, for Retry-After
+        self._embed_queue: Optional[asyncio.Queue] = None
+        self._write_queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    # ---------- lifecycle (call from the app's lifespan) ----------
+    def start(self):
+        self._embed_queue = asyncio.Queue()  # admission is bounded by document count in submit()
+        self._write_queue = asyncio.Queue(maxsize=self.write_queue_size)
+        self._tasks = [asyncio.create_task(self._embed_worker()) for _ in range(self.embed_workers)]
+        self._tasks.append(asyncio.create_task(self._write_worker()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # ---------- API ----------
+    def submit(self, docs: List[Dict[str, Any]]) -> IngestJob:
+        if self._embed_queue is None:
+            raise RuntimeError("IngestJobQueue.start() was not called")
+        if len(docs) > self.max_queued_docs:
+            raise ValueError(f"Job of {len(docs)} documents exceeds INGEST_QUEUE_MAX_DOCS={self.max_queued_docs}")
+        if self.queued_docs + len(docs) > self.max_queued_docs:
+            raise QueueFull(self.queued_docs, self.max_queued_docs, self._retry_after(len(docs)))
+
+        job = IngestJob(len(docs))
+        for offset in range(0, len(docs), self.batch_size):
+            self._embed_queue.put_nowait((job, offset, docs[offset:offset + self.batch_size]))
+            job.pending_batches += 1
+        self.queued_docs += len(docs)
+        self._remember(job)
+        if not docs:
+            self._finish(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        return self.jobs.get(job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        active = [j for j in self.jobs.values() if j.status in ("queued", "running")]
+        return {
+            "queued_docs": self.queued_docs,
+            "max_queued_docs": self.max_queued_docs,
+            "active_jobs": len(active),
+            "write_queue": self._write_queue.qsize() if self._write_queue is not None else 0,
+        }
+
+    # ---------- internals ----------
+    def _retry_after(self, incoming: int) -> int:
+        """Seconds until enough of the queue drained for `incoming` more documents, at the observed rate"""
+        excess = self.queued_docs + incoming - self.max_queued_docs
+        rate = self._rate * self.embed_workers
+        return max(1, min(300, math.ceil(excess / rate))) if rate > 0 else 5
+
+    def _remember(self, job: IngestJob):
+        self.jobs[job.id] = job
+        finished = [j.id for j in self.jobs.values() if j.finished_at is not None]
+        for job_id in finished[:max(0, len(finished) - self.jobs_kept)]:
+            del self.jobs[job_id]
+
+    @staticmethod
+    def _finish(job: IngestJob):
+        job.finished_at = time.time()
+        job.started_at = job.started_at or job.finished_at
+        job.status = "failed" if job.total and job.failed == job.total else "done"
+
+    async def _embed_batch(self, service, job: IngestJob, offset: int, docs: List[Dict[str, Any]]) -> List[Tuple[int, Any]]:
+        """(payload index, embedded Document) pairs of one batch; failures are recorded on the job"""
+        try:
+            hay_docs, changed = await service.aprepare_ingest(docs)
+        except Exception as e:
+            for i, doc in enumerate(docs):
+                job.fail(offset + i, doc, e)
+            return []
+        job.skipped += len(hay_docs) - len(changed)
+        if not changed:
+            return []
+        index_of = {d.id: offset + i for i, d in enumerate(hay_docs)}
+        try:
+            embedded = await service.aembed_documents(changed)
+        except Exception as batch_error:
+            print(f"Ingest job {job.id}: embed batch at {offset} failed ({batch_error}) → retrying one by one")
+            embedded = []
+            for doc in changed:
+                try:
+                    embedded += await service.aembed_documents([doc])
+                except Exception as e:
+                    index = index_of[doc.id]
+                    job.fail(index, docs[index - offset], e)
+        job.embedded += len(embedded)
+        return [(index_of[d.id], d) for d in embedded]
+
+    async def _embed_worker(self):
+        while True:
+            job, offset, docs = await self._embed_queue.get()
+            started = time.perf_counter()
+            try:
+                if job.started_at is None:
+                    job.started_at = time.time()
+                    job.status = "running"
+                try:
+                    service = await self._get_service()
+                    embedded = await self._embed_batch(service, job, offset, docs)
+                except Exception as e:  # service failed to build
+                    for i, doc in enumerate(docs):
+                        job.fail(offset + i, doc, e)
+                    embedded = []
+                # Blocks while the writer is behind: backpressure from the write stage
+                await self._write_queue.put((job, offset, docs, embedded))
+            finally:
+                self.queued_docs -= len(docs)
+                elapsed = time.perf_counter() - started
+                if elapsed > 0:
+                    self._rate = 0.8 * self._rate + 0.2 * (len(docs) / elapsed) if self._rate else len(docs) / elapsed
+
+    async def _write_worker(self):
+        while True:
+            items = [await self._write_queue.get()]
+            size = len(items[0][3])
+            while size < self.write_batch and not self._write_queue.empty():
+                items.append(self._write_queue.get_nowait())
+                size += len(items[-1][3])
+
+            documents = [doc for *_, embedded in items for _, doc in embedded]
+            error = None
+            if documents:
+                try:
+                    service = await self._get_service()
+                    await service.awrite_embedded(documents)
+                except Exception as e:
+                    error = e
+                    print(f"Ingest write of {len(documents)} documents failed: {e}")
+
+            for job, offset, docs, embedded in items:
+                if error is None:
+                    job.written += len(embedded)
+                else:
+                    for index, _ in embedded:
+                        job.fail(index, docs[index - offset], error)
+                job.pending_batches -= 1
+                if job.pending_batches == 0:
+                    self._finish(job)
@@ -0,0 +1,88 @@
+import asyncio
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+
+class LazyService:
+    """
+    Builds an expensive object (the RAG service, with its haystack/genai imports and clients) on first use
+    instead of at import, so a worker binds its port immediately.
+
+    start_background() builds + warms up in a daemon thread right after startup; requests that arrive
+    earlier simply wait for the same build. `ready` turns True once the build and warm-up finished;
+    a failed warm-up is reported but does not block readiness (the service works, just colder).
+    """
+
+    def __init__(self, factory: Callable[[], Any], warm_up: Optional[Callable[[Any], None]] = None):
+        self._factory = factory
+        self._warm_up = warm_up
+        self._lock = threading.Lock()
+        self._instance = None
+        self._thread: Optional[threading.Thread] = None
+        self._created = time.perf_counter()
+        self.state = "starting"  # starting | warming | ready | failed
+        self.error: Optional[str] = None
+        self.warm_up_error: Optional[str] = None
+        self.build_seconds: Optional[float] = None
+        self.warm_up_seconds: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def get(self):
+        if self._instance is not None:
+            return self._instance
+        with self._lock:
+            if self._instance is None:
+                started = time.perf_counter()
+                try:
+                    self._instance = self._factory()
+                except Exception as e:
+                    self.state = "failed"
+                    self.error = str(e)
+                    raise
+                self.build_seconds = round(time.perf_counter() - started, 3)
+                if self.state == "failed":
+                    # the background build failed earlier, an on-demand retry got through
+                    self.state = "ready"
+                    self.error = None
+        return self._instance
+
+    async def aget(self):
+        if self._instance is not None:
+            return self._instance
+        return await asyncio.to_thread(self.get)
+
+    def _background(self):
+        try:
+            instance = self.get()
+        except Exception as e:
+            print(f"Service build failed: {e}")
+            return
+        self.state = "warming"
+        started = time.perf_counter()
+        if self._warm_up is not None:
+            try:
+                self._warm_up(instance)
+            except Exception as e:
+                self.warm_up_error = str(e)
+                print(f"Warm-up failed (serving anyway): {e}")
+        self.warm_up_seconds = round(time.perf_counter() - started, 3)
+        self.state = "ready"
+        print(f"Service ready in {round(time.perf_counter() - self._created, 3)}s")
+
+    def start_background(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._background, name="service-warm-up", daemon=True)
+            self._thread.start()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "error": self.error,
+            "warm_up_error": self.warm_up_error,
+            "build_seconds": self.build_seconds,
+            "warm_up_seconds": self.warm_up_seconds,
+        }
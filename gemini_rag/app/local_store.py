@@ -0,0 +1,442 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from haystack import Document
+
+from .document_store import filter_conditions
+from .quantization import PrefixCodes, make_codes
+
+INITIAL_CAPACITY = 1024
+CODES_REBUILD_BATCH = 65536  # rows re-encoded at a time when codes have to be rebuilt from the vectors
+
+# SQLite's default limit on host parameters per statement is 999 on older builds
+_SQL_BATCH = 500
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k largest scores, best first (argpartition, then sort only those k)"""
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def _json_path(key: str) -> str:
+    return '$."' + key.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+_SQL_OPERATORS = {"==": "=", "!=": "!=", ">": ">", ">=": ">=", "<": "<", "<=": "<="}
+
+
+def _where(meta_filter: Dict[str, Any]) -> Tuple[str, List[Any]]:
+    """SQL condition over the JSON meta column equivalent to document_store.meta_matches"""
+    clauses, params = [], []
+    for key, op, value in filter_conditions(meta_filter):
+        field = "json_extract(meta, ?)"
+        params.append(_json_path(key))
+        if op in ("in", "not in"):
+            values = list(value)
+            clause = f"{field} IN ({','.join('?' * len(values))})" if values else "0"
+            params += values
+            if op == "not in":
+                params.append(_json_path(key))
+                clause = f"(NOT {clause} OR {field} IS NULL)"
+        elif value is None and op in ("==", "!="):
+            clause = f"{field} IS NULL" if op == "==" else f"{field} IS NOT NULL"
+        else:
+            placeholder = "json(?)" if isinstance(value, (list, dict)) else "?"
+            clause = f"{field} {_SQL_OPERATORS[op]} {placeholder}"
+            params.append(json.dumps(value, ensure_ascii=False) if isinstance(value, (list, dict)) else value)
+            if op == "!=":
+                params.append(_json_path(key))
+                clause = f"({clause} OR {field} IS NULL)"
+        clauses.append(clause)
+    return " AND ".join(clauses) or "1", params
+
+
+class LocalDocumentStore:
+    """
+    In-process vector index for deployments without Qdrant.
+
+    Vectors live in a memory-mapped .npy matrix (float32 or float16, rows unit-normalized) and
+    content/meta in a SQLite sidecar, both under `path`. Loading maps the matrix and reads only the
+    id -> row table, so startup does not grow with the text size; writes and deletes touch only their
+    own rows. Content and meta are read back for the hits a query returns. Exposes the subset of the
+    QdrantDocumentStore API that RAGService uses, plus the filter-based count/delete of
+    KBQdrantDocumentStore. The *_async methods run in a worker thread.
+
+    With `quantization` ("int8" | "binary") only the compact codes are scanned; the top
+    top_k * oversampling candidates are then rescored against the full-precision mmap rows.
+    With `prefix_dim` a Matryoshka prefix matrix is kept for two-stage search (query_two_stage).
+    Codes are memory-mapped .npy files next to the vectors and rebuilt only when they are missing
+    or were not kept up to date by the last write.
+    """
+
+    def __init__(
+            self,
+            path: str,
+            embedding_dim: int = 768,
+            dtype: str = "float32",
+            quantization: str = "none",
+            oversampling: float = 2.0,
+            rescore: bool = True,
+            prefix_dim: int = 0,
+    ):
+        self.path = path
+        self.embedding_dim = embedding_dim
+        self.dtype = np.dtype(dtype)
+        self.codes = make_codes(quantization, embedding_dim)
+        self.oversampling = max(1.0, oversampling)
+        self.rescore = rescore
+        self.prefix = PrefixCodes(embedding_dim, prefix_dim) if prefix_dim else None
+        self._lock = threading.Lock()
+        self._vectors_path = os.path.join(path, "vectors.npy")
+        self._db_path = os.path.join(path, "docs.sqlite")
+        self._n_rows = 0  # rows ever used; rows below it that hold no document are free
+        self._row_of: Dict[str, int] = {}
+        self._free: List[int] = []
+        self._alive = np.zeros(0, dtype=bool)
+        self._vectors = None
+        os.makedirs(path, exist_ok=True)
+        self._conn = sqlite3.connect(self._db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS docs (
+                row INTEGER PRIMARY KEY,
+                id TEXT NOT NULL UNIQUE,
+                content TEXT,
+                meta TEXT NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.commit()
+        self._load()
+
+    # ---------- persistence ----------
+    @property
+    def _code_sets(self) -> List[Any]:
+        return [codes for codes in (self.codes, self.prefix) if codes is not None]
+
+    def _state(self) -> Dict[str, str]:
+        return dict(self._conn.execute("SELECT key, value FROM state").fetchall())
+
+    def _save_state(self, **values):
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO state VALUES (?, ?)", [(k, str(v)) for k, v in values.items()]
+        )
+
+    def _load(self):
+        state = self._state()
+        if state and os.path.exists(self._vectors_path):
+            if int(state["dim"]) != self.embedding_dim or state["dtype"] != self.dtype.name:
+                raise ValueError(
+                    f"Local index at {self.path} is {state['dim']}-dim {state['dtype']}, "
+                    f"expected {self.embedding_dim}-dim {self.dtype.name}"
+                )
+            self._vectors = np.load(self._vectors_path, mmap_mode="r+")
+            self._n_rows = int(state["rows"])
+        else:
+            self._vectors = np.lib.format.open_memmap(
+                self._vectors_path, mode="w+", dtype=self.dtype, shape=(INITIAL_CAPACITY, self.embedding_dim)
+            )
+            self._conn.execute("DELETE FROM docs")
+            self._save_state(dim=self.embedding_dim, dtype=self.dtype.name, rows=0, codes="")
+            self._conn.commit()
+            state = self._state()
+
+        self._alive = np.zeros(self._vectors.shape[0], dtype=bool)
+        for row, doc_id in self._conn.execute("SELECT row, id FROM docs"):
+            self._row_of[doc_id] = row
+            self._alive[row] = True
+        self._free = [row for row in range(self._n_rows - 1, -1, -1) if not self._alive[row]]
+
+        current = set(filter(None, state.get("codes", "").split(",")))
+        stale = False
+        for codes in self._code_sets:
+            if codes.name in current and self._open_codes(codes):
+                continue
+            stale = True
+            codes.resize(self._vectors.shape[0])
+            for start in range(0, self._n_rows, CODES_REBUILD_BATCH):
+                stop = min(self._n_rows, start + CODES_REBUILD_BATCH)
+                codes.set(slice(start, stop), self._vectors[start:stop])
+            self._save_codes(codes)
+        if stale:
+            self._save_state(codes=self._codes_kinds())
+            self._conn.commit()
+
+    def _codes_kinds(self) -> str:
+        return ",".join(codes.name for codes in self._code_sets)
+
+    def _codes_path(self, codes, array: str) -> str:
+        return os.path.join(self.path, f"{codes.name}.{array}.npy")
+
+    def _open_codes(self, codes) -> bool:
+        """Map the persisted arrays of `codes`; False if any is missing or does not fit the vectors"""
+        mapped = {}
+        for array in codes.arrays:
+            file_path = self._codes_path(codes, array)
+            if not os.path.exists(file_path):
+                return False
+            mapped[array] = np.load(file_path, mmap_mode="r+")
+            if mapped[array].shape[0] != self._vectors.shape[0] or mapped[array].shape[1:] != getattr(codes, array).shape[1:]:
+                return False
+        for array, values in mapped.items():
+            setattr(codes, array, values)
+        return True
+
+    def _save_codes(self, codes):
+        """Write the (in-RAM, just resized or rebuilt) arrays of `codes` and map them back"""
+        for array in codes.arrays:
+            file_path = self._codes_path(codes, array)
+            tmp_path = f"{file_path}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, np.ascontiguousarray(getattr(codes, array)))
+            os.replace(tmp_path, file_path)
+            setattr(codes, array, np.load(file_path, mmap_mode="r+"))
+
+    def _flush_codes(self):
+        for codes in self._code_sets:
+            for array in codes.arrays:
+                values = getattr(codes, array)
+                if isinstance(values, np.memmap):
+                    values.flush()
+
+    def _grow(self, needed_rows: int):
+        capacity = self._vectors.shape[0]
+        if needed_rows <= capacity:
+            return
+        new_capacity = max(needed_rows, capacity * 2)
+        tmp_path = f"{self._vectors_path}.tmp"
+        grown = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=self.dtype, shape=(new_capacity, self.embedding_dim))
+        grown[:capacity] = self._vectors
+        grown.flush()
+        del grown
+        self._vectors = None
+        os.replace(tmp_path, self._vectors_path)
+        self._vectors = np.load(self._vectors_path, mmap_mode="r+")
+        self._alive = np.concatenate([self._alive, np.zeros(new_capacity - capacity, dtype=bool)])
+        for codes in self._code_sets:
+            codes.resize(new_capacity)
+            self._save_codes(codes)
+
+    # ---------- helpers ----------
+    @staticmethod
+    def _unit_rows(vectors: np.ndarray) -> np.ndarray:
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+    def _fetch(self, rows: Sequence[int]) -> Dict[int, Tuple[str, Optional[str], Dict[str, Any]]]:
+        """row -> (id, content, meta) read from the sidecar"""
+        found = {}
+        unique = list(dict.fromkeys(int(r) for r in rows))
+        for i in range(0, len(unique), _SQL_BATCH):
+            chunk = unique[i:i + _SQL_BATCH]
+            for row, doc_id, content, meta in self._conn.execute(
+                    f"SELECT row, id, content, meta FROM docs WHERE row IN ({','.join('?' * len(chunk))})", chunk
+            ):
+                found[row] = (doc_id, content, json.loads(meta))
+        return found
+
+    def _to_documents(self, rows: Sequence[int], scores: Sequence[Optional[float]], return_embedding: bool) -> List[Document]:
+        entries = self._fetch(rows)
+        documents = []
+        for row, score in zip(rows, scores):
+            doc_id, content, meta = entries[int(row)]
+            embedding = self._vectors[row].astype(np.float32).tolist() if return_embedding else None
+            documents.append(Document(id=doc_id, content=content, meta=meta, score=score, embedding=embedding))
+        return documents
+
+    def _matching_rows(self, meta_filter: Dict[str, Any]) -> List[Tuple[int, str]]:
+        where, params = _where(meta_filter)
+        return self._conn.execute(f"SELECT row, id FROM docs WHERE {where}", params).fetchall()
+
+    # ---------- document store API ----------
+    def count_documents(self) -> int:
+        return len(self._row_of)
+
+    def write_documents(self, documents: List[Document], policy=None) -> int:
+        """Upsert by id (always overwrite, like DuplicatePolicy.OVERWRITE)"""
+        docs = [d for d in documents if d.embedding is not None]
+        if not docs:
+            return 0
+        vectors = self._unit_rows(np.asarray([d.embedding for d in docs], dtype=np.float32))
+        if vectors.shape[1] != self.embedding_dim:
+            raise ValueError(f"Expected {self.embedding_dim}-dim embeddings, got {vectors.shape[1]}")
+        records = [(d.id, d.content, json.dumps(d.meta, ensure_ascii=False)) for d in docs]
+
+        with self._lock:
+            rows = []
+            for doc in docs:
+                row = self._row_of.get(doc.id)
+                if row is None:
+                    if self._free:
+                        row = self._free.pop()
+                    else:
+                        row = self._n_rows
+                        self._n_rows += 1
+                rows.append(row)
+                self._row_of[doc.id] = row
+            self._grow(self._n_rows)
+
+            self._vectors[rows] = vectors.astype(self.dtype)
+            self._alive[rows] = True
+            for codes in self._code_sets:
+                codes.set(rows, vectors)
+            self._vectors.flush()
+            self._flush_codes()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO docs (row, id, content, meta) VALUES (?, ?, ?, ?)",
+                [(row, *record) for row, record in zip(rows, records)],
+            )
+            self._save_state(rows=self._n_rows, codes=self._codes_kinds())
+            self._conn.commit()
+        return len(docs)
+
+    async def write_documents_async(self, documents: List[Document], policy=None) -> int:
+        return await asyncio.to_thread(self.write_documents, documents, policy)
+
+    def get_documents_by_id(self, ids: List[str]) -> List[Document]:
+        with self._lock:
+            rows = [self._row_of[i] for i in ids if i in self._row_of]
+            return self._to_documents(rows, [None] * len(rows), True)
+
+    async def get_documents_by_id_async(self, ids: List[str]) -> List[Document]:
+        return await asyncio.to_thread(self.get_documents_by_id, ids)
+
+    def get_meta_by_id(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """{id: meta} of the stored documents among `ids`, without touching the vectors"""
+        with self._lock:
+            rows = [self._row_of[i] for i in ids if i in self._row_of]
+            return {doc_id: meta for doc_id, _, meta in self._fetch(rows).values()}
+
+    async def get_meta_by_id_async(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        return await asyncio.to_thread(self.get_meta_by_id, ids)
+
+    def count_by_meta(self, meta_filter: Dict[str, Any]) -> int:
+        where, params = _where(meta_filter)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM docs WHERE {where}", params).fetchone()[0]
+
+    async def count_by_meta_async(self, meta_filter: Dict[str, Any]) -> int:
+        return await asyncio.to_thread(self.count_by_meta, meta_filter)
+
+    def delete_by_meta(self, meta_filter: Dict[str, Any]) -> int:
+        with self._lock:
+            matched = self._matching_rows(meta_filter)
+            if not matched:
+                return 0
+            rows = [row for row, _ in matched]
+            for i in range(0, len(rows), _SQL_BATCH):
+                chunk = rows[i:i + _SQL_BATCH]
+                self._conn.execute(f"DELETE FROM docs WHERE row IN ({','.join('?' * len(chunk))})", chunk)
+            self._conn.commit()
+            for row, doc_id in matched:
+                del self._row_of[doc_id]
+                self._free.append(row)
+            self._alive[rows] = False
+            return len(rows)
+
+    async def delete_by_meta_async(self, meta_filter: Dict[str, Any]) -> int:
+        return await asyncio.to_thread(self.delete_by_meta, meta_filter)
+
+    def query_by_embedding(
+            self,
+            query_embedding: Sequence[float],
+            top_k: int = 10,
+            return_embedding: bool = False,
+    ) -> List[Document]:
+        query = self._unit_rows(np.asarray(query_embedding, dtype=np.float32))
+        with self._lock:
+            n_rows = self._n_rows
+            if not self._row_of or top_k <= 0:
+                return []
+            k = min(top_k, len(self._row_of))
+            alive = self._alive[:n_rows]
+
+            if self.codes is None:
+                scores = self._vectors[:n_rows] @ query  # float16 rows are promoted, scores stay float32
+                top = _top_k(np.where(alive, scores, -np.inf), k)
+                return self._to_documents(top, [float(scores[r]) for r in top], return_embedding)
+
+            approx = np.where(alive, self.codes.scores(query, n_rows), -np.inf)
+            if not self.rescore:
+                top = _top_k(approx, k)
+                return self._to_documents(top, [float(approx[r]) for r in top], return_embedding)
+
+            return self._rescore(query, approx, k, int(np.ceil(k * self.oversampling)), return_embedding)
+
+    def query_by_embeddings(
+            self,
+            query_embeddings: Sequence[Sequence[float]],
+            top_k: int = 10,
+            return_embedding: bool = False,
+    ) -> List[List[Document]]:
+        """query_by_embedding for many queries; without quantization all of them are scored in one matrix product"""
+        if self.codes is not None:
+            return [self.query_by_embedding(q, top_k, return_embedding) for q in query_embeddings]
+        if len(query_embeddings) == 0:
+            return []
+        queries = self._unit_rows(np.asarray(query_embeddings, dtype=np.float32))
+        with self._lock:
+            n_rows = self._n_rows
+            if not self._row_of or top_k <= 0:
+                return [[] for _ in range(len(queries))]
+            k = min(top_k, len(self._row_of))
+            scores = self._vectors[:n_rows] @ queries.T  # (rows, queries)
+            scores[~self._alive[:n_rows]] = -np.inf
+            results = []
+            for column in scores.T:
+                top = _top_k(column, k)
+                results.append(self._to_documents(top, [float(column[r]) for r in top], return_embedding))
+            return results
+
+    def _rescore(self, query: np.ndarray, approx: np.ndarray, k: int, candidates: int, return_embedding: bool) -> List[Document]:
+        """Take the best `candidates` rows by approximate score and re-rank them with the full vectors"""
+        rows = np.sort(_top_k(approx, min(max(candidates, k), len(self._row_of))))
+        exact = self._vectors[rows] @ query
+        order = _top_k(exact, k)
+        return self._to_documents(rows[order], [float(exact[i]) for i in order], return_embedding)
+
+    def query_two_stage(
+            self,
+            query_embedding: Sequence[float],
+            top_k: int = 10,
+            candidates: int = 100,
+            return_embedding: bool = False,
+    ) -> List[Document]:
+        """Stage 1: prefix cosine over the in-RAM Matryoshka matrix; stage 2: full-dim rerank of the candidates"""
+        if self.prefix is None:
+            return self.query_by_embedding(query_embedding, top_k, return_embedding)
+        query = self._unit_rows(np.asarray(query_embedding, dtype=np.float32))
+        with self._lock:
+            n_rows = self._n_rows
+            if not self._row_of or top_k <= 0:
+                return []
+            approx = np.where(self._alive[:n_rows], self.prefix.scores(query, n_rows), -np.inf)
+            return self._rescore(query, approx, min(top_k, len(self._row_of)), candidates, return_embedding)
+
+
+class LocalEmbeddingRetriever:
+    """Drop-in for QdrantEmbeddingRetriever over a LocalDocumentStore"""
+
+    def __init__(self, document_store: LocalDocumentStore, top_k: int = 10):
+        self.document_store = document_store
+        self.top_k = top_k
+
+    def run(self, query_embedding: List[float], top_k: Optional[int] = None, return_embedding: bool = False, **kwargs):
+        docs = self.document_store.query_by_embedding(query_embedding, top_k or self.top_k, return_embedding)
+        return {"documents": docs}
+
+    async def run_async(self, query_embedding: List[float], top_k: Optional[int] = None, return_embedding: bool = False, **kwargs):
+        return await asyncio.to_thread(self.run, query_embedding, top_k, return_embedding)
+
+    def run_batch(self, query_embeddings: List[List[float]], top_k: Optional[int] = None, return_embedding: bool = False):
+        docs = self.document_store.query_by_embeddings(query_embeddings, top_k or self.top_k, return_embedding)
+        return {"documents": docs}
+
+    async def run_batch_async(self, query_embeddings: List[List[float]], top_k: Optional[int] = None, return_embedding: bool = False):
+        return await asyncio.to_thread(self.run_batch, query_embeddings, top_k, return_embedding)
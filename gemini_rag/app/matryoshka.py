@@ -0,0 +1,62 @@
+import asyncio
+import dataclasses
+from typing import List
+
+from haystack import Document
+
+from .quantization import truncate
+
+
+def prefix_documents(documents: List[Document], prefix_dim: int) -> List[Document]:
+    """Copies of the documents carrying only the re-normalized Matryoshka prefix of their embedding"""
+    return [
+        dataclasses.replace(doc, embedding=truncate(doc.embedding, prefix_dim).tolist())
+        for doc in documents
+        if doc.embedding is not None
+    ]
+
+
+class MatryoshkaRetriever:
+    """
+    Two-stage dense retrieval: a wide candidate search on low-dimensional prefix vectors,
+    then a rerank with the full-dimension vectors.
+
+    - LocalDocumentStore keeps the prefix matrix itself (prefix_dim set on the store), no prefix_store needed.
+    - For Qdrant the prefix vectors live in a sidecar collection (`prefix_store`) with the same point ids;
+      the haystack store only manages a single unnamed vector per collection, so named vectors with a
+      prefetch query are not an option. Stage 1 returns only point ids; stage 2 is an exact search in the
+      main collection restricted to those ids, so no vectors leave Qdrant.
+    """
+
+    def __init__(self, document_store, prefix_dim: int, candidates: int = 100, prefix_store=None):
+        self.document_store = document_store
+        self.prefix_dim = prefix_dim
+        self.candidates = candidates
+        self.prefix_store = prefix_store
+
+    def run(self, query_embedding: List[float], top_k: int = 10, return_embedding: bool = False, **kwargs):
+        return {"documents": self.run_batch([query_embedding], top_k, return_embedding)["documents"][0]}
+
+    async def run_async(self, query_embedding: List[float], top_k: int = 10, return_embedding: bool = False, **kwargs):
+        return {"documents": (await self.run_batch_async([query_embedding], top_k, return_embedding))["documents"][0]}
+
+    def run_batch(self, query_embeddings: List[List[float]], top_k: int = 10, return_embedding: bool = False):
+        """Batched run: one round trip per stage for all queries"""
+        if self.prefix_store is None:
+            docs = [self.document_store.query_two_stage(q, top_k, self.candidates, return_embedding) for q in query_embeddings]
+            return {"documents": docs}
+
+        candidates = self.prefix_store.query_point_ids(
+            truncate(query_embeddings, self.prefix_dim).tolist(), limit=max(self.candidates, top_k)
+        )
+        return {"documents": self.document_store.query_among(query_embeddings, candidates, top_k, return_embedding)}
+
+    async def run_batch_async(self, query_embeddings: List[List[float]], top_k: int = 10, return_embedding: bool = False):
+        if self.prefix_store is None:
+            return await asyncio.to_thread(self.run_batch, query_embeddings, top_k, return_embedding)
+
+        candidates = await self.prefix_store.query_point_ids_async(
+            truncate(query_embeddings, self.prefix_dim).tolist(), limit=max(self.candidates, top_k)
+        )
+        docs = await self.document_store.query_among_async(query_embeddings, candidates, top_k, return_embedding)
+        return {"documents": docs}
@@ -0,0 +1,4 @@
+
+from shared.metrics import Metrics
+
+metrics = Metrics("gemini_rag")
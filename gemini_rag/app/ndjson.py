@@ -0,0 +1,242 @@
+import asyncio
+import json
+import os
+import time
+import zlib
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+INGEST_STREAM_BATCH = int(os.environ.get("INGEST_STREAM_BATCH", "64"))  # documents per aingest call
+INGEST_STREAM_MAX_LINE = int(os.environ.get("INGEST_STREAM_MAX_LINE", str(8 * 1024 * 1024)))  # bytes, decompressed
+MAX_ERRORS_REPORTED = 100
+DECOMPRESS_STEP = 1024 * 1024  # most bytes zlib inflates per call
+# zstd input bytes per call: one byte can expand to ~32 KiB (RLE blocks), so this bounds a call to ~4 MiB
+ZSTD_INPUT_SLICE = 128
+
+
+class StreamError(Exception):
+    status_code = 400
+
+
+class UnsupportedEncoding(StreamError):
+    status_code = 415
+
+
+class LineTooLong(StreamError):
+    status_code = 413
+
+
+class _Identity:
+    truncated = False
+
+    def decompress(self, data: bytes) -> Iterator[bytes]:
+        if data:
+            yield data
+
+    def flush(self) -> bytes:
+        return b""
+
+
+class _Members:
+    """
+    Decodes concatenated gzip members / zstd frames (`cat a.gz b.gz`, pigz, zstd -T0) as one stream.
+    Output comes in pieces of bounded size, so a small body that inflates to gigabytes (a decompression
+    bomb) is never materialized at once: zlib gets max_length, and zstd, whose decompressobj has no output
+    limit, is fed ZSTD_INPUT_SLICE bytes at a time.
+    """
+
+    def __init__(self, factory: Callable[[], Any], bounded: bool):
+        self._factory = factory
+        self._bounded = bounded  # decompress() takes max_length and keeps the rest in unconsumed_tail
+        self._current = factory()
+        self._received = False
+
+    def decompress(self, data: bytes) -> Iterator[bytes]:
+        view = data
+        while view:
+            if self._current.eof:  # a finished decompressor cannot be fed again: next member/frame
+                self._current = self._factory()
+            self._received = True
+            if self._bounded:
+                out = self._current.decompress(view, DECOMPRESS_STEP)
+                view = self._current.unused_data if self._current.eof else self._current.unconsumed_tail
+            else:
+                piece, view = view[:ZSTD_INPUT_SLICE], view[ZSTD_INPUT_SLICE:]
+                out = self._current.decompress(piece)
+                if self._current.eof:
+                    view = self._current.unused_data + view
+            if out:
+                yield out
+
+    def flush(self) -> bytes:
+        return self._current.flush()
+
+    @property
+    def truncated(self) -> bool:
+        """True if the body ended inside a member (zlib's flush does not complain about that)"""
+        return self._received and not self._current.eof
+
+
+def decompressor(content_encoding: Optional[str]):
+    """Incremental decoder for a request Content-Encoding: identity, gzip, deflate or zstd"""
+    encoding = (content_encoding or "identity").strip().lower()
+    if encoding == "identity":
+        return _Identity()
+    if encoding in ("gzip", "x-gzip"):
+        return _Members(lambda: zlib.decompressobj(wbits=zlib.MAX_WBITS | 16), bounded=True)
+    if encoding == "deflate":
+        return _Members(zlib.decompressobj, bounded=True)
+    if encoding == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise UnsupportedEncoding("zstd request bodies need the zstandard package on the server")
+        return _Members(lambda: zstandard.ZstdDecompressor().decompressobj(), bounded=False)
+    raise UnsupportedEncoding(f"Unsupported Content-Encoding: {content_encoding} (expected gzip, deflate or zstd)")
+
+
+async def iter_ndjson(
+        chunks: AsyncIterator[bytes],
+        content_encoding: Optional[str] = None,
+        max_line_bytes: int = INGEST_STREAM_MAX_LINE,
+) -> AsyncIterator[Tuple[int, Any]]:
+    """
+    (line number, parsed JSON or the parse error) for every non-blank line, decoded as the body arrives.
+    Only the current partial line is buffered; a line longer than max_line_bytes raises LineTooLong as
+    soon as that much of it has been decoded.
+    """
+    decoder = decompressor(content_encoding)
+    buffer = bytearray()  # the current partial line
+    line_no = 0
+
+    def parse(line: bytes):
+        try:
+            return json.loads(line)
+        except ValueError as e:
+            return e
+
+    def too_long(size: int, number: int):
+        if size > max_line_bytes:
+            raise LineTooLong(f"Line {number} exceeds {max_line_bytes} bytes")
+
+    def feed(data: bytes) -> Iterator[Tuple[int, Any]]:
+        nonlocal buffer, line_no
+        end = data.rfind(b"\n")
+        if end < 0:
+            too_long(len(buffer) + len(data), line_no + 1)
+            buffer += data
+            return
+        complete = bytes(buffer) + data[:end]
+        buffer = bytearray(data[end + 1:])
+        for line in complete.split(b"\n"):
+            line_no += 1
+            too_long(len(line), line_no)
+            if line.strip():
+                yield line_no, parse(line)
+        too_long(len(buffer), line_no + 1)
+
+    def decoded(chunk: bytes) -> Iterator[bytes]:
+        pieces = decoder.decompress(chunk)
+        while True:
+            try:
+                piece = next(pieces, None)
+            except Exception as e:  # zlib.error / zstandard.ZstdError
+                raise StreamError(f"Corrupt {content_encoding} body after line {line_no}: {e}")
+            if piece is None:
+                return
+            yield piece
+
+    async for chunk in chunks:
+        for data in decoded(chunk):
+            for item in feed(data):
+                yield item
+
+    try:
+        tail = decoder.flush()
+    except Exception as e:
+        raise StreamError(f"Truncated {content_encoding} body: {e}")
+    if decoder.truncated:
+        raise StreamError(f"Truncated {content_encoding} body after line {line_no}")
+    for item in feed(tail + b"\n"):
+        yield item
+
+
+def _document(obj: Any) -> Dict[str, Any]:
+    """Same shape as main.IngestDoc: {"content": str, "meta": dict}"""
+    if isinstance(obj, Exception):
+        raise ValueError(f"Invalid JSON: {obj}")
+    if not isinstance(obj, dict) or not isinstance(obj.get("content"), str):
+        raise ValueError('Expected an object with a string "content"')
+    meta = obj.get("meta") or {}
+    if not isinstance(meta, dict):
+        raise ValueError('"meta" must be an object')
+    return {"content": obj["content"], "meta": meta}
+
+
+async def stream_ingest(
+        lines: AsyncIterator[Tuple[int, Any]],
+        ingest: Callable[[List[Dict[str, Any]]], Awaitable[Dict[str, Any]]],
+        batch_size: int = INGEST_STREAM_BATCH,
+) -> Tuple[Dict[str, Any], Optional[StreamError]]:
+    """
+    Feed parsed NDJSON lines to `ingest` (RAGService.aingest) in micro-batches of batch_size documents.
+    One batch is ingested while the next one is parsed, so at most two batches are held at a time.
+    Invalid lines and failed batches are reported, not fatal; a broken stream stops the ingest and is
+    returned alongside the summary of what was ingested before it.
+    """
+    started = time.perf_counter()
+    summary: Dict[str, Any] = {"lines": 0, "batches": 0, "embedded": 0, "skipped": 0, "invalid": 0, "failed": 0, "errors": []}
+    pending: Optional[asyncio.Task] = None
+
+    def report(error: Dict[str, Any]):
+        if len(summary["errors"]) < MAX_ERRORS_REPORTED:
+            summary["errors"].append(error)
+
+    async def run(batch: List[Dict[str, Any]], first_line: int, last_line: int):
+        try:
+            result = await ingest(batch)
+        except Exception as e:
+            summary["failed"] += len(batch)
+            report({"lines": [first_line, last_line], "error": str(e)})
+            return
+        summary["batches"] += 1
+        summary["embedded"] += result.get("embedded", 0)
+        summary["skipped"] += result.get("skipped", 0)
+
+    async def flush(batch, first_line, last_line):
+        nonlocal pending
+        if pending is not None:
+            await pending
+        pending = asyncio.create_task(run(batch, first_line, last_line))
+
+    batch: List[Dict[str, Any]] = []
+    first_line = last_line = 0
+    error: Optional[StreamError] = None
+    try:
+        async for line_no, obj in lines:
+            summary["lines"] = line_no
+            try:
+                doc = _document(obj)
+            except ValueError as e:
+                summary["invalid"] += 1
+                report({"line": line_no, "error": str(e)})
+                continue
+            if not batch:
+                first_line = line_no
+            batch.append(doc)
+            last_line = line_no
+            if len(batch) >= batch_size:
+                await flush(batch, first_line, last_line)
+                batch = []
+    except StreamError as e:
+        error = e
+    if batch:  # documents before a broken line are still ingested; "lines" tells the client where to resume
+        await flush(batch, first_line, last_line)
+    if pending is not None:
+        await pending
+
+    summary["ingested"] = summary["embedded"] + summary["skipped"]
+    summary["seconds"] = round(time.perf_counter() - started, 3)
+    summary["status"] = "ok" if error is None else "aborted"
+    if error is not None:
+        summary["error"] = str(error)
+    return summary, error
@@ -0,0 +1,142 @@
+from typing import Optional
+
+import numpy as np
+from qdrant_client.http import models
+
+QUANTIZATION_MODES = ("none", "int8", "binary")
+
+# popcount of every byte value, used for hamming distance on packed binary codes
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+class Int8Codes:
+    """
+    Per-row symmetric int8 scalar quantization of unit vectors: 4x smaller than float32.
+    Scores are approximate dot products, good for candidate selection before rescoring.
+    """
+
+    name = "int8"
+    arrays = ("codes", "scales")  # attributes a store may persist and memory-map
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.codes = np.zeros((0, dim), dtype=np.int8)
+        self.scales = np.zeros(0, dtype=np.float32)
+
+    def resize(self, rows: int):
+        if rows > self.codes.shape[0]:
+            extra = rows - self.codes.shape[0]
+            self.codes = np.vstack([self.codes, np.zeros((extra, self.dim), dtype=np.int8)])
+            self.scales = np.concatenate([self.scales, np.zeros(extra, dtype=np.float32)])
+
+    def set(self, rows, vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+        self.codes[rows] = np.round(vectors / scales[:, None]).astype(np.int8)
+        self.scales[rows] = scales
+
+    def scores(self, query: np.ndarray, n_rows: int) -> np.ndarray:
+        return (self.codes[:n_rows] @ query.astype(np.float32)) * self.scales[:n_rows]
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.scales.nbytes
+
+
+class BinaryCodes:
+    """
+    Sign-bit quantization packed 8 dims per byte: 32x smaller than float32.
+    Scores are (dim - 2 * hamming distance), i.e. agreement of signs; needs oversampling + rescoring.
+    """
+
+    name = "binary"
+    arrays = ("codes",)
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.codes = np.zeros((0, (dim + 7) // 8), dtype=np.uint8)
+
+    def resize(self, rows: int):
+        if rows > self.codes.shape[0]:
+            extra = rows - self.codes.shape[0]
+            self.codes = np.vstack([self.codes, np.zeros((extra, self.codes.shape[1]), dtype=np.uint8)])
+
+    def set(self, rows, vectors: np.ndarray):
+        self.codes[rows] = np.packbits(np.asarray(vectors) > 0, axis=1)
+
+    def scores(self, query: np.ndarray, n_rows: int) -> np.ndarray:
+        packed_query = np.packbits(np.asarray(query) > 0)
+        hamming = _POPCOUNT[np.bitwise_xor(self.codes[:n_rows], packed_query)].sum(axis=1, dtype=np.int32)
+        return (self.dim - 2 * hamming).astype(np.float32)
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes
+
+
+class PrefixCodes:
+    """
+    Matryoshka prefix of each vector (first `prefix_dim` dims, re-normalized), kept contiguous in RAM.
+    gemini-embedding-001 is trained so that prefixes are embeddings in their own right, which makes
+    prefix cosine a cheap first-stage score.
+    """
+
+    arrays = ("codes",)
+
+    def __init__(self, dim: int, prefix_dim: int):
+        if not 0 < prefix_dim < dim:
+            raise ValueError(f"prefix_dim must be between 1 and {dim - 1}, got {prefix_dim}")
+        self.name = f"prefix{prefix_dim}"
+        self.dim = dim
+        self.prefix_dim = prefix_dim
+        self.codes = np.zeros((0, prefix_dim), dtype=np.float32)
+
+    def resize(self, rows: int):
+        if rows > self.codes.shape[0]:
+            extra = rows - self.codes.shape[0]
+            self.codes = np.vstack([self.codes, np.zeros((extra, self.prefix_dim), dtype=np.float32)])
+
+    def set(self, rows, vectors: np.ndarray):
+        self.codes[rows] = truncate(vectors, self.prefix_dim)
+
+    def scores(self, query: np.ndarray, n_rows: int) -> np.ndarray:
+        return self.codes[:n_rows] @ truncate(query, self.prefix_dim)
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes
+
+
+def truncate(vectors, prefix_dim: int) -> np.ndarray:
+    """First prefix_dim dims of each vector, re-normalized to unit length"""
+    prefix = np.asarray(vectors, dtype=np.float32)[..., :prefix_dim]
+    return prefix / np.maximum(np.linalg.norm(prefix, axis=-1, keepdims=True), 1e-12)
+
+
+def make_codes(mode: str, dim: int) -> Optional[object]:
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown quantization mode: {mode} (expected one of {QUANTIZATION_MODES})")
+    if mode == "int8":
+        return Int8Codes(dim)
+    if mode == "binary":
+        return BinaryCodes(dim)
+    return None
+
+
+def qdrant_quantization_config(mode: str, always_ram: bool = True):
+    """quantization_config for collection creation; quantized vectors stay in RAM, originals can go on disk"""
+    if mode == "int8":
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=always_ram)
+        )
+    if mode == "binary":
+        return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=always_ram))
+    return None
+
+
+def qdrant_search_params(mode: str, oversampling: float, rescore: bool = True) -> Optional[models.SearchParams]:
+    if mode not in ("int8", "binary"):
+        return None
+    return models.SearchParams(
+        quantization=models.QuantizationSearchParams(ignore=False, rescore=rescore, oversampling=oversampling)
+    )
@@ -0,0 +1,113 @@
+"""
+Memory saved and recall@k lost by vector quantization, measured on our own corpus.
+
+Reads the stored vectors (local NumPy index or Qdrant collection, same env config as the service),
+uses a sample of them as queries (self-match excluded) and compares int8/binary top-k against exact
+float32 top-k, with and without full-precision rescoring. With --prefix-dim the Matryoshka two-stage
+search (prefix cosine for --candidates rows, full-dim rerank) is measured the same way.
+
+    python -m app.quantization_report --k 10 --queries 200 --oversampling 2 --prefix-dim 256
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+from .quantization import BinaryCodes, Int8Codes, PrefixCodes
+
+
+def load_vectors() -> np.ndarray:
+    backend = os.environ.get("DOC_STORE_BACKEND", "qdrant")
+    dim = int(os.environ.get("GEMINI_EMBED_DIM", "768"))
+    if backend == "local":
+        from .local_store import LocalDocumentStore
+        store = LocalDocumentStore(
+            os.environ.get("LOCAL_INDEX_PATH", "local_index"),
+            embedding_dim=dim,
+            dtype=os.environ.get("LOCAL_INDEX_DTYPE", "float32"),
+        )
+        return np.asarray(store._vectors[:store._n_rows][store._alive[:store._n_rows]], dtype=np.float32)
+
+    from qdrant_client import QdrantClient
+    client = QdrantClient(
+        host=os.environ.get("QDRANT_HOST", "localhost"),
+        port=int(os.environ.get("QDRANT_PORT", "6333")),
+    )
+    collection = os.environ.get("QDRANT_COLLECTION", "kb_collection")
+    vectors, offset = [], None
+    while True:
+        points, offset = client.scroll(collection, limit=1000, offset=offset, with_payload=False, with_vectors=True)
+        vectors.extend(p.vector for p in points)
+        if offset is None:
+            break
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def recall_at_k(exact_top: np.ndarray, approx_top: np.ndarray) -> float:
+    hits = [len(set(e) & set(a)) for e, a in zip(exact_top, approx_top)]
+    return float(np.mean(hits) / exact_top.shape[1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--oversampling", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--prefix-dim", type=int, default=0, help="Matryoshka prefix dim, 0 = skip")
+    parser.add_argument("--candidates", type=int, default=100, help="stage-1 candidates for the prefix search")
+    args = parser.parse_args()
+
+    vectors = load_vectors()
+    n, dim = vectors.shape
+    if n <= args.k:
+        raise SystemExit(f"Need more than k={args.k} stored vectors, found {n}")
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    rng = np.random.default_rng(args.seed)
+    query_rows = rng.choice(n, size=min(args.queries, n), replace=False)
+    k = args.k
+    candidates = min(n - 1, int(np.ceil(k * args.oversampling)))
+
+    def top(scores: np.ndarray, count: int) -> np.ndarray:
+        idx = np.argpartition(-scores, count - 1)[:count]
+        return idx[np.argsort(-scores[idx])]
+
+    report = {"vectors": n, "dim": dim, "k": k, "queries": len(query_rows), "oversampling": args.oversampling}
+    float32_bytes = vectors.nbytes
+    report["float32_bytes"] = float32_bytes
+
+    exact_top = []
+    for row in query_rows:
+        scores = vectors @ vectors[row]
+        scores[row] = -np.inf
+        exact_top.append(top(scores, k))
+    exact_top = np.asarray(exact_top)
+
+    all_codes = [("int8", Int8Codes(dim), candidates), ("binary", BinaryCodes(dim), candidates)]
+    if args.prefix_dim:
+        all_codes.append((f"prefix{args.prefix_dim}", PrefixCodes(dim, args.prefix_dim), min(n - 1, max(k, args.candidates))))
+    for name, codes, n_cand in all_codes:
+        codes.resize(n)
+        codes.set(slice(0, n), vectors)
+        raw_top, rescored_top = [], []
+        for row in query_rows:
+            approx = codes.scores(vectors[row], n)
+            approx[row] = -np.inf
+            raw_top.append(top(approx, k))
+            cand = top(approx, n_cand)
+            exact = vectors[cand] @ vectors[row]
+            rescored_top.append(cand[top(exact, k)])
+        report[name] = {
+            "bytes_in_ram": codes.nbytes,
+            "memory_saved_pct": round(100 * (1 - codes.nbytes / float32_bytes), 2),
+            f"recall@{k}": round(recall_at_k(exact_top, np.asarray(raw_top)), 4),
+            f"recall@{k}_rescored": round(recall_at_k(exact_top, np.asarray(rescored_top)), 4),
+        }
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
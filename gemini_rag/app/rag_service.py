@@ -1,121 +1,353 @@
 import os
+import asyncio
 import hashlib
-from typing import List, Dict, Any
-from haystack_integrations.document_stores.qdrant import QdrantDocumentStore
+import time
+import dataclasses
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple
 from haystack.document_stores.types import DuplicatePolicy
 from haystack_integrations.components.retrievers.qdrant import QdrantEmbeddingRetriever
 from haystack import Document
 import google.generativeai as genai
-from .generator import generate_answer
+from shared.embedding_cache import EmbeddingCache, open_embedding_cache
+from .generator import agenerate, generate_answer_stream_async
+from .document_store import KBQdrantDocumentStore
+from .local_store import LocalDocumentStore, LocalEmbeddingRetriever
+from .quantization import qdrant_quantization_config, qdrant_search_params
+from .matryoshka import MatryoshkaRetriever, prefix_documents
+from .embedder import BGEDocumentEmbedder, BGEEmbeddingClient, BGETextEmbedder
+from .cache import LRUTTLCache, SemanticAnswerCache, SingleFlight, normalize_query
+from .tokens import estimate_tokens
+from .sparse import BM25Index, reciprocal_rank_fusion
+from .context_builder import build_context
+from .compression import SentenceCompressor
+from .metrics import metrics
 
 # ================== CONFIG ==================
 QDRANT_HOST = os.environ.get("QDRANT_HOST", "localhost")
 QDRANT_PORT = int(os.environ.get("QDRANT_PORT", "6333"))
 COLLECTION = os.environ.get("QDRANT_COLLECTION", "kb_collection")
 
+DOC_STORE_BACKEND = os.environ.get("DOC_STORE_BACKEND", "qdrant")  # qdrant | local (in-process NumPy index, no server)
+LOCAL_INDEX_PATH = os.environ.get("LOCAL_INDEX_PATH", "local_index")
+LOCAL_INDEX_DTYPE = os.environ.get("LOCAL_INDEX_DTYPE", "float32")  # float32 | float16
+
+# Opt-in vector quantization: compact codes in RAM, top_k * oversampling candidates rescored with full vectors.
+# For Qdrant it is applied when the collection is created (recreate it to switch an existing one).
+VECTOR_QUANTIZATION = os.environ.get("VECTOR_QUANTIZATION", "none")  # none | int8 | binary
+QUANT_OVERSAMPLING = float(os.environ.get("QUANT_OVERSAMPLING", "2.0"))
+QUANT_RESCORE = os.environ.get("QUANT_RESCORE", "1") == "1"
+QUANT_ORIGINALS_ON_DISK = os.environ.get("QUANT_ORIGINALS_ON_DISK", "1") == "1"
+
 GEMINI_EMBED_MODEL = os.environ.get("GEMINI_EMBED_MODEL", "gemini-embedding-001")
 GEMINI_EMBED_DIM = int(os.environ.get("GEMINI_EMBED_DIM", "768"))  # 768 = best balance (supports 128–3072)
 
-GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    raise ValueError("❌ GEMINI_API_KEY environment variable is required")
-genai.configure(api_key=GEMINI_API_KEY)
+# Which embedding backend RAGService uses; the stores are sized for its dimension (BGE_EMBED_DIM for bge)
+RAG_EMBEDDER = os.environ.get("RAG_EMBEDDER", "gemini")  # gemini | bge
+
+QUERY_EMBED_CACHE_SIZE = int(os.environ.get("QUERY_EMBED_CACHE_SIZE", "2048"))  # 0 disables the cache
+QUERY_EMBED_CACHE_TTL = float(os.environ.get("QUERY_EMBED_CACHE_TTL", "3600"))  # seconds
+
+ANSWER_CACHE_SIZE = int(os.environ.get("ANSWER_CACHE_SIZE", "512"))  # 0 disables the semantic answer cache
+ANSWER_CACHE_MAX_DISTANCE = float(os.environ.get("ANSWER_CACHE_MAX_DISTANCE", "0.05"))  # cosine distance
+ANSWER_CACHE_TTL = float(os.environ.get("ANSWER_CACHE_TTL", "3600"))  # seconds
+
+# Concurrent identical queries (same normalized text, top_k and retrieval settings) share one pipeline run
+QUERY_COALESCING = os.environ.get("QUERY_COALESCING", "1") == "1"
+
+# Two-stage Matryoshka retrieval: wide search on a MATRYOSHKA_DIM prefix, rerank with the full-dimension vectors
+MATRYOSHKA_DIM = int(os.environ.get("MATRYOSHKA_DIM", "0"))  # 0 = off, e.g. 256
+MATRYOSHKA_CANDIDATES = int(os.environ.get("MATRYOSHKA_CANDIDATES", "100"))
+
+# Document embedding batches are bounded by item count AND estimated tokens, and run in parallel
+EMBED_BATCH_MAX_ITEMS = int(os.environ.get("EMBED_BATCH_MAX_ITEMS", "100"))  # batchEmbedContents hard limit is 100
+EMBED_BATCH_MAX_TOKENS = int(os.environ.get("EMBED_BATCH_MAX_TOKENS", "20000"))
+EMBED_PARALLELISM = int(os.environ.get("EMBED_PARALLELISM", "4"))
+EMBED_RETRIES = int(os.environ.get("EMBED_RETRIES", "3"))
+EMBED_RETRY_BACKOFF = float(os.environ.get("EMBED_RETRY_BACKOFF", "1.0"))
+
+# Optional BM25 index built at ingest time, used by query mode="hybrid". It is kept in-process
+# (append-only JSON-lines log at SPARSE_INDEX_PATH): run a single uvicorn worker when it is enabled.
+SPARSE_INDEX_ENABLED = os.environ.get("SPARSE_INDEX_ENABLED", "0") == "1"
+SPARSE_INDEX_PATH = os.environ.get("SPARSE_INDEX_PATH", "sparse_index.jsonl")
+HYBRID_CANDIDATES = int(os.environ.get("HYBRID_CANDIDATES", "3"))  # each leg fetches top_k * this before fusion
+RRF_K = int(os.environ.get("RRF_K", "60"))
+
+# Context builder: merge adjacent chunks, strip their overlap, MMR-diversify, stop at the token budget.
+# Off by default: when on, hits beyond the budget are dropped and (with MMR_LAMBDA < 1) the retriever
+# also returns hit vectors.
+CONTEXT_BUILDER_ENABLED = os.environ.get("CONTEXT_BUILDER_ENABLED", "0") == "1"
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "3000"))
+MMR_LAMBDA = float(os.environ.get("MMR_LAMBDA", "0.7"))  # 1.0 = pure relevance, lower = more diversity
 
-doc_store = QdrantDocumentStore(
-    host=QDRANT_HOST,
-    port=QDRANT_PORT,
-    prefer_grpc=False,
-    index=COLLECTION,
-    embedding_dim=GEMINI_EMBED_DIM,
-    similarity="cosine"
-)
+# Extractive compression of the built context: keep only the sentences closest to the query
+CONTEXT_COMPRESSION = os.environ.get("CONTEXT_COMPRESSION", "none")  # none | lexical (BM25, local) | embedding
+COMPRESSION_TOKEN_BUDGET = int(os.environ.get("COMPRESSION_TOKEN_BUDGET", "800"))
+
+# Upper bounds on in-flight upstream calls per worker
+EMBED_CONCURRENCY = int(os.environ.get("RAG_EMBED_CONCURRENCY", "16"))
+SEARCH_CONCURRENCY = int(os.environ.get("RAG_SEARCH_CONCURRENCY", "32"))
+GENERATE_CONCURRENCY = int(os.environ.get("RAG_GENERATE_CONCURRENCY", "8"))
+
+# ---- batch queries (/query/batch) ----
+QUERY_BATCH_MAX_SIZE = int(os.environ.get("QUERY_BATCH_MAX_SIZE", "1000"))
+QUERY_BATCH_CONCURRENCY = int(os.environ.get("QUERY_BATCH_CONCURRENCY", "4"))  # generations in flight per batch
 
 # ================== GEMINI EMBEDDERS ==================
+def gemini_embed_batch(texts: List[str], model: str, task_type: str, dim: int, retries: int, retry_backoff: float) -> List[List[float]]:
+    """One batchEmbedContents call for texts, retried with linear backoff"""
+    for attempt in range(1, retries + 1):
+        metrics.call("gemini_embed")
+        try:
+            result = genai.embed_content(
+                model=model,
+                content=texts,                         # Batch supported natively
+                task_type=task_type,                   # ← Uppercase required now
+                output_dimensionality=dim
+            )
+            return result['embedding']
+        except Exception as e:
+            if attempt == retries:
+                metrics.failure("gemini_embed")
+                raise
+            metrics.retry("gemini_embed")
+            print(f"Embed batch of {len(texts)} failed (attempt {attempt}): {e} → retrying...")
+            time.sleep(retry_backoff * attempt)
+    raise RuntimeError("Unreachable")
+
+async def gemini_embed_batch_async(texts: List[str], model: str, task_type: str, dim: int, retries: int, retry_backoff: float) -> List[List[float]]:
+    for attempt in range(1, retries + 1):
+        metrics.call("gemini_embed")
+        try:
+            result = await genai.embed_content_async(
+                model=model,
+                content=texts,
+                task_type=task_type,
+                output_dimensionality=dim
+            )
+            return result['embedding']
+        except Exception as e:
+            if attempt == retries:
+                metrics.failure("gemini_embed")
+                raise
+            metrics.retry("gemini_embed")
+            print(f"Embed batch of {len(texts)} failed (attempt {attempt}): {e} → retrying...")
+            await asyncio.sleep(retry_backoff * attempt)
+    raise RuntimeError("Unreachable")
+
+def split_batches(texts: List[str], max_items: int, max_tokens: int) -> List[List[int]]:
+    """Group text indices into consecutive batches bounded by item count and estimated tokens"""
+    batches, current, current_tokens = [], [], 0
+    for i, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if current and (len(current) >= max_items or current_tokens + tokens > max_tokens):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
 class GeminiTextEmbedder:
-    def __init__(self, model: str = GEMINI_EMBED_MODEL, dim: int = GEMINI_EMBED_DIM):
+    task_type = "RETRIEVAL_QUERY"
+
+    def __init__(
+            self,
+            model: str = GEMINI_EMBED_MODEL,
+            dim: int = GEMINI_EMBED_DIM,
+            cache: Optional[LRUTTLCache] = None,
+    ):
         self.model = model
         self.dim = dim
+        self.cache = cache
+
+    def _cache_key(self, text: str):
+        return (normalize_query(text), self.model, self.dim, self.task_type)
 
-    def run(self, text: str) -> Dict[str, Any]:
-        result = genai.embed_content(
+    async def run_async(self, text: str) -> Dict[str, Any]:
+        key = self._cache_key(text)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return {"embedding": list(cached)}
+
+        metrics.call("gemini_embed")
+        result = await genai.embed_content_async(
             model=self.model,
             content=text,
-            task_type="RETRIEVAL_QUERY",          # ← Uppercase required now
+            task_type=self.task_type,
             output_dimensionality=self.dim
         )
-        # print("Embed response:", result)
 
         emb = result.get("embedding")
         if not emb:
             raise ValueError(f"Gemini embed_content returned no embedding: {result}")
+        if self.cache is not None:
+            self.cache.put(key, tuple(emb))
         return {"embedding": emb}
-        # return {"embedding": result['embedding']}
+
+    def _batch_lookup(self, texts: List[str]) -> Tuple[List[Optional[List[float]]], List[int]]:
+        embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        missing = []
+        for i, text in enumerate(texts):
+            cached = self.cache.get(self._cache_key(text)) if self.cache is not None else None
+            if cached is None:
+                missing.append(i)
+            else:
+                embeddings[i] = list(cached)
+        return embeddings, missing
+
+    def _batch_store(self, texts, embeddings, indices, vectors):
+        for i, emb in zip(indices, vectors):
+            embeddings[i] = emb
+            if self.cache is not None:
+                self.cache.put(self._cache_key(texts[i]), tuple(emb))
+
+    async def run_batch_async(self, texts: List[str]) -> Dict[str, Any]:
+        """
+        Embed many queries in as few batchEmbedContents calls as the limits allow (cache hits skipped).
+        Returns {"embeddings": [...], "errors": {index: message}}; a failed call leaves its items at None.
+        """
+        embeddings, missing = self._batch_lookup(texts)
+        errors: Dict[int, str] = {}
+
+        async def embed(batch: List[int]):
+            indices = [missing[j] for j in batch]
+            try:
+                vectors = await gemini_embed_batch_async(
+                    [texts[i] for i in indices], self.model, self.task_type, self.dim, EMBED_RETRIES, EMBED_RETRY_BACKOFF
+                )
+            except Exception as e:
+                errors.update({i: f"Embedding failed: {e}" for i in indices})
+                return
+            self._batch_store(texts, embeddings, indices, vectors)
+
+        await asyncio.gather(*(
+            embed(b) for b in split_batches([texts[i] for i in missing], EMBED_BATCH_MAX_ITEMS, EMBED_BATCH_MAX_TOKENS)
+        ))
+        return {"embeddings": embeddings, "errors": errors}
 
     def warm_up(self):
-        self.run("warmup query")
+        gemini_embed_batch(["warmup query"], self.model, self.task_type, self.dim, 1, 0)
 
 class GeminiDocumentEmbedder:
-    def __init__(self, model: str = GEMINI_EMBED_MODEL, dim: int = GEMINI_EMBED_DIM):
+    task_type = "RETRIEVAL_DOCUMENT"
+
+    def __init__(
+            self,
+            model: str = GEMINI_EMBED_MODEL,
+            dim: int = GEMINI_EMBED_DIM,
+            max_items: int = EMBED_BATCH_MAX_ITEMS,
+            max_tokens: int = EMBED_BATCH_MAX_TOKENS,
+            parallelism: int = EMBED_PARALLELISM,
+            retries: int = EMBED_RETRIES,
+            retry_backoff: float = EMBED_RETRY_BACKOFF,
+    ):
         self.model = model
         self.dim = dim
+        self.max_items = max_items
+        self.max_tokens = max_tokens
+        self.parallelism = max(1, parallelism)
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        return gemini_embed_batch(texts, self.model, self.task_type, self.dim, self.retries, self.retry_backoff)
+
+    async def _embed_batch_async(self, texts: List[str]) -> List[List[float]]:
+        return await gemini_embed_batch_async(texts, self.model, self.task_type, self.dim, self.retries, self.retry_backoff)
 
     def run(self, documents: List[Document]) -> Dict[str, List[Document]]:
         texts = [doc.content for doc in documents]
-        result = genai.embed_content(
-            model=self.model,
-            content=texts,                         # Batch supported natively
-            task_type="RETRIEVAL_DOCUMENT",        # ← Uppercase required now
-            output_dimensionality=self.dim
-        )
-        embeddings = result['embedding']
+        batches = split_batches(texts, self.max_items, self.max_tokens)
+        if not batches:
+            return {"documents": documents}
+
+        def embed(indices: List[int]):
+            return indices, self._embed_batch([texts[i] for i in indices])
+
+        if len(batches) == 1:
+            results = [embed(batches[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.parallelism, len(batches))) as pool:
+                results = list(pool.map(embed, batches))
 
-        for doc, emb in zip(documents, embeddings):
-            doc.embedding = emb
+        for indices, embeddings in results:
+            for i, emb in zip(indices, embeddings):
+                documents[i].embedding = emb
 
         return {"documents": documents}
 
+    async def run_async(self, documents: List[Document]) -> Dict[str, List[Document]]:
+        texts = [doc.content for doc in documents]
+        slots = asyncio.Semaphore(self.parallelism)
+
+        async def embed(indices: List[int]):
+            async with slots:
+                embeddings = await self._embed_batch_async([texts[i] for i in indices])
+            for i, emb in zip(indices, embeddings):
+                documents[i].embedding = emb
+
+        await asyncio.gather(*(embed(b) for b in split_batches(texts, self.max_items, self.max_tokens)))
+        return {"documents": documents}
+
     def warm_up(self):
         self.run([Document(content="warmup document")])
 
-# ================== RAG SERVICE ==================
-class RAGService:
-    def __init__(self, retriever, doc_store, text_embedder, doc_embedder):
-        self.retriever = retriever
-        self.doc_store = doc_store
-        self.text_embedder = text_embedder
-        self.doc_embedder = doc_embedder
+class DiskCachedDocumentEmbedder:
+    """
+    Wraps a document embedder with the shared persistent embedding cache (EMBED_CACHE_PATH):
+    only chunks whose (model, dim, task, text hash) is not on disk go to the embedding API.
+    """
 
-    def ingest(self, docs: List[Dict[str, Any]]):
-        hay_docs = []
-        for d in docs:
-            meta = d.get("meta", {})
-            id_str = f"{meta.get('title', '')}_{meta.get('chunk', '')}"
-            custom_id = hashlib.sha256(id_str.encode()).hexdigest()
-            hay_docs.append(Document(content=d["content"], meta=meta, id=custom_id))
+    def __init__(self, embedder, cache: EmbeddingCache):
+        self.embedder = embedder
+        self.cache = cache
+        self.model = embedder.model
+        self.dim = embedder.dim
+        self.task_type = embedder.task_type
+
+    def _apply_cached(self, documents: List[Document], vectors) -> List[Document]:
+        missing = []
+        for doc, vector in zip(documents, vectors):
+            if vector is None:
+                missing.append(doc)
+            else:
+                doc.embedding = vector
+        return missing
 
-        embedded_docs = self.doc_embedder.run(documents=hay_docs)["documents"]
-        self.doc_store.write_documents(embedded_docs, policy=DuplicatePolicy.OVERWRITE)
-
-    def delete(self, meta_filter: Dict[str, Any]):
-        conditions = [{"field": f"meta.{k}", "operator": "==", "value": v} for k, v in meta_filter.items()]
-        filters = {"operator": "AND", "conditions": conditions} if conditions else None
-        matching_docs = self.doc_store.filter_documents(filters=filters)
-        if matching_docs:
-            doc_ids = [doc.id for doc in matching_docs]
-            self.doc_store.delete_documents(document_ids=doc_ids)
-            return {"deleted": len(doc_ids)}
-        return {"deleted": 0}
-
-    def query(self, query_text: str, top_k: int = 10):
-        query_emb = self.text_embedder.run(text=query_text)["embedding"]
-        hits = self.retriever.run(query_embedding=query_emb, top_k=top_k)["documents"]
-        # print("Retriever hits:", hits)
-        context = "\n\n".join([h.content for h in hits])
-
-        # if not context.strip():
-        #     return {"answer": "No relevant information found in the knowledge base."}
-
-        prompt = f"""Use ONLY the following context to answer the question.
+    def _remember(self, embedded: List[Document]):
+        self.cache.put_many(
+            [d.content for d in embedded], [d.embedding for d in embedded], self.model, self.dim, self.task_type
+        )
+
+    def run(self, documents: List[Document]) -> Dict[str, List[Document]]:
+        vectors = self.cache.get_many([d.content for d in documents], self.model, self.dim, self.task_type)
+        missing = self._apply_cached(documents, vectors)
+        if missing:
+            self._remember(self.embedder.run(documents=missing)["documents"])
+        return {"documents": documents}
+
+    async def run_async(self, documents: List[Document]) -> Dict[str, List[Document]]:
+        vectors = await asyncio.to_thread(
+            self.cache.get_many, [d.content for d in documents], self.model, self.dim, self.task_type
+        )
+        missing = self._apply_cached(documents, vectors)
+        if missing:
+            embedded = (await self.embedder.run_async(documents=missing))["documents"]
+            await asyncio.to_thread(self._remember, embedded)
+        return {"documents": documents}
+
+    def warm_up(self):
+        self.embedder.warm_up()
+
+# ================== RAG SERVICE ==================
+def build_prompt(query_text: str, context: str) -> str:
+    # if not context.strip():
+    #     return {"answer": "No relevant information found in the knowledge base."}
+
+    return f"""Use ONLY the following context to answer the question.
 You MUST detect the language of the question below and respond ONLY in that language.
 If the context does not contain relevant information to answer the question, respond with 'В базе знаний не найдено соответствующей информации.'
 If the question asks for a table, return it as clean markdown (no code fences).
@@ -128,7 +360,7 @@ Question: {query_text}
 
 Answer:"""
 
-#         prompt = f"""Use ONLY the following context to answer the question.
+#     return f"""Use ONLY the following context to answer the question.
 # Do not add any information that is not present in the context.
 # If the context does not contain relevant information to answer the question, respond with 'No relevant information found in the knowledge base.'
 # If the question asks for a table, return it as clean markdown (no code fences).
@@ -141,19 +373,603 @@ Answer:"""
 #
 # Answer:"""
 
+class RAGService:
+    def __init__(
+            self,
+            retriever,
+            doc_store,
+            text_embedder,
+            doc_embedder,
+            answer_cache: Optional[SemanticAnswerCache] = None,
+            sparse_index: Optional[BM25Index] = None,
+            prefix_store=None,
+            single_flight: Optional[SingleFlight] = None,
+            compressor: Optional[SentenceCompressor] = None,
+            context_token_budget: Optional[int] = CONTEXT_TOKEN_BUDGET if CONTEXT_BUILDER_ENABLED else None,
+            embed_concurrency: int = EMBED_CONCURRENCY,
+            search_concurrency: int = SEARCH_CONCURRENCY,
+            generate_concurrency: int = GENERATE_CONCURRENCY,
+    ):
+        self.retriever = retriever
+        self.doc_store = doc_store
+        self.text_embedder = text_embedder
+        self.doc_embedder = doc_embedder
+        self.answer_cache = answer_cache
+        self.sparse_index = sparse_index
+        self.prefix_store = prefix_store
+        self.single_flight = single_flight
+        self.compressor = compressor
+        self.context_token_budget = context_token_budget
+        self.embed_slots = asyncio.Semaphore(embed_concurrency)
+        self.search_slots = asyncio.Semaphore(search_concurrency)
+        self.generate_slots = asyncio.Semaphore(generate_concurrency)
+
+    def _invalidate_answers(self):
+        if self.answer_cache is not None:
+            self.answer_cache.invalidate()
+
+    def _to_documents(self, docs: List[Dict[str, Any]]) -> List[Document]:
+        hay_docs = []
+        for d in docs:
+            meta = dict(d.get("meta", {}))
+            id_str = f"{meta.get('title', '')}_{meta.get('chunk', '')}"
+            custom_id = hashlib.sha256(id_str.encode()).hexdigest()
+            # Stored with the payload so re-ingesting unchanged chunks can skip the embed + write
+            meta["content_hash"] = hashlib.sha256(d["content"].encode()).hexdigest()
+            meta["embed_model"] = self.doc_embedder.model
+            meta["embed_dim"] = self.doc_embedder.dim
+            hay_docs.append(Document(content=d["content"], meta=meta, id=custom_id))
+        return hay_docs
+
+    @staticmethod
+    def _changed_documents(
+            hay_docs: List[Document],
+            stored_meta: Dict[str, Dict[str, Any]],
+            prefix_meta: Optional[Dict[str, Dict[str, Any]]] = None,
+    ) -> List[Document]:
+        """Drop documents whose stored meta (content hash, embedding model/dim and the rest) is unchanged
+        (and, with a Matryoshka sidecar, that already have their prefix vector)"""
+        changed = [doc for doc in hay_docs if stored_meta.get(doc.id) != doc.meta]
+        if prefix_meta is not None:
+            changed_ids = {doc.id for doc in changed}
+            changed += [doc for doc in hay_docs if doc.id not in prefix_meta and doc.id not in changed_ids]
+        return changed
+
+    def _cached_answer(self, query_emb: List[float], doc_ids: List[str]) -> Optional[Dict[str, Any]]:
+        if self.answer_cache is None:
+            return None
+        cached = self.answer_cache.lookup(query_emb, doc_ids)
+        if cached is None:
+            return None
+        return {"answer": cached["answer"], "cached": True}
+
+    def _remember_answer(self, query_emb, doc_ids, answer: str, started: float, cache_generation: Optional[int]):
+        if self.answer_cache is not None:
+            self.answer_cache.put(query_emb, doc_ids, answer, time.perf_counter() - started, generation=cache_generation)
+
+    @staticmethod
+    def _fuse(
+            dense_hits: List[Document],
+            sparse_hits: List[Tuple[str, float]],
+            by_id: Dict[str, Document],
+            top_k: int,
+            dense_weight: float,
+            sparse_weight: float,
+    ) -> List[Document]:
+        fused = reciprocal_rank_fusion(
+            [[h.id for h in dense_hits], [doc_id for doc_id, _ in sparse_hits]],
+            [dense_weight, sparse_weight],
+            k=RRF_K,
+        )
+        # Sparse hits can point at ids the vector store no longer has; those are dropped
+        return [dataclasses.replace(by_id[doc_id], score=score) for doc_id, score in fused if doc_id in by_id][:top_k]
+
+    @property
+    def _wants_embeddings(self) -> bool:
+        # Only MMR in the context builder needs the hit vectors; at lambda 1 it is plain relevance order
+        return self.context_token_budget is not None and MMR_LAMBDA < 1
+
+    def _build_context(self, query_emb: List[float], hits: List[Document]) -> Tuple[str, Dict[str, Any]]:
+        if self.context_token_budget is None:
+            context = "\n\n".join([h.content for h in hits])
+            tokens = estimate_tokens(context)
+            return context, {"tokens_before": tokens, "tokens_after": tokens}
+        return build_context(query_emb, hits, self.context_token_budget, MMR_LAMBDA)
+
+    async def _acompress(self, query_text: str, query_emb: List[float], context: str, context_stats: Dict[str, Any]) -> str:
+        if self.compressor is None:
+            return context
+        context, context_stats["compression"] = await self.compressor.acompress(query_text, query_emb, context)
+        return context
+
+    def _use_hybrid(self, mode: str) -> bool:
+        if mode not in ("dense", "hybrid"):
+            raise ValueError(f"Unknown retrieval mode: {mode}")
+        return mode == "hybrid" and self.sparse_index is not None
+
+    async def _aretrieve(
+            self,
+            query_text: str,
+            query_emb: List[float],
+            top_k: int,
+            mode: str = "dense",
+            dense_weight: float = 1.0,
+            sparse_weight: float = 1.0,
+    ) -> Tuple[List[Document], Dict[str, Any]]:
+        started = time.perf_counter()
+        if not self._use_hybrid(mode):
+            async with self.search_slots:
+                hits = (await self.retriever.run_async(
+                    query_embedding=query_emb, top_k=top_k, return_embedding=self._wants_embeddings,
+                ))["documents"]
+            return hits, {"mode": "dense", "dense_ms": round((time.perf_counter() - started) * 1000, 2)}
+
+        candidate_k = top_k * HYBRID_CANDIDATES
+        async with self.search_slots:
+            dense_hits = (await self.retriever.run_async(
+                query_embedding=query_emb, top_k=candidate_k, return_embedding=self._wants_embeddings,
+            ))["documents"]
+        dense_done = time.perf_counter()
+        sparse_hits = self.sparse_index.search(query_text, top_k=candidate_k)
+        sparse_done = time.perf_counter()
+
+        by_id = {h.id: h for h in dense_hits}
+        missing = [doc_id for doc_id, _ in sparse_hits if doc_id not in by_id]
+        if missing:
+            async with self.search_slots:
+                by_id.update({d.id: d for d in await self.doc_store.get_documents_by_id_async(missing)})
+        hits = self._fuse(dense_hits, sparse_hits, by_id, top_k, dense_weight, sparse_weight)
+        return hits, {
+            "mode": "hybrid",
+            "dense_ms": round((dense_done - started) * 1000, 2),
+            "sparse_ms": round((sparse_done - dense_done) * 1000, 2),
+            "fusion_ms": round((time.perf_counter() - sparse_done) * 1000, 2),
+        }
+
+    def _unindexed(self, hay_docs: List[Document], changed: List[Document]) -> List[Document]:
+        """Unchanged documents already in the dense store but missing from the BM25 index"""
+        if self.sparse_index is None:
+            return []
+        changed_ids = {doc.id for doc in changed}
+        return [doc for doc in hay_docs if doc.id not in changed_ids and doc.id not in self.sparse_index]
+
+    async def aingest(self, docs: List[Dict[str, Any]]):
+        hay_docs, changed = await self.aprepare_ingest(docs)
+        if changed:
+            await self.awrite_embedded(await self.aembed_documents(changed))
+        return {"embedded": len(changed), "skipped": len(hay_docs) - len(changed)}
+
+    # The three ingest stages, also driven separately by the background job pipeline (app/jobs.py)
+    async def aprepare_ingest(self, docs: List[Dict[str, Any]]) -> Tuple[List[Document], List[Document]]:
+        """All documents of the payload, and those that need (re-)embedding"""
+        hay_docs = self._to_documents(docs)
+        ids = [doc.id for doc in hay_docs]
+        async with self.search_slots:
+            stored_meta = await self.doc_store.get_meta_by_id_async(ids)
+            prefix_meta = await self.prefix_store.get_meta_by_id_async(ids) if self.prefix_store is not None else None
+        changed = self._changed_documents(hay_docs, stored_meta, prefix_meta)
+        unindexed = self._unindexed(hay_docs, changed)
+        if unindexed:
+            await self.sparse_index.add_async(unindexed)
+        return hay_docs, changed
+
+    async def aembed_documents(self, documents: List[Document]) -> List[Document]:
+        async with self.embed_slots:
+            with metrics.stage("ingest_embed"):
+                return (await self.doc_embedder.run_async(documents=documents))["documents"]
+
+    async def awrite_embedded(self, embedded_docs: List[Document]):
+        async with self.search_slots:
+            with metrics.stage("store_write"):
+                await self.doc_store.write_documents_async(embedded_docs, policy=DuplicatePolicy.OVERWRITE)
+                if self.prefix_store is not None:
+                    await self.prefix_store.write_documents_async(
+                        prefix_documents(embedded_docs, self.prefix_store.embedding_dim),
+                        policy=DuplicatePolicy.OVERWRITE,
+                    )
+        if self.sparse_index is not None:
+            await self.sparse_index.add_async(embedded_docs)
+        self._invalidate_answers()
+
+    async def adelete(self, meta_filter: Dict[str, Any], dry_run: bool = False):
+        async with self.search_slots:
+            if dry_run:
+                return {"deleted": 0, "matched": await self.doc_store.count_by_meta_async(meta_filter), "dry_run": True}
+            deleted = await self.doc_store.delete_by_meta_async(meta_filter)
+            if self.prefix_store is not None:
+                await self.prefix_store.delete_by_meta_async(meta_filter)
+        if self.sparse_index is not None:
+            await self.sparse_index.delete_by_meta_async(meta_filter)
+        if deleted:
+            self._invalidate_answers()
+        return {"deleted": deleted, "matched": deleted, "dry_run": False}
+
+    @staticmethod
+    def _flight_key(query_text: str, top_k: int, mode: str, dense_weight: float, sparse_weight: float, latency_budget):
+        return (normalize_query(query_text), top_k, mode, dense_weight, sparse_weight, latency_budget)
+
+    @staticmethod
+    def _generation_budget(request_started: float, latency_budget: Optional[float]) -> Optional[float]:
+        """What is left of the request's latency budget after embedding and retrieval"""
+        if latency_budget is None:
+            return None
+        return max(0.001, latency_budget - (time.perf_counter() - request_started))
+
+    @staticmethod
+    def _generation_info(result_or_error) -> Dict[str, Any]:
+        if isinstance(result_or_error, dict):
+            info = {"model": result_or_error["model"], "attempts": result_or_error["attempts"]}
+            if result_or_error.get("hedged"):
+                info["hedged"] = True
+            return info
+        return {"model": None, "attempts": getattr(result_or_error, "attempts", [])}
+
+    async def aquery(
+            self,
+            query_text: str,
+            top_k: int = 10,
+            mode: str = "dense",
+            dense_weight: float = 1.0,
+            sparse_weight: float = 1.0,
+            latency_budget: Optional[float] = None,
+    ):
+        args = (query_text, top_k, mode, dense_weight, sparse_weight, latency_budget)
+        if self.single_flight is None:
+            return await self._aquery(*args)
+        result, shared = await self.single_flight.ado(self._flight_key(*args), lambda: self._aquery(*args))
+        if shared:
+            metrics.coalesced("query")
+            return {**result, "coalesced": True}
+        return result
+
+    async def _aquery(
+            self,
+            query_text: str,
+            top_k: int,
+            mode: str,
+            dense_weight: float,
+            sparse_weight: float,
+            latency_budget: Optional[float] = None,
+    ):
+        request_started = time.perf_counter()
+        async with self.embed_slots:
+            with metrics.stage("query_embed"):
+                query_emb = (await self.text_embedder.run_async(text=query_text))["embedding"]
+        cache_generation = self.answer_cache.generation if self.answer_cache is not None else None
+        with metrics.stage("retrieval"):
+            hits, retrieval = await self._aretrieve(query_text, query_emb, top_k, mode, dense_weight, sparse_weight)
+        return await self._aanswer(
+            query_text, query_emb, hits, retrieval, cache_generation, lambda: self._generation_budget(request_started, latency_budget)
+        )
+
+    async def _aanswer(self, query_text: str, query_emb: List[float], hits: List[Document], retrieval: Dict[str, Any], cache_generation, budget=lambda: None):
+        """Answer cache, context, prompt and generation for retrieved hits (shared by aquery and aquery_batch)"""
+        doc_ids = [h.id for h in hits]
+        cached = self._cached_answer(query_emb, doc_ids)
+        if cached is not None:
+            return {**cached, "retrieval": retrieval}
+
+        with metrics.stage("prompt_build"):
+            context, context_stats = self._build_context(query_emb, hits)
+            context = await self._acompress(query_text, query_emb, context, context_stats)
+            prompt = build_prompt(query_text, context)
+
         try:
-            answer = generate_answer(prompt)
+            started = time.perf_counter()
+            async with self.generate_slots:
+                with metrics.stage("generation"), metrics.in_flight("generation"):
+                    generated = await agenerate(prompt, budget_seconds=budget())
         except Exception as e:
-            return {"answer": f"Generation failed: {str(e)}"}
-        return {"answer": answer}
-
-# Initialize
-text_embedder = GeminiTextEmbedder()
-doc_embedder = GeminiDocumentEmbedder()
-retriever = QdrantEmbeddingRetriever(document_store=doc_store)
-rag_service = RAGService(retriever=retriever, doc_store=doc_store, text_embedder=text_embedder, doc_embedder=doc_embedder)
-
-print("Warming up Gemini embedders...")
-text_embedder.warm_up()
-doc_embedder.warm_up()
-print(f"Using {GEMINI_EMBED_MODEL} @ {GEMINI_EMBED_DIM}-dim")
\ No newline at end of file
+            return {
+                "answer": f"Generation failed: {str(e)}",
+                "error": str(e),
+                "retrieval": retrieval,
+                "context": context_stats,
+                "generation": self._generation_info(e),
+            }
+        answer = generated["text"]
+        self._remember_answer(query_emb, doc_ids, answer, started, cache_generation)
+        return {"answer": answer, "retrieval": retrieval, "context": context_stats, "generation": self._generation_info(generated)}
+
+    async def aquery_stream(
+            self,
+            query_text: str,
+            top_k: int = 10,
+            mode: str = "dense",
+            dense_weight: float = 1.0,
+            sparse_weight: float = 1.0,
+            latency_budget: Optional[float] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streaming variant of aquery. Yields events in order:
+        one "retrieval" event with the hit metadata, "token" events as Gemini streams, then "done" (or "error").
+        latency_budget bounds the time to the first token.
+        """
+        request_started = time.perf_counter()
+        async with self.embed_slots:
+            with metrics.stage("query_embed"):
+                query_emb = (await self.text_embedder.run_async(text=query_text))["embedding"]
+        cache_generation = self.answer_cache.generation if self.answer_cache is not None else None
+        with metrics.stage("retrieval"):
+            hits, retrieval = await self._aretrieve(query_text, query_emb, top_k, mode, dense_weight, sparse_weight)
+        doc_ids = [h.id for h in hits]
+
+        yield {
+            "event": "retrieval",
+            "data": {
+                "documents": [
+                    {"id": h.id, "score": h.score, "title": (h.meta or {}).get("title")}
+                    for h in hits
+                ],
+                **retrieval,
+            },
+        }
+
+        cached = self._cached_answer(query_emb, doc_ids)
+        if cached is not None:
+            yield {"event": "token", "data": {"text": cached["answer"]}}
+            yield {"event": "done", "data": {"cached": True}}
+            return
+
+        with metrics.stage("prompt_build"):
+            context, context_stats = self._build_context(query_emb, hits)
+            context = await self._acompress(query_text, query_emb, context, context_stats)
+            prompt = build_prompt(query_text, context)
+        parts = []
+        generation: Dict[str, Any] = {}
+        try:
+            started = time.perf_counter()
+            async with self.generate_slots:
+                with metrics.stage("generation"), metrics.in_flight("generation"):
+                    async for text in generate_answer_stream_async(
+                            prompt,
+                            budget_seconds=self._generation_budget(request_started, latency_budget),
+                            info=generation,
+                    ):
+                        parts.append(text)
+                        yield {"event": "token", "data": {"text": text}}
+        except Exception as e:
+            yield {"event": "error", "data": {"detail": f"Generation failed: {str(e)}", "generation": generation}}
+            return
+        self._remember_answer(query_emb, doc_ids, "".join(parts).strip(), started, cache_generation)
+        yield {"event": "done", "data": {"cached": False, "context": context_stats, "generation": generation}}
+
+    # ---------- batch queries ----------
+    async def _adense_batch(self, query_embs: List[List[float]], top_k: int) -> List[List[Document]]:
+        """All dense searches in one call; haystack's QdrantEmbeddingRetriever has no batch API, so go via the store"""
+        if hasattr(self.retriever, "run_batch_async"):
+            return (await self.retriever.run_batch_async(query_embs, top_k=top_k, return_embedding=self._wants_embeddings))["documents"]
+        if hasattr(self.doc_store, "query_by_embeddings_async"):
+            return await self.doc_store.query_by_embeddings_async(query_embs, top_k, self._wants_embeddings)
+        return [
+            (await self.retriever.run_async(query_embedding=e, top_k=top_k, return_embedding=self._wants_embeddings))["documents"]
+            for e in query_embs
+        ]
+
+    def _sparse_batch(self, query_texts: List[str], dense: List[List[Document]], candidate_k: int):
+        """BM25 hits per query, and the ids they add that no dense result carries (fetched once for the whole batch)"""
+        sparse = [self.sparse_index.search(text, top_k=candidate_k) for text in query_texts]
+        known = {h.id for hits in dense for h in hits}
+        missing = list({doc_id for hits in sparse for doc_id, _ in hits if doc_id not in known})
+        return sparse, missing
+
+    def _fuse_batch(self, dense, sparse, fetched: List[Document], top_k: int, dense_weight: float, sparse_weight: float):
+        extra = {d.id: d for d in fetched}
+        return [
+            self._fuse(d, s, {**extra, **{h.id: h for h in d}}, top_k, dense_weight, sparse_weight)
+            for d, s in zip(dense, sparse)
+        ]
+
+    async def _aretrieve_batch(self, query_texts, query_embs, top_k, mode, dense_weight, sparse_weight):
+        if not self._use_hybrid(mode):
+            async with self.search_slots:
+                return await self._adense_batch(query_embs, top_k), {"mode": "dense", "batched": True}
+        async with self.search_slots:
+            dense = await self._adense_batch(query_embs, top_k * HYBRID_CANDIDATES)
+        sparse, missing = self._sparse_batch(query_texts, dense, top_k * HYBRID_CANDIDATES)
+        fetched = []
+        if missing:
+            async with self.search_slots:
+                fetched = await self.doc_store.get_documents_by_id_async(missing)
+        return self._fuse_batch(dense, sparse, fetched, top_k, dense_weight, sparse_weight), {"mode": "hybrid", "batched": True}
+
+    @staticmethod
+    def _hit_documents(hits: List[Document]) -> List[Dict[str, Any]]:
+        return [{"id": h.id, "score": h.score, "content": h.content, "meta": h.meta} for h in hits]
+
+    @staticmethod
+    def _batch_start(queries: List[str]) -> Tuple[List[Dict[str, Any]], List[int]]:
+        results = [{"index": i, "query": q} for i, q in enumerate(queries)]
+        valid = []
+        for i, q in enumerate(queries):
+            if q.strip():
+                valid.append(i)
+            else:
+                results[i]["error"] = "Empty query"
+        return results, valid
+
+    @staticmethod
+    def _batch_embedded(results, valid: List[int], embedded: Dict[str, Any]) -> Tuple[List[int], List[List[float]]]:
+        """Indices (into results) that got an embedding, and those embeddings; the rest get their error"""
+        ok, embs = [], []
+        for j, i in enumerate(valid):
+            if j in embedded["errors"]:
+                results[i]["error"] = embedded["errors"][j]
+            else:
+                ok.append(i)
+                embs.append(embedded["embeddings"][j])
+        return ok, embs
+
+    async def aquery_batch(
+            self,
+            queries: List[str],
+            top_k: int = 10,
+            mode: str = "dense",
+            dense_weight: float = 1.0,
+            sparse_weight: float = 1.0,
+            retrieval_only: bool = False,
+            concurrency: int = QUERY_BATCH_CONCURRENCY,
+    ) -> Dict[str, Any]:
+        """
+        Many queries at once: batched query embedding (up to EMBED_BATCH_MAX_ITEMS per call), one batched
+        vector search, then generation with at most `concurrency` in flight. Results keep the input order;
+        an item that fails carries "error" instead of failing the batch. retrieval_only returns the hits
+        and skips generation.
+        """
+        self._use_hybrid(mode)  # reject an unknown mode before any work
+        results, valid = self._batch_start(queries)
+        stats: Dict[str, Any] = {"size": len(queries)}
+
+        started = time.perf_counter()
+        async with self.embed_slots:
+            with metrics.stage("query_embed"):
+                embedded = await self.text_embedder.run_batch_async([queries[i] for i in valid])
+        ok, embs = self._batch_embedded(results, valid, embedded)
+        stats["embed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+        cache_generation = self.answer_cache.generation if self.answer_cache is not None else None
+        started = time.perf_counter()
+        try:
+            with metrics.stage("retrieval"):
+                hits, retrieval = await self._aretrieve_batch(
+                    [queries[i] for i in ok], embs, top_k, mode, dense_weight, sparse_weight
+                )
+        except Exception as e:
+            for i in ok:
+                results[i]["error"] = f"Retrieval failed: {e}"
+            return {"results": results, "stats": stats}
+        stats["retrieval_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+        if retrieval_only:
+            for i, item_hits in zip(ok, hits):
+                results[i].update({"documents": self._hit_documents(item_hits), "retrieval": retrieval})
+            return {"results": results, "stats": stats}
+
+        started = time.perf_counter()
+        slots = asyncio.Semaphore(max(1, concurrency))  # per batch, on top of the service-wide generate_slots
+
+        async def answer(i: int, emb: List[float], item_hits: List[Document]):
+            async with slots:
+                results[i].update(await self._aanswer(queries[i], emb, item_hits, retrieval, cache_generation))
+
+        await asyncio.gather(*(answer(i, emb, item_hits) for i, emb, item_hits in zip(ok, embs, hits)))
+        stats["generation_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return {"results": results, "stats": stats}
+
+    def cache_stats(self) -> Dict[str, Any]:
+        stats = {}
+        embed_cache = getattr(self.text_embedder, "cache", None)
+        if embed_cache is not None:
+            stats["query_embedding"] = embed_cache.stats()
+        if self.answer_cache is not None:
+            stats["answer"] = self.answer_cache.stats()
+        if self.single_flight is not None:
+            stats["coalescing"] = self.single_flight.stats()
+        if isinstance(self.doc_embedder, DiskCachedDocumentEmbedder):
+            stats["embedding_disk"] = self.doc_embedder.cache.stats()
+        return stats
+
+# ================== FACTORY ==================
+def _document_stores(embedding_dim: int):
+    """(doc_store, prefix_store) for the configured backend; haystack's Qdrant client connects on first use"""
+    if DOC_STORE_BACKEND == "local":
+        doc_store = LocalDocumentStore(
+            LOCAL_INDEX_PATH,
+            embedding_dim=embedding_dim,
+            dtype=LOCAL_INDEX_DTYPE,
+            quantization=VECTOR_QUANTIZATION,
+            oversampling=QUANT_OVERSAMPLING,
+            rescore=QUANT_RESCORE,
+            prefix_dim=MATRYOSHKA_DIM,
+        )
+        return doc_store, None
+    if DOC_STORE_BACKEND == "qdrant":
+        doc_store = KBQdrantDocumentStore(
+            host=QDRANT_HOST,
+            port=QDRANT_PORT,
+            prefer_grpc=False,
+            index=COLLECTION,
+            embedding_dim=embedding_dim,
+            similarity="cosine",
+            on_disk=VECTOR_QUANTIZATION != "none" and QUANT_ORIGINALS_ON_DISK,
+            quantization_config=qdrant_quantization_config(VECTOR_QUANTIZATION),
+            search_params=qdrant_search_params(VECTOR_QUANTIZATION, QUANT_OVERSAMPLING, QUANT_RESCORE),
+        )
+        # Sidecar collection with the prefix vectors, same point ids
+        prefix_store = KBQdrantDocumentStore(
+            host=QDRANT_HOST,
+            port=QDRANT_PORT,
+            prefer_grpc=False,
+            index=f"{COLLECTION}_mrl{MATRYOSHKA_DIM}",
+            embedding_dim=MATRYOSHKA_DIM,
+            similarity="cosine",
+        ) if MATRYOSHKA_DIM else None
+        return doc_store, prefix_store
+    raise ValueError(f"❌ Unknown DOC_STORE_BACKEND: {DOC_STORE_BACKEND} (expected qdrant or local)")
+
+def build_rag_service() -> RAGService:
+    """Construct clients and stores; no network calls besides what the stores do on construction"""
+    gemini_api_key = os.environ.get("GEMINI_API_KEY")
+    if not gemini_api_key:
+        raise ValueError("❌ GEMINI_API_KEY environment variable is required")
+    genai.configure(api_key=gemini_api_key)
+
+    query_embed_cache = LRUTTLCache(max_size=QUERY_EMBED_CACHE_SIZE, ttl_seconds=QUERY_EMBED_CACHE_TTL)
+    if RAG_EMBEDDER == "bge":
+        bge_client = BGEEmbeddingClient()  # one pooled session shared by query and document embedding
+        text_embedder = BGETextEmbedder(bge_client, cache=query_embed_cache)
+        doc_embedder = BGEDocumentEmbedder(bge_client)
+    elif RAG_EMBEDDER == "gemini":
+        text_embedder = GeminiTextEmbedder(cache=query_embed_cache)
+        doc_embedder = GeminiDocumentEmbedder()
+    else:
+        raise ValueError(f"❌ Unknown RAG_EMBEDDER: {RAG_EMBEDDER} (expected gemini or bge)")
+    embedding_cache = open_embedding_cache()
+    if embedding_cache is not None:
+        doc_embedder = DiskCachedDocumentEmbedder(doc_embedder, embedding_cache)
+    doc_store, prefix_store = _document_stores(doc_embedder.dim)
+
+    compressor = None
+    if CONTEXT_COMPRESSION != "none":
+        def embed_sentences(texts: List[str]) -> List[List[float]]:
+            return [d.embedding for d in doc_embedder.run(documents=[Document(content=t) for t in texts])["documents"]]
+
+        async def aembed_sentences(texts: List[str]) -> List[List[float]]:
+            docs = (await doc_embedder.run_async(documents=[Document(content=t) for t in texts]))["documents"]
+            return [d.embedding for d in docs]
+
+        compressor = SentenceCompressor(
+            CONTEXT_COMPRESSION, COMPRESSION_TOKEN_BUDGET, embed_fn=embed_sentences, aembed_fn=aembed_sentences
+        )
+    if MATRYOSHKA_DIM:
+        retriever = MatryoshkaRetriever(doc_store, MATRYOSHKA_DIM, MATRYOSHKA_CANDIDATES, prefix_store=prefix_store)
+    elif DOC_STORE_BACKEND == "local":
+        retriever = LocalEmbeddingRetriever(document_store=doc_store)
+    else:
+        retriever = QdrantEmbeddingRetriever(document_store=doc_store)
+    answer_cache = SemanticAnswerCache(
+        max_size=ANSWER_CACHE_SIZE,
+        max_distance=ANSWER_CACHE_MAX_DISTANCE,
+        ttl_seconds=ANSWER_CACHE_TTL,
+    )
+    print(f"Using {doc_embedder.model} @ {doc_embedder.dim}-dim")
+    return RAGService(
+        retriever=retriever,
+        doc_store=doc_store,
+        text_embedder=text_embedder,
+        doc_embedder=doc_embedder,
+        answer_cache=answer_cache,
+        sparse_index=BM25Index(SPARSE_INDEX_PATH) if SPARSE_INDEX_ENABLED else None,
+        prefix_store=prefix_store,
+        single_flight=SingleFlight() if QUERY_COALESCING else None,
+        compressor=compressor,
+    )
+
+def warm_up(service: RAGService):
+    """Open the store connection (creates the collection if needed) and prime the Gemini embedders"""
+    print("Warming up document store and Gemini embedders...")
+    service.doc_store.count_documents()
+    if service.prefix_store is not None:
+        service.prefix_store.count_documents()
+    service.text_embedder.warm_up()
+    service.doc_embedder.warm_up()
@@ -0,0 +1,177 @@
+import asyncio
+import heapq
+import json
+import math
+import os
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .document_store import meta_matches
+from .tokens import tokenize
+
+
+class BM25Index:
+    """
+    In-process BM25 index over ingested chunks, kept next to the vector store so exact-term
+    questions (article numbers, years, product codes) can be matched lexically.
+    Only term frequencies and meta are stored; documents are resolved through the doc store by id.
+
+    Persistence is an append-only JSON-lines log at `path` (one record per added document, one per
+    delete), replayed on load and compacted once it holds more than COMPACT_RATIO times the live
+    documents. The index lives in one process: run the service with a single worker when it is
+    enabled, otherwise each worker only sees its own writes until restart.
+    """
+
+    COMPACT_RATIO = 2
+    COMPACT_MIN_RECORDS = 1000
+
+    def __init__(self, path: Optional[str] = None, k1: float = 1.2, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()  # in-memory postings
+        self._log_lock = threading.Lock()  # serializes writers so the log order matches the memory order
+        self._doc_tf: Dict[str, Dict[str, int]] = {}
+        self._doc_meta: Dict[str, Dict[str, Any]] = {}
+        self._doc_len: Dict[str, int] = {}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._total_len = 0
+        self._log_records = 0
+        if path and os.path.exists(path):
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self._doc_tf)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._doc_tf
+
+    # ---------- persistence ----------
+    def _load(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"BM25 index {self.path}: skipping a truncated record")
+                    continue
+                self._log_records += 1
+                if "delete" in record:
+                    for doc_id in record["delete"]:
+                        self._remove(doc_id)
+                else:
+                    self._add(record["id"], record["tf"], record["meta"])
+        if self._needs_compaction():
+            self._compact()
+
+    def _needs_compaction(self) -> bool:
+        return self._log_records > max(self.COMPACT_MIN_RECORDS, self.COMPACT_RATIO * len(self._doc_tf))
+
+    @staticmethod
+    def _add_record(doc_id: str, tf: Dict[str, int], meta: Dict[str, Any]) -> str:
+        return json.dumps({"id": doc_id, "tf": tf, "meta": meta}, ensure_ascii=False) + "\n"
+
+    def _append(self, lines: List[str]):
+        """Called with _log_lock held"""
+        if not self.path or not lines:
+            return
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(lines)
+        self._log_records += len(lines)
+        if self._needs_compaction():
+            self._compact()
+
+    def _compact(self):
+        """Rewrite the log as one add record per live document"""
+        with self._lock:
+            docs = [(doc_id, tf, self._doc_meta[doc_id]) for doc_id, tf in self._doc_tf.items()]
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(self._add_record(*doc) for doc in docs)
+        os.replace(tmp_path, self.path)
+        self._log_records = len(docs)
+
+    def _add(self, doc_id: str, tf: Dict[str, int], meta: Dict[str, Any]):
+        self._remove(doc_id)
+        self._doc_tf[doc_id] = tf
+        self._doc_meta[doc_id] = meta
+        self._doc_len[doc_id] = sum(tf.values())
+        self._total_len += self._doc_len[doc_id]
+        for term, count in tf.items():
+            self._postings.setdefault(term, {})[doc_id] = count
+
+    def _remove(self, doc_id: str):
+        tf = self._doc_tf.pop(doc_id, None)
+        if tf is None:
+            return
+        self._doc_meta.pop(doc_id, None)
+        self._total_len -= self._doc_len.pop(doc_id)
+        for term in tf:
+            posting = self._postings.get(term)
+            if posting is not None:
+                posting.pop(doc_id, None)
+                if not posting:
+                    del self._postings[term]
+
+    def add(self, documents: Sequence[Any]):
+        """Index (or re-index) haystack Documents by id; call once they are in the dense store"""
+        entries = [(doc.id, dict(Counter(tokenize(doc.content or ""))), dict(doc.meta or {})) for doc in documents]
+        if not entries:
+            return
+        with self._log_lock:
+            with self._lock:
+                for entry in entries:
+                    self._add(*entry)
+            self._append([self._add_record(*entry) for entry in entries])
+
+    async def add_async(self, documents: Sequence[Any]):
+        await asyncio.to_thread(self.add, documents)
+
+    def delete_by_meta(self, meta_filter: Dict[str, Any]) -> int:
+        with self._log_lock:
+            with self._lock:
+                doc_ids = [doc_id for doc_id, meta in self._doc_meta.items() if meta_matches(meta, meta_filter)]
+                for doc_id in doc_ids:
+                    self._remove(doc_id)
+            if doc_ids:
+                self._append([json.dumps({"delete": doc_ids}, ensure_ascii=False) + "\n"])
+            return len(doc_ids)
+
+    async def delete_by_meta_async(self, meta_filter: Dict[str, Any]) -> int:
+        return await asyncio.to_thread(self.delete_by_meta, meta_filter)
+
+    def search(self, query_text: str, top_k: int = 10) -> List[Tuple[str, float]]:
+        terms = set(tokenize(query_text))
+        with self._lock:
+            n_docs = len(self._doc_tf)
+            if not n_docs or not terms:
+                return []
+            avg_len = self._total_len / n_docs or 1.0
+            scores: Dict[str, float] = {}
+            for term in terms:
+                posting = self._postings.get(term)
+                if not posting:
+                    continue
+                idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+                for doc_id, tf in posting.items():
+                    norm = tf + self.k1 * (1 - self.b + self.b * self._doc_len[doc_id] / avg_len)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+
+def reciprocal_rank_fusion(
+        rankings: Sequence[Sequence[str]],
+        weights: Sequence[float],
+        k: int = 60,
+) -> List[Tuple[str, float]]:
+    """Weighted RRF: score(d) = sum_i w_i / (k + rank_i(d)), ranks starting at 1"""
+    fused: Dict[str, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        if weight <= 0:
+            continue
+        for rank, doc_id in enumerate(ranking, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + weight / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
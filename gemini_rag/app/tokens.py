@@ -0,0 +1,11 @@
+import re
+from typing import List
+
+from shared.tokens import CHARS_PER_TOKEN, estimate_tokens  # re-exported for the app modules
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens (unicode-aware), used by the lexical scorers"""
+    return [t.casefold() for t in _WORD_RE.findall(text)]
@@ -0,0 +1,398 @@
+"""
+Offline load test / benchmark for the gemini_rag HTTP API.
+
+Starts main.app under uvicorn in this process, with Gemini replaced by GeminiStandIn and Qdrant by the
+local NumPy store (or drives an already running server with --url, stand-ins off). Then it runs the
+ingest, query and stream phases at the given concurrency. Per endpoint it reports QPS and p50/p95/p99
+latency; the stream phase also reports time to first token. Server-side mean latency per pipeline stage
+is read from GET /metrics. Results are written as JSON so runs of different versions can be compared.
+
+    python -m bench.benchmark --docs 2000 --queries 500 --concurrency 32 --out bench_results/main.json
+    python -m bench.benchmark --gen-latency 1.5 --error-rate 0.02 --compare bench_results/main.json --out bench_results/new.json
+
+Service knobs (VECTOR_QUANTIZATION, MATRYOSHKA_DIM, CONTEXT_COMPRESSION, ...) are read from the
+environment as usual and recorded in the results.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import httpx
+import numpy as np
+
+PHASES = ("ingest", "query", "stream")
+
+# Recorded with every run, so results are only compared like for like
+CONFIG_ENV = (
+    "DOC_STORE_BACKEND", "RAG_EMBEDDER", "GEMINI_EMBED_DIM", "GEMINI_MODEL", "GEN_FALLBACK_MODELS",
+    "GEN_LATENCY_BUDGET", "GEN_HEDGE_AFTER", "VECTOR_QUANTIZATION", "MATRYOSHKA_DIM", "SPARSE_INDEX_ENABLED",
+    "CONTEXT_BUILDER_ENABLED", "CONTEXT_COMPRESSION", "QUERY_COALESCING", "ANSWER_CACHE_SIZE",
+    "RAG_EMBED_CONCURRENCY", "RAG_SEARCH_CONCURRENCY", "RAG_GENERATE_CONCURRENCY",
+)
+
+
+# ================== WORKLOAD ==================
+def _vocabulary(size: int, rng: random.Random) -> List[str]:
+    syllables = ["ka", "lo", "mi", "ne", "ru", "sa", "ti", "vo", "ze", "ba", "de", "fi", "go", "hu", "pa"]
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def synthetic_corpus(n_docs: int, words_per_doc: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Documents over a Zipf-ish vocabulary, so BM25 and dense hits behave roughly like real text"""
+    rng = random.Random(seed)
+    vocab = _vocabulary(5000, rng)
+    weights = [1 / (rank + 1) for rank in range(len(vocab))]
+    docs = []
+    for i in range(n_docs):
+        words = rng.choices(vocab, weights=weights, k=words_per_doc)
+        sentences = [" ".join(words[j:j + 12]).capitalize() + "." for j in range(0, len(words), 12)]
+        docs.append({"content": " ".join(sentences), "meta": {"title": f"bench_{i}.txt", "source": "benchmark"}})
+    return docs
+
+
+def synthetic_queries(corpus: List[Dict[str, Any]], n: int, seed: int = 0) -> List[str]:
+    """Distinct queries made of words from random corpus documents (no answer-cache hits)"""
+    rng = random.Random(seed + 1)
+    queries = []
+    for i in range(n):
+        words = rng.choice(corpus)["content"].rstrip(".").split()
+        start = rng.randrange(max(1, len(words) - 8))
+        queries.append(f"What about {' '.join(words[start:start + 6]).lower()}? #{i}")
+    return queries
+
+
+# ================== MEASUREMENT ==================
+def summarize(values_ms: List[float]) -> Dict[str, float]:
+    if not values_ms:
+        return {}
+    values = np.asarray(values_ms)
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "mean": round(float(values.mean()), 2),
+        "p50": round(float(p50), 2),
+        "p95": round(float(p95), 2),
+        "p99": round(float(p99), 2),
+        "max": round(float(values.max()), 2),
+    }
+
+
+async def scrape_stages(client: httpx.AsyncClient) -> Dict[str, Tuple[float, float]]:
+    """{stage: (sum_seconds, count)} of pipeline_stage_seconds, empty if /metrics is unavailable"""
+    from prometheus_client.parser import text_string_to_metric_families
+    try:
+        resp = await client.get("/metrics")
+        resp.raise_for_status()
+    except httpx.HTTPError:
+        return {}
+    stages: Dict[str, List[float]] = {}
+    for family in text_string_to_metric_families(resp.text):
+        if family.name != "pipeline_stage_seconds":
+            continue
+        for sample in family.samples:
+            if sample.labels.get("service") != "gemini_rag":
+                continue
+            totals = stages.setdefault(sample.labels["stage"], [0.0, 0.0])
+            if sample.name.endswith("_sum"):
+                totals[0] = sample.value
+            elif sample.name.endswith("_count"):
+                totals[1] = sample.value
+    return {stage: (s, c) for stage, (s, c) in stages.items()}
+
+
+def stage_means(before: Dict[str, Tuple[float, float]], after: Dict[str, Tuple[float, float]]) -> Dict[str, float]:
+    means = {}
+    for stage, (total, count) in after.items():
+        prev_total, prev_count = before.get(stage, (0.0, 0.0))
+        if count > prev_count:
+            means[stage] = round((total - prev_total) / (count - prev_count) * 1000, 2)
+    return means
+
+
+async def send_ingest(client: httpx.AsyncClient, batch: List[Dict[str, Any]]) -> Tuple[bool, Optional[float]]:
+    resp = await client.post("/ingest", json=batch)
+    return resp.status_code == 200, None
+
+
+def query_sender(top_k: int, mode: str, latency_budget: Optional[float]) -> Callable:
+    def body(query: str) -> Dict[str, Any]:
+        return {"query": query, "top_k": top_k, "mode": mode, "latency_budget": latency_budget}
+
+    async def send_query(client: httpx.AsyncClient, query: str) -> Tuple[bool, Optional[float]]:
+        resp = await client.post("/query", json=body(query))
+        return resp.status_code == 200, None
+
+    async def send_stream(client: httpx.AsyncClient, query: str) -> Tuple[bool, Optional[float]]:
+        """ok, and seconds to the first token event"""
+        started = time.perf_counter()
+        first_token, event = None, None
+        async with client.stream("POST", "/query/stream", json=body(query)) as resp:
+            if resp.status_code != 200:
+                return False, None
+            async for line in resp.aiter_lines():
+                if line.startswith("event: "):
+                    event = line[7:]
+                    if event == "token" and first_token is None:
+                        first_token = time.perf_counter() - started
+                    elif event == "error":
+                        return False, first_token
+        return event == "done", first_token
+
+    return send_query, send_stream
+
+
+async def run_phase(
+        client: httpx.AsyncClient,
+        payloads: Iterable[Any],
+        send: Callable,
+        concurrency: int,
+) -> Dict[str, Any]:
+    """Send every payload with `concurrency` requests in flight; latency and error stats of the phase"""
+    pending = iter(payloads)
+    latencies, first_tokens = [], []
+    errors = 0
+    stages_before = await scrape_stages(client)
+
+    async def worker():
+        nonlocal errors
+        for payload in pending:  # shared iterator: each payload goes to exactly one worker
+            started = time.perf_counter()
+            try:
+                ok, first_token = await send(client, payload)
+            except httpx.HTTPError:
+                ok, first_token = False, None
+            latencies.append((time.perf_counter() - started) * 1000)
+            if first_token is not None:
+                first_tokens.append(first_token * 1000)
+            errors += not ok
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    stats = {
+        "requests": len(latencies),
+        "errors": errors,
+        "error_rate": round(errors / len(latencies), 4) if latencies else 0.0,
+        "seconds": round(elapsed, 3),
+        "qps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": summarize(latencies),
+    }
+    if first_tokens:
+        stats["ttft_ms"] = summarize(first_tokens)
+    stages = stage_means(stages_before, await scrape_stages(client))
+    if stages:
+        stats["stages_ms"] = stages
+    return stats
+
+
+# ================== SERVER ==================
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_local_server(args, workdir: str):
+    """main.app on a free port with the stand-ins installed; returns (url, (uvicorn server, thread), stand-in)"""
+    if args.store == "local":
+        os.environ["DOC_STORE_BACKEND"] = "local"
+        os.environ["LOCAL_INDEX_PATH"] = os.path.join(workdir, "local_index")
+    else:
+        os.environ["QDRANT_COLLECTION"] = args.collection  # never the production collection
+    os.environ["SPARSE_INDEX_PATH"] = os.path.join(workdir, "sparse_index.jsonl")
+    os.environ.setdefault("GEMINI_API_KEY", "standin")
+    if args.embedder == "bge":
+        from .bge_standin import serve_in_background
+        bge = serve_in_background(dim=int(os.environ.get("BGE_EMBED_DIM", "1024")), latency=args.embed_latency)
+        os.environ["RAG_EMBEDDER"] = "bge"
+        os.environ["BGE_EMBED_URL"] = f"http://127.0.0.1:{bge.server_port}/embed"
+
+    from .gemini_standin import GeminiStandIn
+    standin = GeminiStandIn(
+        embed_latency=args.embed_latency,
+        generate_latency=args.gen_latency,
+        chunk_latency=args.chunk_latency,
+        answer_words=args.answer_words,
+        error_rate=args.error_rate,
+    ).install()
+
+    import uvicorn
+    import main
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}", (server, thread), standin
+
+
+async def wait_ready(client: httpx.AsyncClient, timeout: float = 300):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/readyz")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.2)
+    raise TimeoutError(f"Service not ready after {timeout}s")
+
+
+# ================== REPORT ==================
+def _version() -> Dict[str, Any]:
+    def git(*cmd):
+        try:
+            return subprocess.run(["git", *cmd], capture_output=True, text=True, timeout=10).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return ""
+    return {"commit": git("rev-parse", "--short", "HEAD"), "dirty": bool(git("status", "--porcelain", "--", "."))}
+
+
+def _change(old: float, new: float) -> str:
+    return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Print a side-by-side of QPS and latency percentiles; returns the regressions beyond `threshold` %"""
+    regressions = []
+    print(f"\nvs {baseline['version'].get('commit') or '?'} ({baseline['timestamp']}):")
+    for phase, new in current["results"].items():
+        old = baseline["results"].get(phase)
+        if not old:
+            continue
+        print(f"  {phase:<7} qps {old['qps']:>9.2f}   → {new['qps']:>9.2f}   ({_change(old['qps'], new['qps'])})")
+        if old["qps"] and (old["qps"] - new["qps"]) / old["qps"] * 100 > threshold:
+            regressions.append(f"{phase} qps")
+        for p in ("p50", "p95", "p99"):
+            before, after = old["latency_ms"].get(p, 0), new["latency_ms"].get(p, 0)
+            print(f"          {p} {before:>9.2f}ms → {after:>9.2f}ms ({_change(before, after)})")
+            if p == "p95" and before and (after - before) / before * 100 > threshold:
+                regressions.append(f"{phase} p95")
+    return regressions
+
+
+def print_results(results: Dict[str, Dict[str, Any]]):
+    for phase, stats in results.items():
+        lat = stats["latency_ms"]
+        line = (f"{phase:<7} {stats['requests']:>6} req  {stats['qps']:>8} qps  "
+                f"p50 {lat.get('p50')}ms  p95 {lat.get('p95')}ms  p99 {lat.get('p99')}ms  errors {stats['errors']}")
+        if "ttft_ms" in stats:
+            line += f"  ttft p50 {stats['ttft_ms']['p50']}ms"
+        print(line)
+        if "stages_ms" in stats:
+            print("        " + "  ".join(f"{k} {v}ms" for k, v in sorted(stats["stages_ms"].items())))
+
+
+async def run(args, url: str) -> Dict[str, Dict[str, Any]]:
+    corpus = synthetic_corpus(args.docs, args.doc_words, args.seed)
+    queries = synthetic_queries(corpus, 2 * args.queries, args.seed)  # separate halves: no cross-phase cache hits
+    batches = [corpus[i:i + args.ingest_batch] for i in range(0, len(corpus), args.ingest_batch)]
+    send_query, send_stream = query_sender(args.top_k, args.mode, args.latency_budget)
+    phases = {
+        "ingest": (batches, send_ingest),
+        "query": (queries[:args.queries], send_query),
+        "stream": (queries[args.queries:], send_stream),
+    }
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    results = {}
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits) as client:
+        await wait_ready(client)
+        for phase in args.phases:
+            payloads, send = phases[phase]
+            print(f"→ {phase}: {len(payloads)} requests at concurrency {args.concurrency}")
+            results[phase] = await run_phase(client, payloads, send, args.concurrency)
+            if phase == "ingest":
+                results[phase]["docs_per_s"] = round(len(corpus) / results[phase]["seconds"], 1)
+        if "ingest" in args.phases and (args.url or args.store != "local") and not args.keep:
+            await client.request("DELETE", "/delete", json={"meta_filter": {"source": "benchmark"}})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="benchmark a running server instead (no stand-ins, real quota)")
+    parser.add_argument("--phases", default="ingest,query,stream", help=f"comma-separated subset of {PHASES}")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--docs", type=int, default=1000)
+    parser.add_argument("--doc-words", type=int, default=250)
+    parser.add_argument("--ingest-batch", type=int, default=20, help="documents per /ingest request")
+    parser.add_argument("--queries", type=int, default=300, help="requests per query phase")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--mode", choices=["dense", "hybrid"], default="dense")
+    parser.add_argument("--latency-budget", type=float, default=None, help="per-query latency_budget seconds")
+    parser.add_argument("--timeout", type=float, default=120, help="client timeout per request, seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    # stand-ins
+    parser.add_argument("--store", choices=["local", "qdrant"], default="local",
+                        help="local = in-process NumPy index in a temp dir; qdrant = QDRANT_HOST/PORT")
+    parser.add_argument("--collection", default="kb_bench", help="Qdrant collection used with --store qdrant")
+    parser.add_argument("--embedder", choices=["gemini", "bge"], default="gemini",
+                        help="which embedding API the stand-in impersonates")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="seconds per embedding call")
+    parser.add_argument("--gen-latency", type=float, default=0.8, help="seconds to the first generated token")
+    parser.add_argument("--chunk-latency", type=float, default=0.02, help="seconds between streamed chunks")
+    parser.add_argument("--answer-words", type=int, default=120)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of Gemini calls that fail")
+    # output
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--keep", action="store_true", help="do not delete benchmark documents afterwards")
+    parser.add_argument("--compare", help="baseline results JSON to compare against")
+    parser.add_argument("--fail-on-regression", type=float, default=None, metavar="PCT",
+                        help="exit 1 if p95 grows or QPS drops by more than PCT %% vs --compare")
+    args = parser.parse_args()
+    args.phases = [p.strip() for p in args.phases.split(",") if p.strip()]
+    unknown = set(args.phases) - set(PHASES)
+    if unknown:
+        parser.error(f"unknown phases: {', '.join(sorted(unknown))}")
+
+    with tempfile.TemporaryDirectory(prefix="rag_bench_") as workdir:
+        server = standin = None
+        url = args.url
+        if not url:
+            url, server, standin = start_local_server(args, workdir)
+        try:
+            results = asyncio.run(run(args, url))
+        finally:
+            if server is not None:
+                server[0].should_exit = True
+                server[1].join(timeout=10)
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "version": _version(),
+        "args": {k: v for k, v in vars(args).items() if k not in ("out", "compare", "fail_on_regression")},
+        "env": {k: os.environ[k] for k in CONFIG_ENV if k in os.environ},
+        "standin_calls": standin.calls if standin else None,
+        "results": results,
+    }
+    print_results(results)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"Results saved to {args.out}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.fail_on_regression or 0)
+        if args.fail_on_regression is not None and regressions:
+            print(f"❌ Regressions beyond {args.fail_on_regression}%: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
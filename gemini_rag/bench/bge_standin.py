@@ -0,0 +1,89 @@
+"""
+Local stand-in for the BGE embedding endpoint, for exercising BGEEmbeddingClient without the real service.
+
+Returns deterministic unit vectors (hash-seeded per text) in the provider's response shape, and can
+simulate per-request latency, a maximum batch size (413 above it) and a rate of 503s.
+
+    python -m bench.bge_standin --port 8089 --dim 1024 --latency 0.05 --max-batch 64 --error-rate 0.05
+    BGE_EMBED_URL=http://127.0.0.1:8089/embed RAG_EMBEDDER=bge uvicorn main:app
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+
+def fake_embedding(text: str, dim: int) -> list:
+    seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+    vector = np.random.default_rng(seed).normal(size=dim)
+    return (vector / np.linalg.norm(vector)).round(6).tolist()
+
+
+def make_server(
+        host: str = "127.0.0.1",
+        port: int = 0,
+        dim: int = 1024,
+        latency: float = 0.0,
+        max_batch: int = 0,
+        error_rate: float = 0.0,
+) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, so connection reuse is observable
+
+        def _reply(self, status: int, body: dict):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_POST(self):
+            texts = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))["inputs"]
+            server.requests += 1
+            server.connections.add(self.client_address)
+            if latency:
+                time.sleep(latency * (1 + len(texts) / 32))
+            if max_batch and len(texts) > max_batch:
+                return self._reply(413, {"error": f"batch of {len(texts)} exceeds {max_batch}"})
+            if error_rate and random.random() < error_rate:
+                return self._reply(503, {"error": "simulated overload"})
+            self._reply(200, {"embeddings": [fake_embedding(t, dim) for t in texts]})
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.requests = 0
+    server.connections = set()
+    return server
+
+
+def serve_in_background(**kwargs) -> ThreadingHTTPServer:
+    """Start a stand-in on a free port; its URL is f"http://127.0.0.1:{server.server_port}/embed" """
+    server = make_server(**kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--latency", type=float, default=0.0, help="base seconds per request")
+    parser.add_argument("--max-batch", type=int, default=0, help="413 above this many inputs, 0 = unlimited")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    args = parser.parse_args()
+    server = make_server(args.host, args.port, args.dim, args.latency, args.max_batch, args.error_rate)
+    print(f"BGE stand-in on http://{args.host}:{server.server_port}/embed")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
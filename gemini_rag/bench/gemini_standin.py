@@ -0,0 +1,145 @@
+"""
+In-process stand-in for the Gemini API (embeddings and generation), for load tests without spending quota.
+
+`GeminiStandIn(...).install()` swaps `genai.embed_content`, `genai.embed_content_async` and
+`genai.GenerativeModel` for fakes with configurable latency and error rate, so every path of RAGService
+and the generator (async, streaming, retries, model fallback) runs unchanged. Embeddings are
+deterministic per text (see bge_standin.fake_embedding); answers are filler text of a fixed length.
+"""
+import asyncio
+import random
+import threading
+import time
+from types import SimpleNamespace
+from typing import List
+
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+
+from app import generator
+from .bge_standin import fake_embedding
+
+_FILLER = (
+    "The retrieved context describes the requested topic in detail and the answer follows it closely "
+    "without adding facts that are not present in the provided passages"
+).split()
+
+
+def _jitter(seconds: float) -> float:
+    return seconds * random.uniform(0.8, 1.2) if seconds > 0 else 0.0
+
+
+def _timeout(request_options) -> float:
+    return (request_options or {}).get("timeout") or float("inf")
+
+
+def _response(text: str, prompt_tokens: int, answer_tokens: int):
+    part = SimpleNamespace(text=text)
+    return SimpleNamespace(
+        candidates=[SimpleNamespace(content=SimpleNamespace(parts=[part]))],
+        usage_metadata=SimpleNamespace(prompt_token_count=prompt_tokens, candidates_token_count=answer_tokens),
+    )
+
+
+class GeminiStandIn:
+    """
+    embed_latency / generate_latency: mean seconds per embed call / until the first generated token
+    (±20% jitter). stream_chunks answer chunks follow, chunk_latency apart. error_rate: fraction of
+    calls failing with ServiceUnavailable. Calls whose latency exceeds their request timeout raise
+    DeadlineExceeded after the timeout, like the real client.
+    """
+
+    def __init__(
+            self,
+            embed_latency: float = 0.05,
+            generate_latency: float = 0.8,
+            chunk_latency: float = 0.02,
+            stream_chunks: int = 8,
+            answer_words: int = 120,
+            error_rate: float = 0.0,
+    ):
+        self.embed_latency = embed_latency
+        self.generate_latency = generate_latency
+        self.chunk_latency = chunk_latency
+        self.stream_chunks = max(1, stream_chunks)
+        self.answer_words = answer_words
+        self.error_rate = error_rate
+        self.calls = {"embed": 0, "generate": 0, "errors": 0}
+        self._lock = threading.Lock()
+        self._originals = None
+
+    def _count(self, kind: str) -> bool:
+        """Count a call; True if it should fail"""
+        fail = self.error_rate > 0 and random.random() < self.error_rate
+        with self._lock:
+            self.calls[kind] += 1
+            self.calls["errors"] += fail
+        return fail
+
+    def _answer(self) -> List[str]:
+        words = [_FILLER[i % len(_FILLER)] for i in range(self.answer_words)]
+        size = -(-len(words) // self.stream_chunks)
+        return [" ".join(words[i:i + size]) + " " for i in range(0, len(words), size)]
+
+    def _fail_or_embed(self, content, dim):
+        if self._count("embed"):
+            raise google_exceptions.ServiceUnavailable("stand-in: simulated overload")
+        dim = dim or 768
+        if isinstance(content, str):
+            return {"embedding": fake_embedding(content, dim)}
+        return {"embedding": [fake_embedding(text, dim) for text in content]}
+
+    def embed_content(self, model=None, content=None, task_type=None, output_dimensionality=None, **kwargs):
+        time.sleep(_jitter(self.embed_latency))
+        return self._fail_or_embed(content, output_dimensionality)
+
+    async def embed_content_async(self, model=None, content=None, task_type=None, output_dimensionality=None, **kwargs):
+        await asyncio.sleep(_jitter(self.embed_latency))
+        return self._fail_or_embed(content, output_dimensionality)
+
+    def install(self) -> "GeminiStandIn":
+        self._originals = (genai.embed_content, genai.embed_content_async, genai.GenerativeModel)
+        genai.embed_content = self.embed_content
+        genai.embed_content_async = self.embed_content_async
+        genai.GenerativeModel = lambda name, *args, **kwargs: _StandInModel(self, name)
+        generator._models.clear()  # drop real models created before install
+        return self
+
+    def uninstall(self):
+        if self._originals:
+            genai.embed_content, genai.embed_content_async, genai.GenerativeModel = self._originals
+            generator._models.clear()
+            self._originals = None
+
+
+class _StandInModel:
+    """genai.GenerativeModel look-alike backed by a GeminiStandIn"""
+
+    def __init__(self, standin: GeminiStandIn, name: str):
+        self.standin = standin
+        self.model_name = name
+
+    def _check(self, latency: float, timeout: float):
+        if latency > timeout:
+            raise google_exceptions.DeadlineExceeded(f"stand-in: {self.model_name} exceeded {timeout:.2f}s")
+        if self.standin._count("generate"):
+            raise google_exceptions.ServiceUnavailable(f"stand-in: {self.model_name} overloaded")
+
+    def _response(self, text: str, prompt: str):
+        return _response(text, len(prompt) // 4, self.standin.answer_words)
+
+    async def generate_content_async(self, prompt, generation_config=None, request_options=None, stream=False):
+        latency, timeout = _jitter(self.standin.generate_latency), _timeout(request_options)
+        await asyncio.sleep(min(latency, timeout))
+        self._check(latency, timeout)
+        chunks = self.standin._answer()
+        if not stream:
+            return self._response("".join(chunks), prompt)
+
+        async def chunk_stream():
+            for i, chunk in enumerate(chunks):
+                if i:
+                    await asyncio.sleep(_jitter(self.standin.chunk_latency))
+                yield self._response(chunk, prompt)
+
+        return chunk_stream()
@@ -1,12 +1,42 @@
 from dotenv import load_dotenv
 load_dotenv()
 
-from fastapi import FastAPI, HTTPException
+import os
+import json
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any
-from app.rag_service import rag_service
+from typing import List, Dict, Any, Literal, Optional
+from app.jobs import IngestJobQueue, QueueFull
+from app.lifecycle import LazyService
+from app.metrics import metrics
+from app.ndjson import StreamError, decompressor, iter_ndjson, stream_ingest
 
-app = FastAPI()
+def _build():
+    # haystack / genai / qdrant imports happen here, off the boot path
+    from app.rag_service import build_rag_service
+    return build_rag_service()
+
+def _warm_up(service):
+    from app.rag_service import warm_up
+    warm_up(service)
+
+# RAG_WARMUP=0 marks the worker ready as soon as clients are built (first requests then pay the cold start)
+RAG_WARMUP = os.environ.get("RAG_WARMUP", "1") == "1"
+
+rag = LazyService(_build, _warm_up if RAG_WARMUP else None)
+jobs = IngestJobQueue(rag.aget)  # POST /ingest?background=true
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    rag.start_background()  # server binds right away, build + warm-up continue in the background
+    jobs.start()
+    yield
+    await jobs.stop()
+
+app = FastAPI(lifespan=lifespan)
+metrics.instrument(app)  # GET /metrics
 
 class IngestDoc(BaseModel):
     content: str
@@ -15,30 +45,152 @@ class IngestDoc(BaseModel):
 class QueryRequest(BaseModel):
     query: str
     top_k: int = 5
+    mode: Literal["dense", "hybrid"] = "dense"  # hybrid = dense + BM25 fused with RRF
+    dense_weight: float = 1.0
+    sparse_weight: float = 1.0
+    latency_budget: Optional[float] = None  # seconds for the whole query; generation falls back to faster models to meet it
+
+class BatchQueryRequest(BaseModel):
+    queries: List[str]
+    top_k: int = 5
+    mode: Literal["dense", "hybrid"] = "dense"
+    dense_weight: float = 1.0
+    sparse_weight: float = 1.0
+    retrieval_only: bool = False  # return the hits, skip generation
+    concurrency: Optional[int] = None  # generations in flight for this batch, default QUERY_BATCH_CONCURRENCY
+
+# Same default as app.rag_service, read here so oversized batches are rejected without building the service
+QUERY_BATCH_MAX_SIZE = int(os.environ.get("QUERY_BATCH_MAX_SIZE", "1000"))
 
 class DeleteRequest(BaseModel):
-    meta_filter: Dict[str, Any]  # e.g., {"title": "test_data.txt"}
+    meta_filter: Dict[str, Any]  # e.g., {"title": "test_data.txt"} or {"source": "a.txt", "chunk": {">=": 5}}
+    dry_run: bool = False  # only count what would be deleted
 
 @app.post("/ingest")
-def ingest(docs: List[IngestDoc]):
+async def ingest(docs: List[IngestDoc], background: bool = False):
+    payload = [{"content": d.content, "meta": d.meta} for d in docs]
+    if background:
+        # Enqueue and return right away; poll GET /jobs/{job_id} for progress
+        try:
+            job = jobs.submit(payload)
+        except QueueFull as e:
+            raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+        except ValueError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        return JSONResponse(status_code=202, content={"status": "queued", "job_id": job.id, "total": job.total})
+    try:
+        rag_service = await rag.aget()
+        result = await rag_service.aingest(payload)
+        return {"status": "ok", "ingested": len(payload), **result}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/ingest/stream")
+async def ingest_stream(request: Request):
+    """
+    Bulk ingest of an NDJSON body ({"content", "meta"} per line), optionally Content-Encoding gzip or zstd.
+    Lines are parsed as they arrive and ingested in micro-batches, so memory does not grow with the upload.
+    """
+    encoding = request.headers.get("content-encoding")
     try:
-        payload = [{"content": d.content, "meta": d.meta} for d in docs]
-        rag_service.ingest(payload)
-        return {"status": "ok", "ingested": len(payload)}
+        decompressor(encoding)  # reject an unsupported encoding before reading the body
+    except StreamError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    try:
+        rag_service = await rag.aget()
+        summary, error = await stream_ingest(iter_ndjson(request.stream(), encoding), rag_service.aingest)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    return JSONResponse(status_code=error.status_code if error else 200, content=summary)
 
 @app.delete("/delete")
-def delete_docs(req: DeleteRequest):
+async def delete_docs(req: DeleteRequest):
     try:
-        result = rag_service.delete(req.meta_filter)
+        rag_service = await rag.aget()
+        result = await rag_service.adelete(req.meta_filter, dry_run=req.dry_run)
         return {"status": "ok", **result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/query")
-def query(req: QueryRequest):
+async def query(req: QueryRequest):
+    try:
+        rag_service = await rag.aget()
+        return await rag_service.aquery(
+            req.query,
+            top_k=req.top_k,
+            mode=req.mode,
+            dense_weight=req.dense_weight,
+            sparse_weight=req.sparse_weight,
+            latency_budget=req.latency_budget,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/query/batch")
+async def query_batch(req: BatchQueryRequest):
+    if len(req.queries) > QUERY_BATCH_MAX_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch of {len(req.queries)} exceeds QUERY_BATCH_MAX_SIZE={QUERY_BATCH_MAX_SIZE}")
     try:
-        return rag_service.query(req.query, top_k=req.top_k)
+        rag_service = await rag.aget()
+        options = {"concurrency": req.concurrency} if req.concurrency else {}
+        return await rag_service.aquery_batch(
+            req.queries,
+            top_k=req.top_k,
+            mode=req.mode,
+            dense_weight=req.dense_weight,
+            sparse_weight=req.sparse_weight,
+            retrieval_only=req.retrieval_only,
+            **options,
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/query/stream")
+async def query_stream(req: QueryRequest):
+    async def events():
+        try:
+            rag_service = await rag.aget()
+            async for event in rag_service.aquery_stream(
+                    req.query,
+                    top_k=req.top_k,
+                    mode=req.mode,
+                    dense_weight=req.dense_weight,
+                    sparse_weight=req.sparse_weight,
+                    latency_budget=req.latency_budget,
+            ):
+                yield f"event: {event['event']}\ndata: {json.dumps(event['data'], ensure_ascii=False)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)}, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job.to_dict()
+
+@app.get("/jobs")
+def job_list():
+    return {**jobs.stats(), "jobs": [job.to_dict(with_failures=False) for job in reversed(jobs.jobs.values())]}
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return (await rag.aget()).cache_stats()
+
+@app.get("/healthz")
+def healthz():
+    # Liveness: the process is up and serving, no dependency checks
+    return {"status": "ok"}
+
+@app.get("/readyz")
+def readyz():
+    # Readiness: clients built and warm-up done
+    status = rag.status()
+    return JSONResponse(status_code=200 if rag.ready else 503, content=status)
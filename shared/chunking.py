@@ -0,0 +1,334 @@
+"""
+Text chunking shared by gemini_rag, Embedding_API and ExtractAPI.
+
+Chunks are exact slices of the input: every Chunk carries its [start, end) character offsets, so
+`text[chunk.start:chunk.end] == chunk.text`. Splitting is recursive like LangChain's
+RecursiveCharacterTextSplitter (paragraphs → lines → sentences → words → characters) but works on
+offsets into the original string instead of copying and re-joining pieces, and it is a generator:
+chunks come out while the text (or a stream of text blocks) is still being read.
+
+Sizes are measured in `unit`s: "chars", "words" or "tokens" (≈ shared.tokens.CHARS_PER_TOKEN characters
+each, or counted by a `token_counter` such as `lambda s: len(enc.encode(s))`). Chunkers are immutable;
+get_chunker() returns a cached instance per configuration.
+
+Consecutive chunks share about `overlap`: whole pieces are kept where they fit, and when the piece next to
+the cut is longer than that, its tail is cut at the coarsest line / sentence / word boundary that fits.
+
+Benchmark against LangChain:  python -m shared.chunking --bench [--mb 8]
+"""
+import re
+import time
+from collections import deque
+from functools import lru_cache
+from typing import Callable, Deque, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from .tokens import CHARS_PER_TOKEN
+
+UNITS = ("chars", "words", "tokens")
+
+# Split points, coarsest first; each level keeps its separator at the end of the preceding piece
+_LEVELS = (
+    re.compile(r"\n[ \t]*\n\s*"),  # paragraphs
+    re.compile(r"\n\s*"),  # lines
+    re.compile(r"(?<=[.!?…;])[\"')\]»]*\s+"),  # sentences
+    re.compile(r"\s+"),  # words
+)
+
+
+class Chunk(NamedTuple):
+    index: int
+    text: str
+    start: int  # offset of the first character in the source text
+    end: int  # offset after the last character
+
+
+class Chunker:
+    def __init__(
+            self,
+            chunk_size: int = 1000,
+            overlap: int = 200,
+            unit: str = "chars",
+            token_counter: Optional[Callable[[str], int]] = None,
+    ):
+        if unit not in UNITS:
+            raise ValueError(f"unit must be one of {UNITS}, got {unit!r}")
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be positive")
+        if not 0 <= overlap < chunk_size:
+            raise ValueError("overlap must be >= 0 and smaller than chunk_size")
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.unit = unit
+        self.token_counter = token_counter
+        # Longest slice cut blindly when a single word is still too large
+        self._hard_limit = chunk_size * CHARS_PER_TOKEN if unit == "tokens" else chunk_size
+        # Text blocks of a stream are split once this much is buffered (must exceed one chunk)
+        self._window = max(1 << 16, self._hard_limit * 16)
+
+    def __repr__(self):
+        return f"Chunker(chunk_size={self.chunk_size}, overlap={self.overlap}, unit={self.unit!r})"
+
+    # ---------- measuring ----------
+    def _weight(self, text: str, start: int, end: int) -> float:
+        if self.unit == "chars":
+            return end - start
+        if self.unit == "words":
+            return len(text[start:end].split())
+        if self.token_counter is not None:
+            return self.token_counter(text[start:end])
+        return (end - start) / CHARS_PER_TOKEN
+
+    # ---------- splitting into pieces no larger than chunk_size ----------
+    def _pieces(self, text: str, start: int, end: int, level: int = 0) -> Iterator[Tuple[int, int, float]]:
+        """Contiguous (start, end, weight) pieces covering text[start:end], each within chunk_size where possible"""
+        weight = self._weight(text, start, end)
+        if weight <= self.chunk_size:
+            yield start, end, weight
+            return
+        if level == len(_LEVELS):
+            for cut in range(start, end, self._hard_limit):
+                stop = min(end, cut + self._hard_limit)
+                yield cut, stop, self._weight(text, cut, stop)
+            return
+        chars = self.unit == "chars"
+        piece_start = start
+        for match in _LEVELS[level].finditer(text, start, end):
+            stop = match.end()
+            if stop == end or stop == piece_start:
+                continue
+            # Most pieces fit: yield them here instead of through another generator frame
+            weight = stop - piece_start if chars else self._weight(text, piece_start, stop)
+            if weight <= self.chunk_size:
+                yield piece_start, stop, weight
+            else:
+                yield from self._pieces(text, piece_start, stop, level + 1)
+            piece_start = stop
+        yield from self._pieces(text, piece_start, end, level + 1)
+
+    # ---------- merging pieces into overlapping chunks ----------
+    def _merge(
+            self,
+            pieces: Iterable[Tuple[int, int, float]],
+            text_at: Callable[[int, int], str],
+            window_start: Optional[List[int]] = None,
+    ) -> Iterator[Chunk]:
+        """Greedy packing of pieces up to chunk_size; each chunk starts with at most `overlap` of the previous one.
+        window_start[0], if given, tracks the offset of the oldest piece still needed."""
+        window: Deque[Tuple[int, int, float]] = deque()
+        total = 0.0
+        index = 0
+
+        def emit() -> Optional[Chunk]:
+            nonlocal index
+            start, end = window[0][0], window[-1][1]
+            raw = text_at(start, end)
+            text = raw.strip()
+            if not text:
+                return None
+            start += len(raw) - len(raw.lstrip())
+            index += 1
+            return Chunk(index - 1, text, start, start + len(text))
+
+        for piece in pieces:
+            weight = piece[2]
+            if window and total + weight > self.chunk_size:
+                chunk = emit()
+                if chunk is not None:
+                    yield chunk
+                # Keep a tail of at most `overlap` that still leaves room for the new piece
+                popped = None
+                while window and (total > self.overlap or total + weight > self.chunk_size):
+                    popped = window.popleft()
+                    total -= popped[2]
+                # A whole piece did not fit in the overlap: keep the end of it instead of nothing
+                room = min(self.overlap - total, self.chunk_size - total - weight)
+                if popped is not None and room > 0:
+                    tail = self._tail(popped, room, text_at)
+                    if tail is not None:
+                        window.appendleft(tail)
+                        total += tail[2]
+            window.append(piece)
+            total += weight
+            if window_start is not None:
+                window_start[0] = window[0][0]
+        if window:
+            chunk = emit()
+            if chunk is not None:
+                yield chunk
+
+    def _tail(
+            self,
+            piece: Tuple[int, int, float],
+            room: float,
+            text_at: Callable[[int, int], str],
+    ) -> Optional[Tuple[int, int, float]]:
+        """Longest suffix of `piece` weighing at most `room`, starting at a line, sentence or word boundary
+        (the coarsest one that keeps at least half of `room`); a blind cut only for character-based units"""
+        start, end, _ = piece
+        text = text_at(start, end)
+        best = None
+        if self.unit != "words" and self.token_counter is None:
+            # Weight is proportional to length: the suffix must start within the last `room` worth of chars
+            first = max(1, len(text) - int(room * (CHARS_PER_TOKEN if self.unit == "tokens" else 1)))
+            for pattern in _LEVELS[1:]:
+                match = pattern.search(text, first)
+                if match is not None and match.end() < len(text):
+                    weight = self._weight(text, match.end(), len(text))
+                    if best is None or weight > best[2]:
+                        best = (start + match.end(), end, weight)
+                    if weight >= room / 2:
+                        return best
+            if best is None and first < len(text):
+                best = (start + first, end, self._weight(text, first, len(text)))
+            return best
+
+        for pattern in _LEVELS[1:]:
+            cuts = [m.end() for m in pattern.finditer(text) if 0 < m.end() < len(text)]
+            lo, hi = 0, len(cuts)  # suffix weight only shrinks as the cut moves right: first cut that fits
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if self._weight(text, cuts[mid], len(text)) <= room:
+                    hi = mid
+                else:
+                    lo = mid + 1
+            if lo < len(cuts):
+                weight = self._weight(text, cuts[lo], len(text))
+                if weight > 0 and (best is None or weight > best[2]):
+                    best = (start + cuts[lo], end, weight)
+                if weight >= room / 2:
+                    break
+        return best
+
+    # ---------- API ----------
+    def iter_chunks(self, text: str) -> Iterator[Chunk]:
+        """Chunks of `text`, lazily"""
+        return self._merge(self._pieces(text, 0, len(text)), lambda start, end: text[start:end])
+
+    def split(self, text: str) -> List[str]:
+        """Chunk texts only (drop-in for `RecursiveCharacterTextSplitter.split_text`)"""
+        return [chunk.text for chunk in self.iter_chunks(text)]
+
+    def iter_stream(self, blocks: Iterable[str]) -> Iterator[Chunk]:
+        """
+        Chunks of a text arriving in blocks (file.read(n) loops, decoded HTTP bodies), with offsets into
+        the whole stream. Buffered text is split at paragraph breaks, so the chunks are the ones
+        iter_chunks() gives for the concatenated text; only a paragraph longer than a few windows is cut
+        at a line / sentence / word instead. Memory stays at the unsplit tail plus the current chunk.
+        """
+        buffer, base, done = "", 0, 0  # buffer[0] is stream offset `base`; text before `done` is split
+        window_start = [0]
+
+        def text_at(start: int, end: int) -> str:
+            return buffer[start - base:end - base]
+
+        def pieces() -> Iterator[Tuple[int, int, float]]:
+            nonlocal buffer, base, done
+            level = 0
+            for block in blocks:
+                buffer += block
+                pending = base + len(buffer) - done
+                if pending < self._window:
+                    continue
+                cut = self._safe_cut(buffer, done - base, last_resort=pending >= 4 * self._window)
+                if cut is None:
+                    continue
+                offset = base
+                for start, end, weight in self._pieces(buffer, done - base, cut[0], level):
+                    yield start + offset, end + offset, weight
+                done, level = offset + cut[0], cut[1]
+                keep = min(window_start[0], done) - base
+                if keep > 0:
+                    buffer, base = buffer[keep:], base + keep
+            offset = base
+            for start, end, weight in self._pieces(buffer, done - base, len(buffer), level):
+                yield start + offset, end + offset, weight
+
+        return self._merge(pieces(), text_at, window_start)
+
+    def _safe_cut(self, buffer: str, start: int, last_resort: bool) -> Optional[Tuple[int, int]]:
+        """(end of the last complete paragraph break in buffer[start:], level); finer separators only as a last resort"""
+        for level, pattern in enumerate(_LEVELS if last_resort else _LEVELS[:1]):
+            last = None
+            for last in pattern.finditer(buffer, start):
+                pass
+            # A separator touching the end of the buffer may continue in the next block
+            if last is not None and start < last.end() < len(buffer):
+                return last.end(), level
+        return None
+
+
+@lru_cache(maxsize=64)
+def get_chunker(chunk_size: int = 1000, overlap: int = 200, unit: str = "chars") -> Chunker:
+    """Shared Chunker per configuration (regexes and settings are built once, not per request)"""
+    return Chunker(chunk_size, overlap, unit)
+
+
+def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200, unit: str = "chars") -> List[Chunk]:
+    return list(get_chunker(chunk_size, overlap, unit).iter_chunks(text))
+
+
+# ================== BENCHMARK ==================
+def _sample_text(megabytes: float) -> str:
+    paragraph = (
+        "Retrieval augmented generation combines a search step with a language model. "
+        "Документы разбиваются на фрагменты, для каждого считается эмбеддинг! "
+        "Short line\nanother line follows here; and a clause. "
+    )
+    parts, size, i = [], 0, 0
+    while size < megabytes * 1024 * 1024:
+        block = f"Section {i}. " + paragraph * (1 + i % 7) + ("\n\n" if i % 3 else "\n")
+        parts.append(block)
+        size += len(block)
+        i += 1
+    return "".join(parts)
+
+
+def _bench(megabytes: float, chunk_size: int, overlap: int, repeat: int):
+    import tracemalloc
+    text = _sample_text(megabytes)
+    print(f"Input: {len(text) / 1e6:.1f}M chars, chunk_size={chunk_size} overlap={overlap} (chars)")
+
+    def measure(name: str, fn):
+        best = float("inf")
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = fn()
+            best = min(best, time.perf_counter() - started)
+        tracemalloc.start()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"{name:<34} {best * 1000:>9.1f} ms  {len(text) / best / 1e6:>7.1f} Mchar/s  "
+              f"peak {peak / 1e6:>7.1f} MB  {len(result):>6} chunks")
+        return result
+
+    chunker = Chunker(chunk_size, overlap)
+    ours = measure("shared.chunking iter_chunks", lambda: list(chunker.iter_chunks(text)))
+    blocks = [text[i:i + 65536] for i in range(0, len(text), 65536)]
+    measure("shared.chunking iter_stream (64K)", lambda: list(chunker.iter_stream(blocks)))
+    assert all(text[c.start:c.end] == c.text for c in ours), "offsets do not match the source text"
+    try:
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+    except ImportError:
+        print("langchain_text_splitters not installed: skipping the LangChain comparison")
+        return
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size, chunk_overlap=overlap, separators=["\n\n", "\n", " ", ""], keep_separator=False,
+    )
+    measure("langchain RecursiveCharacterText", lambda: splitter.split_text(text))
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size, chunk_overlap=overlap, separators=["\n\n", "\n", " ", ""], add_start_index=True,
+    )
+    measure("langchain + add_start_index", lambda: splitter.create_documents([text]))
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark shared.chunking against LangChain's splitter")
+    parser.add_argument("--bench", action="store_true")
+    parser.add_argument("--mb", type=float, default=8.0, help="input size in MB")
+    parser.add_argument("--chunk-size", type=int, default=4800)
+    parser.add_argument("--overlap", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    _bench(args.mb, args.chunk_size, args.overlap, args.repeat)
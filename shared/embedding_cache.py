@@ -0,0 +1,184 @@
+"""
+Persistent embedding cache shared by gemini_rag, Embedding_API and ExtractAPI.
+
+One SQLite file (WAL mode, safe for several processes) keyed by (model, dim, task_type, sha256(text)),
+vectors stored as raw float32/float16 bytes. Lookups and writes are batched; when the table grows past
+`max_entries` the least recently used rows are evicted, a tenth of the limit at a time. Hits refresh
+`last_access` in batches (on the next write, or every EMBED_CACHE_TOUCH_INTERVAL seconds) rather than per read.
+
+Enable it by pointing every service at the same file:
+
+    EMBED_CACHE_PATH=/var/cache/embeddings.sqlite
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+EMBED_CACHE_PATH = os.environ.get("EMBED_CACHE_PATH", "")  # empty = disabled
+EMBED_CACHE_MAX_ENTRIES = int(os.environ.get("EMBED_CACHE_MAX_ENTRIES", "1000000"))
+EMBED_CACHE_DTYPE = os.environ.get("EMBED_CACHE_DTYPE", "float32")  # float32 | float16 (half the disk, ~3 digits)
+EMBED_CACHE_TOUCH_INTERVAL = float(os.environ.get("EMBED_CACHE_TOUCH_INTERVAL", "30"))  # seconds between last_access flushes
+
+# SQLite's default limit on host parameters per statement is 999 on older builds
+_SQL_BATCH = 500
+# Flush pending last_access touches early once this many have piled up
+_TOUCH_BATCH = 1000
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(
+            self,
+            path: str,
+            max_entries: int = EMBED_CACHE_MAX_ENTRIES,
+            dtype: str = EMBED_CACHE_DTYPE,
+            touch_interval: float = EMBED_CACHE_TOUCH_INTERVAL,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.dtype = np.dtype(dtype)
+        self.touch_interval = touch_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                task_type TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                dtype TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (model, dim, task_type, hash)
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings (last_access)")
+        self._conn.commit()
+        # Upper bound on the row count: every put adds its rows (replacements included), other processes'
+        # writes are not seen, so it is re-counted exactly only when it passes max_entries
+        (self._rows,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        self._touched: Dict[tuple, float] = {}
+        self._touched_at = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            self._flush_touches()
+            self._conn.commit()
+            self._conn.close()
+
+    def _flush_touches(self):
+        """Write pending last_access updates; the caller commits"""
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_access = ? WHERE model = ? AND dim = ? AND task_type = ? AND hash = ?",
+                [(at, *key) for key, at in self._touched.items()],
+            )
+            self._touched.clear()
+        self._touched_at = time.monotonic()
+
+    def get_many(self, texts: Sequence[str], model: str, dim: int, task_type: str) -> List[Optional[List[float]]]:
+        """Cached vectors in the order of `texts`, None where missing. dim=0 means the provider's default size"""
+        hashes = [content_hash(t) for t in texts]
+        found: Dict[str, List[float]] = {}
+        now = time.time()
+        with self._lock:
+            unique = list(dict.fromkeys(hashes))
+            for i in range(0, len(unique), _SQL_BATCH):
+                chunk = unique[i:i + _SQL_BATCH]
+                rows = self._conn.execute(
+                    f"SELECT hash, dtype, vector FROM embeddings WHERE model = ? AND dim = ? AND task_type = ? "
+                    f"AND hash IN ({','.join('?' * len(chunk))})",
+                    (model, dim, task_type, *chunk),
+                ).fetchall()
+                for h, dtype, blob in rows:
+                    found[h] = np.frombuffer(blob, dtype=dtype).astype(np.float32).tolist()
+            for h in found:
+                self._touched[(model, dim, task_type, h)] = now
+            if self._touched and (
+                    len(self._touched) >= _TOUCH_BATCH or time.monotonic() - self._touched_at >= self.touch_interval
+            ):
+                self._flush_touches()
+                self._conn.commit()
+        result = [found.get(h) for h in hashes]
+        hit_count = sum(1 for v in result if v is not None)
+        self.hits += hit_count
+        self.misses += len(result) - hit_count
+        return result
+
+    def put_many(self, texts: Sequence[str], vectors: Sequence[Sequence[float]], model: str, dim: int, task_type: str):
+        now = time.time()
+        rows = [
+            (model, dim, task_type, content_hash(t), self.dtype.name, np.asarray(v, dtype=self.dtype).tobytes(), now)
+            for t, v in zip(texts, vectors)
+        ]
+        if not rows:
+            return
+        with self._lock:
+            self._flush_touches()
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self._rows += len(rows)
+            if self.max_entries > 0 and self._rows > self.max_entries:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        # Trim to 90% so eviction runs once per many writes rather than on every one
+        excess = count - int(self.max_entries * 0.9) if count > self.max_entries else 0
+        if excess:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_access LIMIT ?)",
+                (excess,),
+            )
+            self.evictions += excess
+        self._rows = count - excess
+
+    def embed_cached(
+            self,
+            texts: Sequence[str],
+            embed_fn: Callable[[List[str]], List[List[float]]],
+            model: str,
+            dim: int,
+            task_type: str,
+    ) -> List[List[float]]:
+        """Serve what is cached, call embed_fn once with the distinct missing texts, store and return all in order"""
+        vectors = self.get_many(texts, model, dim, task_type)
+        missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+        if missing:
+            fresh = dict(zip(missing, embed_fn(missing)))
+            self.put_many(missing, [fresh[t] for t in missing], model, dim, task_type)
+            vectors = [v if v is not None else fresh[t] for t, v in zip(texts, vectors)]
+        return vectors
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            (entries,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        total = self.hits + self.misses
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+def open_embedding_cache(path: str = EMBED_CACHE_PATH) -> Optional[EmbeddingCache]:
+    """The configured shared cache, or None when EMBED_CACHE_PATH is unset"""
+    return EmbeddingCache(path) if path else None
@@ -0,0 +1,110 @@
+"""
+Prometheus metrics shared by gemini_rag, Embedding_API and ExtractAPI.
+
+Every series carries a `service` label, so one dashboard covers all three. Each service creates
+`Metrics("<name>")`, calls `metrics.instrument(app)` (HTTP latency / in-flight middleware + GET /metrics)
+and wraps its pipeline stages in `with metrics.stage("..."):`.
+
+With several uvicorn workers set PROMETHEUS_MULTIPROC_DIR to an empty directory shared by them.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# 5 ms .. 2 min: covers a cached lookup as well as a slow generation
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+TOKEN_BUCKETS = (16, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+STAGE_SECONDS = Histogram(
+    "pipeline_stage_seconds", "Latency of one pipeline stage", ["service", "stage"], buckets=LATENCY_BUCKETS
+)
+HTTP_SECONDS = Histogram(
+    "http_request_seconds", "HTTP request latency until the response starts", ["service", "method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+IN_FLIGHT = Gauge(
+    "in_flight", "Requests / upstream calls currently in progress", ["service", "kind"], multiprocess_mode="livesum"
+)
+UPSTREAM_CALLS = Counter("upstream_calls_total", "Calls to an upstream API", ["service", "upstream"])
+UPSTREAM_RETRIES = Counter("upstream_retries_total", "Retried upstream calls", ["service", "upstream"])
+UPSTREAM_FAILURES = Counter("upstream_failures_total", "Upstream calls that failed after all retries", ["service", "upstream"])
+COALESCED = Counter(
+    "coalesced_requests_total", "Requests answered by joining an identical request already in flight", ["service", "kind"]
+)
+TOKENS = Histogram("llm_tokens", "Tokens per LLM call", ["service", "kind"], buckets=TOKEN_BUCKETS)
+
+
+class Metrics:
+    def __init__(self, service: str):
+        self.service = service
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            STAGE_SECONDS.labels(self.service, name).observe(time.perf_counter() - started)
+
+    @contextmanager
+    def in_flight(self, kind: str):
+        gauge = IN_FLIGHT.labels(self.service, kind)
+        gauge.inc()
+        try:
+            yield
+        finally:
+            gauge.dec()
+
+    def call(self, upstream: str):
+        UPSTREAM_CALLS.labels(self.service, upstream).inc()
+
+    def retry(self, upstream: str):
+        UPSTREAM_RETRIES.labels(self.service, upstream).inc()
+
+    def failure(self, upstream: str):
+        UPSTREAM_FAILURES.labels(self.service, upstream).inc()
+
+    def coalesced(self, kind: str):
+        COALESCED.labels(self.service, kind).inc()
+
+    def tokens(self, kind: str, count: int):
+        TOKENS.labels(self.service, kind).observe(count)
+
+    def instrument(self, app):
+        """HTTP latency + in-flight middleware and a GET /metrics route on a FastAPI app"""
+        from fastapi import Request, Response
+
+        @app.middleware("http")
+        async def _observe(request: Request, call_next):
+            if request.url.path == "/metrics":
+                return await call_next(request)
+            started = time.perf_counter()
+            status = 500
+            with self.in_flight("http"):
+                try:
+                    response = await call_next(request)
+                    status = response.status_code
+                    return response
+                finally:
+                    route = getattr(request.scope.get("route"), "path", "unmatched")
+                    HTTP_SECONDS.labels(self.service, request.method, route, str(status)).observe(
+                        time.perf_counter() - started
+                    )
+
+        @app.get("/metrics", include_in_schema=False)
+        def _metrics():
+            if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+                registry = CollectorRegistry()
+                multiprocess.MultiProcessCollector(registry)
+                return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+            return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
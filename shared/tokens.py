@@ -0,0 +1,15 @@
+"""
+Token estimate shared by gemini_rag (prompt budgets, batching) and shared.chunking (sizes in tokens),
+so every service converts characters to tokens the same way.
+"""
+
+# Gemini tokenizes roughly 4 chars per token for Latin text and a bit denser for Cyrillic;
+# 3 chars/token keeps the estimate on the safe side for our mixed ru/kk/en corpus.
+CHARS_PER_TOKEN = 3
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap upper-bound token estimate, good enough for batching and prompt budgets"""
+    if not text:
+        return 0
+    return max(1, len(text) // CHARS_PER_TOKEN)
@@ -0,0 +1,6 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)  # repo root, for shared/
+sys.path.insert(0, os.path.join(ROOT, "gemini_rag"))  # for the gemini_rag app package
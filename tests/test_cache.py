@@ -0,0 +1,140 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app import cache as cache_module
+from app.cache import LRUTTLCache, SemanticAnswerCache, SingleFlight, normalize_query
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, "monotonic", clock)
+    return clock
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = LRUTTLCache(max_size=4, ttl_seconds=10)
+    cache.put("k", "v")
+    clock.now += 9.9
+    assert cache.get("k") == "v"
+    clock.now += 0.1
+    assert cache.get("k") is None
+    assert len(cache) == 0
+    assert (cache.hits, cache.misses, cache.evictions) == (1, 1, 1)
+
+
+def test_put_refreshes_ttl(clock):
+    cache = LRUTTLCache(ttl_seconds=10)
+    cache.put("k", 1)
+    clock.now += 8
+    cache.put("k", 2)
+    clock.now += 8
+    assert cache.get("k") == 2
+
+
+def test_least_recently_used_is_evicted(clock):
+    cache = LRUTTLCache(max_size=2, ttl_seconds=60)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "b" is now the oldest
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.evictions == 1
+
+
+def test_zero_size_disables_the_cache():
+    cache = LRUTTLCache(max_size=0)
+    cache.put("a", 1)
+    assert cache.get("a") is None
+
+
+def test_normalize_query():
+    assert normalize_query("  What   IS\tRAG? ") == "what is rag?"
+
+
+def test_semantic_cache_matches_close_queries_with_the_same_docs(clock):
+    cache = SemanticAnswerCache(max_distance=0.05, ttl_seconds=10)
+    cache.put([1.0, 0.0], ["d1"], "answer", latency=2.0)
+    assert cache.lookup([1.0, 0.01], ["d1"])["answer"] == "answer"
+    assert cache.lookup([1.0, 0.01], ["d2"]) is None
+    assert cache.lookup([0.0, 1.0], ["d1"]) is None
+    clock.now += 10
+    assert cache.lookup([1.0, 0.0], ["d1"]) is None
+
+
+def test_semantic_cache_drops_answers_from_an_old_generation():
+    cache = SemanticAnswerCache()
+    generation = cache.generation
+    cache.invalidate()
+    cache.put([1.0, 0.0], ["d1"], "stale", latency=1.0, generation=generation)
+    assert cache.lookup([1.0, 0.0], ["d1"]) is None
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "result"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("k", work)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flight.do("k", work))) for _ in range(3)]
+    for t in followers:
+        t.start()
+    while flight.coalesced < 3:
+        time.sleep(0.001)
+    release.set()
+    for t in [leader, *followers]:
+        t.join(5)
+
+    assert len(calls) == 1
+    assert sorted(results) == [("result", False)] + [("result", True)] * 3
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_single_flight_shares_errors_and_forgets_keys():
+    flight = SingleFlight()
+    with pytest.raises(KeyError):
+        flight.do("k", lambda: {}["missing"])
+    assert flight.do("k", lambda: 1) == (1, False)
+
+
+def test_async_single_flight_survives_a_cancelled_leader():
+    async def scenario():
+        flight = SingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "done"
+
+        leader = asyncio.ensure_future(flight.ado("k", work))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.ado("k", work))
+        await asyncio.sleep(0)
+        leader.cancel()
+        assert await follower == ("done", True)
+        assert calls == [1]
+        assert flight.stats()["in_flight"] == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,83 @@
+import pytest
+
+from shared.chunking import Chunker, chunk_text, get_chunker
+
+TEXT = "\n\n".join(
+    " ".join(f"Sentence {p}.{s} has a few words in it, and then ends." for s in range(12)) for p in range(30)
+)
+
+
+def _pairs(chunks):
+    return zip(chunks, chunks[1:])
+
+
+@pytest.mark.parametrize("size,overlap", [(1000, 200), (300, 50), (120, 0), (80, 40)])
+def test_chunks_are_exact_slices(size, overlap):
+    chunks = chunk_text(TEXT, size, overlap)
+    assert chunks
+    for i, chunk in enumerate(chunks):
+        assert chunk.index == i
+        assert TEXT[chunk.start:chunk.end] == chunk.text
+        assert len(chunk.text) <= size
+
+
+@pytest.mark.parametrize("size,overlap", [(1000, 200), (300, 50), (120, 0)])
+def test_chunks_cover_the_text_in_order(size, overlap):
+    chunks = chunk_text(TEXT, size, overlap)
+    assert chunks[0].start == 0
+    assert chunks[-1].end == len(TEXT)
+    for left, right in _pairs(chunks):
+        assert left.start < right.start
+        assert not TEXT[left.end:right.start].strip()  # only whitespace between chunks is dropped
+
+
+@pytest.mark.parametrize("size,overlap", [(1000, 200), (300, 50)])
+def test_consecutive_chunks_overlap(size, overlap):
+    for left, right in _pairs(chunk_text(TEXT, size, overlap)):
+        shared = left.end - right.start
+        assert 0 < shared <= overlap
+
+
+def test_long_word_is_cut_to_the_limit():
+    text = "x" * 2500
+    chunks = chunk_text(text, 1000, 100)
+    assert all(len(c.text) <= 1000 for c in chunks)
+    assert chunks[-1].end == len(text)
+
+
+@pytest.mark.parametrize("unit", ["words", "tokens"])
+def test_other_units_keep_offsets(unit):
+    chunks = chunk_text(TEXT, 100, 20, unit=unit)
+    for chunk in chunks:
+        assert TEXT[chunk.start:chunk.end] == chunk.text
+    if unit == "words":
+        assert all(len(c.text.split()) <= 100 for c in chunks)
+
+
+def test_token_counter_is_respected():
+    chunker = Chunker(50, 10, unit="tokens", token_counter=lambda s: len(s.split()))
+    for chunk in chunker.iter_chunks(TEXT):
+        assert len(chunk.text.split()) <= 50
+
+
+@pytest.mark.parametrize("block", [7, 1000, 1 << 16])
+def test_stream_matches_whole_text(block):
+    chunker = Chunker(300, 50)
+    text = TEXT * 8
+    blocks = (text[i:i + block] for i in range(0, len(text), block))
+    assert list(chunker.iter_stream(blocks)) == list(chunker.iter_chunks(text))
+
+
+def test_empty_text():
+    assert chunk_text("") == []
+
+
+@pytest.mark.parametrize("kwargs", [{"unit": "lines"}, {"chunk_size": 0}, {"chunk_size": 10, "overlap": 10}, {"overlap": -1}])
+def test_invalid_arguments(kwargs):
+    with pytest.raises(ValueError):
+        Chunker(**kwargs)
+
+
+def test_get_chunker_is_cached():
+    assert get_chunker(500, 50) is get_chunker(500, 50)
+    assert get_chunker(500, 50) is not get_chunker(500, 60)
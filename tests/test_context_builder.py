@@ -0,0 +1,78 @@
+from haystack import Document
+
+from app.context_builder import build_context, merge_passages, mmr_order
+
+SOURCE = "".join(f"Line {i} of the source document, long enough to overlap.\n" for i in range(40))
+
+
+def _chunk(n, start, end, offsets=True, source="a.txt"):
+    meta = {"source": source, "chunk": n}
+    if offsets:
+        meta.update(start=start, end=end)
+    return Document(content=SOURCE[start:end], meta=meta)
+
+
+def test_overlapping_spans_are_merged_by_offset():
+    docs = [_chunk(2, 300, 700), _chunk(1, 0, 400)]
+    assert merge_passages(docs) == [SOURCE[0:700]]
+
+
+def test_contained_span_adds_nothing():
+    docs = [_chunk(1, 0, 600), _chunk(2, 100, 300)]
+    assert merge_passages(docs) == [SOURCE[0:600]]
+
+
+def test_consecutive_chunks_without_shared_text_get_a_newline():
+    docs = [_chunk(1, 0, 200), _chunk(2, 250, 400)]
+    assert merge_passages(docs) == [SOURCE[0:200] + "\n" + SOURCE[250:400]]
+
+
+def test_distant_chunks_stay_separate_in_rank_order():
+    docs = [_chunk(9, 1500, 1800), _chunk(1, 0, 200)]
+    assert merge_passages(docs) == [SOURCE[1500:1800], SOURCE[0:200]]
+
+
+def test_overlap_found_by_text_without_offsets():
+    docs = [_chunk(1, 0, 400, offsets=False), _chunk(2, 300, 700, offsets=False)]
+    assert merge_passages(docs) == [SOURCE[0:700]]
+
+
+def test_no_text_overlap_without_offsets_gets_a_newline():
+    docs = [_chunk(1, 0, 200, offsets=False), _chunk(2, 200, 400, offsets=False)]
+    assert merge_passages(docs) == [SOURCE[0:200] + "\n" + SOURCE[200:400]]
+
+
+def test_duplicates_and_sources_are_kept_apart():
+    a = _chunk(1, 0, 200)
+    b = _chunk(1, 0, 200, source="b.txt")
+    loose = Document(content="no meta at all")
+    assert merge_passages([a, a, loose, b]) == [SOURCE[0:200], "no meta at all"]
+
+
+def test_mmr_prefers_diverse_hits():
+    hits = [
+        Document(content="a", embedding=[1.0, 0.0]),
+        Document(content="a'", embedding=[1.0, 0.02]),
+        Document(content="b", embedding=[0.5, 0.866]),
+    ]
+    # By relevance alone the near-duplicate "a" would come second
+    assert [d.content for d in mmr_order([1.0, 0.1], hits, mmr_lambda=0.5)] == ["a'", "b", "a"]
+
+
+def test_mmr_keeps_order_without_embeddings():
+    hits = [Document(content="x"), Document(content="y")]
+    assert mmr_order([1.0], hits) == hits
+
+
+def test_build_context_respects_the_budget():
+    hits = [_chunk(i, i * 300, i * 300 + 300) for i in range(1, 6)]
+    context, stats = build_context([1.0], hits, token_budget=250)
+    assert stats["tokens_after"] <= 250
+    assert stats["chunks_used"] < stats["chunks_in"] == 5
+    assert stats["tokens_before"] > stats["tokens_after"]
+
+
+def test_build_context_sends_the_head_of_an_oversized_chunk():
+    context, stats = build_context([1.0], [_chunk(1, 0, 2000)], token_budget=10)
+    assert stats["chunks_used"] == 1
+    assert SOURCE.startswith(context) and context
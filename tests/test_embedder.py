@@ -0,0 +1,111 @@
+import itertools
+
+import pytest
+import requests
+
+from bench.bge_standin import fake_embedding, serve_in_background
+from app.embedder import AdaptiveBatchSize, BGEEmbeddingClient
+
+DIM = 8
+
+
+@pytest.fixture
+def standin():
+    servers = []
+
+    def start(**kwargs):
+        server = serve_in_background(dim=DIM, **kwargs)
+        servers.append(server)
+        return server, f"http://127.0.0.1:{server.server_port}/embed"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _client(url, **kwargs):
+    kwargs.setdefault("retry_backoff", 0)
+    return BGEEmbeddingClient(url=url, **kwargs)
+
+
+def _texts(n):
+    return [f"text {i}" for i in range(n)]
+
+
+def test_order_is_kept_across_parallel_batches(standin):
+    server, url = standin()
+    client = _client(url, batch_size=4, max_batch_size=4, concurrency=3)
+    texts = _texts(37)
+    assert client.embed(texts) == [fake_embedding(t, DIM) for t in texts]
+    assert server.requests == 10
+    assert len(server.connections) <= 3  # pooled keep-alive connections
+    client.close()
+
+
+def test_retries_on_5xx(standin, monkeypatch):
+    server, url = standin(error_rate=0.5)
+    failures = itertools.chain([0.0, 0.0], itertools.repeat(1.0))  # first two requests get a 503
+    monkeypatch.setattr("bench.bge_standin.random.random", lambda: next(failures))
+    client = _client(url, retries=3)
+    assert client.embed(["a", "b"]) == [fake_embedding("a", DIM), fake_embedding("b", DIM)]
+    assert client.retried == 2 and server.requests == 3
+    client.close()
+
+
+def test_gives_up_after_the_last_retry(standin):
+    server, url = standin(error_rate=1.0)
+    client = _client(url, retries=3)
+    with pytest.raises(requests.HTTPError):
+        client.embed(["a"])
+    assert server.requests == 3
+    client.close()
+
+
+def test_413_halves_the_batch_and_caps_the_size(standin):
+    server, url = standin(max_batch=5)
+    client = _client(url, batch_size=16, max_batch_size=64, target_latency=60)
+    texts = _texts(16)
+    assert client.embed(texts) == [fake_embedding(t, DIM) for t in texts]
+    # 16 -> 413, 2 x 8 -> 413, 4 x 4 -> ok
+    assert server.requests == 7
+    assert client.batch_size.maximum == 4 and client.batch_size.value == 4
+
+    texts = _texts(40)
+    assert client.embed(texts) == [fake_embedding(t, DIM) for t in texts]
+    assert server.requests == 7 + 10  # new batches respect the learned cap
+    client.close()
+
+
+def test_adaptive_batch_size():
+    size = AdaptiveBatchSize(initial=16, minimum=2, maximum=32, target_latency=1.0)
+    size.observe(16, 0.1)
+    assert size.value == 20  # fast: grow by a quarter
+    size.observe(5, 5.0)
+    assert size.value == 20  # tail batches are ignored
+    size.observe(20, 2.0)
+    assert size.value == 10  # slow: halve
+    size.observe(10, 1.0)
+    assert size.value == 10  # on target: keep
+    for _ in range(10):
+        size.observe(size.value, 0.1)
+    assert size.value == 32
+    size.too_large(24)
+    assert size.maximum == 12 and size.value == 12
+    for _ in range(10):
+        size.observe(size.value, 9.0)
+    assert size.value == 2
+
+
+def test_batch_size_adapts_to_latency(standin):
+    _, url = standin()
+    client = _client(url, batch_size=4, max_batch_size=16, target_latency=60)
+    client.embed(_texts(4))
+    client.embed(_texts(5))
+    assert client.batch_size.value == 6
+
+    slow = _client(url, batch_size=8, min_batch_size=2, target_latency=1e-9)
+    slow.embed(_texts(8))
+    assert slow.batch_size.value == 4
+    client.close()
+    slow.close()
@@ -0,0 +1,79 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from shared.embedding_cache import EmbeddingCache
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+KEY = ("fake-embed", 4, "RETRIEVAL_DOCUMENT")
+
+
+def _vec(i):
+    return [float(i), 0.5, -1.0, 2.0]
+
+
+def test_hits_and_misses(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"))
+    calls = []
+
+    def embed(texts):
+        calls.append(list(texts))
+        return [_vec(len(t)) for t in texts]
+
+    assert cache.embed_cached(["a", "bb", "a"], embed, *KEY) == [_vec(1), _vec(2), _vec(1)]
+    assert calls == [["a", "bb"]]
+    assert cache.embed_cached(["bb", "ccc"], embed, *KEY) == [_vec(2), _vec(3)]
+    assert calls[-1] == ["ccc"]
+    assert cache.get_many(["a"], "other-model", 4, KEY[2]) == [None]  # keyed by model
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 5, 3)
+
+
+def test_float16_storage(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"), dtype="float16")
+    cache.put_many(["a"], [[0.1, 0.2, 0.3, 0.4]], *KEY)
+    assert cache.get_many(["a"], *KEY)[0] == pytest.approx([0.1, 0.2, 0.3, 0.4], abs=1e-3)
+
+
+def test_evicts_least_recently_used_in_batches(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"), max_entries=10, touch_interval=3600)
+    old = [f"old {i}" for i in range(6)]
+    cache.put_many(old, [_vec(i) for i in range(6)], *KEY)
+    time.sleep(0.01)
+    assert None not in cache.get_many(old[:2], *KEY)  # touched, flushed with the next write
+    time.sleep(0.01)
+    new = [f"new {i}" for i in range(4)]
+    cache.put_many(new, [_vec(i) for i in range(4)], *KEY)
+    assert cache.evictions == 0
+
+    cache.put_many(["one more"], [_vec(0)], *KEY)
+    # past the limit: trimmed to 90%, dropping the untouched old rows first
+    assert cache.evictions == 2 and cache.stats()["entries"] == 9
+    assert None not in cache.get_many(old[:2] + new, *KEY)
+    assert cache.get_many(old[2:], *KEY).count(None) == 2
+
+
+def test_replacements_do_not_evict(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"), max_entries=5)
+    for _ in range(4):
+        cache.put_many(["a", "b", "c"], [_vec(1)] * 3, *KEY)
+    assert cache.evictions == 0 and cache.stats()["entries"] == 3
+
+
+def test_shared_between_processes(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = EmbeddingCache(path)
+    cache.put_many(["from parent"], [_vec(1)], *KEY)
+
+    child = (
+        "import sys; from shared.embedding_cache import EmbeddingCache; "
+        f"cache = EmbeddingCache({path!r}); key = {KEY!r}; "
+        "assert cache.get_many(['from parent'], *key) == [[1.0, 0.5, -1.0, 2.0]]; "
+        "cache.put_many(['from child'], [[2.0, 0.5, -1.0, 2.0]], *key); cache.close()"
+    )
+    subprocess.run([sys.executable, "-c", child], cwd=ROOT, check=True)
+    assert cache.get_many(["from child"], *KEY) == [_vec(2)]
+    assert cache.stats()["entries"] == 2
@@ -0,0 +1,130 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app import generator
+
+
+def _response(text):
+    part = SimpleNamespace(text=text)
+    return SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=[part]))], usage_metadata=None)
+
+
+class FakeModel:
+    """generate_content_async that fails its first `failures` calls, then answers after `latency` seconds"""
+
+    def __init__(self, name, latency=0.0, failures=0, first_chunk_latency=0.0):
+        self.name = name
+        self.latency = latency
+        self.failures = failures
+        self.first_chunk_latency = first_chunk_latency
+        self.calls = 0
+
+    async def generate_content_async(self, prompt, generation_config=None, request_options=None, stream=False):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise RuntimeError(f"{self.name} unavailable")
+        await asyncio.sleep(self.latency)
+        if not stream:
+            return _response(f"answer from {self.name}")
+
+        async def chunks():
+            await asyncio.sleep(self.first_chunk_latency)
+            yield _response(f"answer from {self.name}")
+
+        return chunks()
+
+
+@pytest.fixture
+def models(monkeypatch):
+    """Install fake models: models("primary", FakeModel(...), "fallback", FakeModel(...), ...)"""
+    monkeypatch.setattr(generator, "RETRIES", 2)
+    monkeypatch.setattr(generator, "RETRY_BACKOFF", 0.0)
+    monkeypatch.setattr(generator, "FALLBACK_RESERVE", 8.0)
+    monkeypatch.setattr(generator, "HEDGE_AFTER", 0.0)
+    monkeypatch.setattr(generator, "LATENCY_BUDGET", 0.0)
+
+    def install(*fakes):
+        by_name = {fake.name: fake for fake in fakes}
+        monkeypatch.setattr(generator, "GEMINI_MODEL", fakes[0].name)
+        monkeypatch.setattr(generator, "FALLBACK_MODELS", [fake.name for fake in fakes[1:]])
+        monkeypatch.setattr(generator, "_model", lambda name: by_name[name])
+        return by_name
+
+    return install
+
+
+def _stream(**kwargs):
+    async def collect():
+        info = {}
+        text = "".join([chunk async for chunk in generator.generate_answer_stream_async("prompt", info=info, **kwargs)])
+        return text, info
+
+    return asyncio.run(collect())
+
+
+def test_fallback_models_are_tried_in_order(models):
+    fakes = models(FakeModel("primary", failures=9), FakeModel("lite", failures=9), FakeModel("tiny"))
+    result = asyncio.run(generator.agenerate("prompt"))
+    assert (result["text"], result["model"]) == ("answer from tiny", "tiny")
+    assert [(a["model"], a["ok"]) for a in result["attempts"]] == [
+        ("primary", False), ("primary", False), ("lite", False), ("lite", False), ("tiny", True),
+    ]
+    assert fakes["tiny"].calls == 1
+
+
+def test_retry_recovers_before_falling_back(models):
+    fakes = models(FakeModel("primary", failures=1), FakeModel("lite"))
+    result = asyncio.run(generator.agenerate("prompt"))
+    assert result["model"] == "primary" and len(result["attempts"]) == 2
+    assert fakes["lite"].calls == 0
+
+
+def test_budget_bounds_a_slow_model(models):
+    models(FakeModel("primary", latency=5.0))
+    started = time.monotonic()
+    with pytest.raises(RuntimeError) as error:
+        asyncio.run(generator.agenerate("prompt", budget_seconds=0.2))
+    assert time.monotonic() - started < 1.0
+    assert [a["ok"] for a in error.value.attempts] == [False]
+
+
+def test_budget_exhausted_before_the_first_attempt(models):
+    fakes = models(FakeModel("primary"))
+    with pytest.raises(RuntimeError, match="budget exhausted"):
+        asyncio.run(generator.agenerate("prompt", budget_seconds=1e-9))
+    assert fakes["primary"].calls == 0
+
+
+def test_slow_primary_leaves_time_for_the_fallback(models):
+    models(FakeModel("primary", latency=5.0), FakeModel("lite"))
+    started = time.monotonic()
+    result = asyncio.run(generator.agenerate("prompt", budget_seconds=0.4))
+    assert result["model"] == "lite"
+    assert time.monotonic() - started < 1.0
+
+
+def test_hedged_request_wins(models):
+    models(FakeModel("primary", latency=5.0), FakeModel("lite", latency=0.01))
+    started = time.monotonic()
+    result = asyncio.run(generator.agenerate("prompt", hedge_after=0.05))
+    assert (result["model"], result["hedged"]) == ("lite", True)
+    assert time.monotonic() - started < 1.0
+    assert [a["model"] for a in result["attempts"] if a["ok"]] == ["lite"]
+
+
+def test_stream_falls_back_and_reports_the_model(models):
+    models(FakeModel("primary", failures=9), FakeModel("lite"))
+    text, info = _stream()
+    assert text == "answer from lite"
+    assert info["model"] == "lite" and [a["model"] for a in info["attempts"]] == ["primary", "primary", "lite"]
+
+
+def test_stream_budget_bounds_the_first_chunk(models):
+    models(FakeModel("primary", first_chunk_latency=5.0), FakeModel("lite"))
+    started = time.monotonic()
+    text, info = _stream(budget_seconds=0.4)
+    assert text == "answer from lite" and info["model"] == "lite"
+    assert time.monotonic() - started < 1.0
@@ -0,0 +1,198 @@
+import json
+
+import pytest
+import requests
+
+from app import ingest_helper
+from app.ingest_helper import Manifest, _post_batch, sync_folder
+
+API = "http://test"
+
+
+class FakeServer:
+    """Stands in for POST /ingest and DELETE /delete: keeps {source: {chunk: content}}"""
+
+    def __init__(self):
+        self.chunks = {}
+        self.posts = 0
+        self.deletes = []
+        self.fail_sources = set()
+        self.titles = set()
+
+    def post_batch(self, session, url, batch, retries=3):
+        self.posts += 1
+        self.titles.update(doc["meta"]["title"] for doc in batch)
+        for doc in batch:
+            if doc["meta"]["source"] in self.fail_sources:
+                raise RuntimeError("500 boom")
+        for doc in batch:
+            self.chunks.setdefault(doc["meta"]["source"], {})[doc["meta"]["chunk"]] = doc["content"]
+        return {"embedded": len(batch), "skipped": 0}
+
+    def delete(self, session, url, meta_filter):
+        self.deletes.append(meta_filter)
+        chunks = self.chunks.get(meta_filter["source"], {})
+        above = meta_filter.get("chunk", {">": 0})[">"]
+        doomed = [n for n in chunks if n > above]
+        for n in doomed:
+            del chunks[n]
+        return len(doomed)
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = FakeServer()
+    monkeypatch.setattr(ingest_helper, "_post_batch", server.post_batch)
+    monkeypatch.setattr(ingest_helper, "_delete", server.delete)
+    return server
+
+
+def _sync(folder, **kwargs):
+    return sync_folder(str(folder), api=API, concurrency=2, batch_size=4, **kwargs)
+
+
+def test_same_file_name_in_subfolders_gets_distinct_ids(tmp_path, server):
+    for sub in ("a", "b"):
+        (tmp_path / sub).mkdir()
+        (tmp_path / sub / "notes.txt").write_text(f"notes of {sub}", encoding="utf-8")
+    (tmp_path / "top.txt").write_text("top", encoding="utf-8")
+    _sync(tmp_path)
+    assert server.titles == {"a/notes.txt", "b/notes.txt", "top.txt"}  # title + chunk is what the server hashes
+
+
+def test_ingest_folder_defaults_to_sync(tmp_path, server):
+    (tmp_path / "a.txt").write_text("alpha", encoding="utf-8")
+    stats = ingest_helper.ingest_folder(str(tmp_path))
+    assert stats["ingested_files"] == 1
+    assert (tmp_path / ingest_helper.MANIFEST_NAME).exists()
+
+
+def _paragraphs(n):
+    return "\n\n".join(f"Paragraph {i}. " + "words " * 150 for i in range(n))
+
+
+def test_sync_ingests_then_skips_unchanged_files(tmp_path, server):
+    (tmp_path / "a.txt").write_text(_paragraphs(6), encoding="utf-8")
+    (tmp_path / "b.txt").write_text("short", encoding="utf-8")
+    stats = _sync(tmp_path)
+    assert stats["ingested_files"] == 2 and stats["failed_files"] == 0
+    manifest = json.loads((tmp_path / ingest_helper.MANIFEST_NAME).read_text())
+    assert manifest["api_url"] == API
+    assert manifest["files"]["a.txt"]["chunks"] == len(server.chunks[str(tmp_path / "a.txt")])
+
+    posts = server.posts
+    stats = _sync(tmp_path)
+    assert stats["unchanged"] == 2 and stats["ingested_files"] == 0
+    assert server.posts == posts
+
+
+def test_shrunk_file_loses_its_tail_in_one_delete(tmp_path, server):
+    path = tmp_path / "a.txt"
+    path.write_text(_paragraphs(20), encoding="utf-8")
+    _sync(tmp_path)
+    path.write_text(_paragraphs(5), encoding="utf-8")
+    stats = _sync(tmp_path)
+    kept = json.loads((tmp_path / ingest_helper.MANIFEST_NAME).read_text())["files"]["a.txt"]["chunks"]
+    assert sorted(server.chunks[str(path)]) == list(range(1, kept + 1))
+    assert server.deletes == [{"source": str(path), "chunk": {">": kept}}]
+    assert stats["purged_chunks"] > 0
+
+
+def test_deleted_file_is_purged(tmp_path, server):
+    (tmp_path / "a.txt").write_text("alpha", encoding="utf-8")
+    (tmp_path / "b.txt").write_text("beta", encoding="utf-8")
+    _sync(tmp_path)
+    (tmp_path / "b.txt").unlink()
+    stats = _sync(tmp_path)
+    assert stats["purged_files"] == 1
+    assert server.chunks[str(tmp_path / "b.txt")] == {}
+    assert "b.txt" not in json.loads((tmp_path / ingest_helper.MANIFEST_NAME).read_text())["files"]
+
+
+def test_failed_file_is_retried_next_run(tmp_path, server):
+    (tmp_path / "a.txt").write_text("alpha", encoding="utf-8")
+    server.fail_sources.add(str(tmp_path / "a.txt"))
+    assert _sync(tmp_path)["failed_files"] == 1
+    server.fail_sources.clear()
+    assert _sync(tmp_path)["ingested_files"] == 1
+
+
+def test_undecodable_file_is_reported_until_it_changes(tmp_path, server):
+    (tmp_path / "bad.txt").write_bytes(b"caf\xe9")
+    (tmp_path / "good.txt").write_text("fine", encoding="utf-8")
+    assert _sync(tmp_path)["failed_files"] == 1
+    entry = json.loads((tmp_path / ingest_helper.MANIFEST_NAME).read_text())["files"]["bad.txt"]
+    assert "not UTF-8" in entry["error"]
+
+    stats = _sync(tmp_path)
+    assert stats["failed_files"] == 1 and stats["unchanged"] == 1
+
+    (tmp_path / "bad.txt").write_text("café, fixed", encoding="utf-8")
+    stats = _sync(tmp_path)
+    assert stats["failed_files"] == 0 and stats["ingested_files"] == 1
+
+
+def test_manifest_of_another_server_is_ignored(tmp_path):
+    path = tmp_path / "manifest.json"
+    manifest = Manifest(path, "http://one")
+    manifest.files["a.txt"] = {"chunks": 1}
+    manifest.save()
+    assert Manifest(path, "http://one").files == {"a.txt": {"chunks": 1}}
+    assert Manifest(path, "http://two").files == {}
+    assert not path.with_name(path.name + ".tmp").exists()
+
+
+class FakeResponse:
+    def __init__(self, status, body=None, headers=None):
+        self.status_code = status
+        self._body = body or {}
+        self.headers = headers or {}
+        self.text = json.dumps(self._body)
+
+    def json(self):
+        return self._body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(str(self.status_code))
+
+
+class FakeSession:
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def post(self, url, json=None, timeout=None):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    slept = []
+    monkeypatch.setattr(ingest_helper.time, "sleep", slept.append)
+    return slept
+
+
+def test_post_batch_retries_429_timeouts_and_5xx(sleeps):
+    session = FakeSession(
+        FakeResponse(429, headers={"Retry-After": "7"}),
+        requests.Timeout("slow"),
+        FakeResponse(200, {"embedded": 1}),
+    )
+    assert _post_batch(session, API, [{"content": "x"}]) == {"embedded": 1}
+    assert sleeps == [7, 2.0]
+
+    with pytest.raises(RuntimeError, match="503"):
+        _post_batch(FakeSession(*[FakeResponse(503)] * 3), API, [{"content": "x"}])
+
+
+def test_post_batch_does_not_retry_client_errors(sleeps):
+    session = FakeSession(FakeResponse(422))
+    with pytest.raises(requests.HTTPError):
+        _post_batch(session, API, [{"content": "x"}])
+    assert session.calls == 1 and sleeps == []
+    assert _post_batch(FakeSession(), API, []) == {"embedded": 0, "skipped": 0}
@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+from haystack import Document
+
+from app.jobs import IngestJobQueue, QueueFull
+
+
+class FakeService:
+    """aprepare_ingest / aembed_documents / awrite_embedded of RAGService, in memory"""
+
+    def __init__(self, known=(), poison=()):
+        self.known = set(known)  # contents already stored unchanged
+        self.poison = set(poison)  # contents the embedder rejects
+        self.written = []
+        self.embed_calls = 0
+
+    async def aprepare_ingest(self, docs):
+        hay_docs = [Document(content=d["content"], meta=d["meta"]) for d in docs]
+        return hay_docs, [d for d in hay_docs if d.content not in self.known]
+
+    async def aembed_documents(self, docs):
+        self.embed_calls += 1
+        if any(d.content in self.poison for d in docs):
+            raise RuntimeError("bad document")
+        for d in docs:
+            d.embedding = [1.0]
+        return docs
+
+    async def awrite_embedded(self, docs):
+        self.written += docs
+
+
+def _payload(n):
+    return [{"content": f"doc {i}", "meta": {"title": "t", "chunk": i}} for i in range(n)]
+
+
+def _run(service, scenario, **options):
+    async def main():
+        async def get_service():
+            return service
+
+        queue = IngestJobQueue(get_service, **options)
+        queue.start()
+        try:
+            return await scenario(queue)
+        finally:
+            await queue.stop()
+
+    return asyncio.run(main())
+
+
+async def _wait(queue, job):
+    while job.finished_at is None:
+        await asyncio.sleep(0.001)
+    return job
+
+
+def test_job_embeds_skips_and_writes():
+    service = FakeService(known={"doc 0", "doc 1"})
+
+    async def scenario(queue):
+        return await _wait(queue, queue.submit(_payload(10)))
+
+    job = _run(service, scenario, batch_size=3, write_batch=4)
+    assert job.status == "done"
+    assert (job.skipped, job.embedded, job.written, job.failed) == (2, 8, 8, 0)
+    assert job.to_dict()["progress"] == 1.0
+    assert len(service.written) == 8
+
+
+def test_failed_batch_is_retried_one_by_one():
+    service = FakeService(poison={"doc 4"})
+
+    async def scenario(queue):
+        return await _wait(queue, queue.submit(_payload(6)))
+
+    job = _run(service, scenario, batch_size=6)
+    assert job.status == "done"
+    assert job.written == 5 and job.failed == 1
+    assert job.failures[0]["index"] == 4 and job.failures[0]["chunk"] == 4
+    assert service.embed_calls == 1 + 6
+
+
+def test_every_document_failing_fails_the_job():
+    service = FakeService(poison={"doc 0"})
+
+    async def scenario(queue):
+        return await _wait(queue, queue.submit(_payload(1)))
+
+    assert _run(service, scenario).status == "failed"
+
+
+def test_admission_is_bounded_by_queued_documents():
+    async def scenario(queue):
+        queue.submit(_payload(8))
+        with pytest.raises(QueueFull) as full:
+            queue.submit(_payload(5))
+        assert full.value.retry_after >= 1
+        with pytest.raises(ValueError):
+            queue.submit(_payload(11))
+        empty = queue.submit([])
+        assert empty.status == "done"
+        assert queue.get(empty.id) is empty
+
+    _run(FakeService(), scenario, max_queued_docs=10)
+
+
+def test_finished_jobs_are_forgotten_beyond_the_limit():
+    async def scenario(queue):
+        jobs = [queue.submit([]) for _ in range(5)]
+        return queue, jobs
+
+    queue, jobs = _run(FakeService(), scenario, jobs_kept=2)
+    # The newest job is pruned against the others before it finishes, so one extra is kept
+    assert list(queue.jobs) == [j.id for j in jobs[-3:]]
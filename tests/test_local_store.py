@@ -0,0 +1,130 @@
+import asyncio
+import os
+
+import numpy as np
+import pytest
+from haystack import Document
+
+from app.local_store import LocalDocumentStore, LocalEmbeddingRetriever
+
+DIM = 16
+
+
+def _docs(n: int, seed: int = 0, source: str = "a.txt"):
+    rng = np.random.default_rng(seed)
+    return [
+        Document(id=f"{source}-{i}", content=f"chunk {i}", meta={"source": source, "chunk": i + 1}, embedding=rng.normal(size=DIM).tolist())
+        for i in range(n)
+    ]
+
+
+def _ids(docs):
+    return [d.id for d in docs]
+
+
+@pytest.mark.parametrize("quantization", ["none", "int8", "binary"])
+def test_query_finds_the_written_vectors(tmp_path, quantization):
+    store = LocalDocumentStore(str(tmp_path), DIM, quantization=quantization, oversampling=4)
+    docs = _docs(50)
+    assert store.write_documents(docs) == 50
+    for doc in docs[:5]:
+        top = store.query_by_embedding(doc.embedding, top_k=3)
+        assert top[0].id == doc.id
+        assert top[0].content == doc.content and top[0].meta == doc.meta
+        assert top[0].score == pytest.approx(1.0, abs=1e-5)
+
+
+def test_batch_query_matches_single_queries(tmp_path):
+    store = LocalDocumentStore(str(tmp_path), DIM, quantization="binary")
+    docs = _docs(30)
+    store.write_documents(docs)
+    queries = [d.embedding for d in docs[:4]]
+    batch = LocalEmbeddingRetriever(store, top_k=5).run_batch(queries)["documents"]
+    assert [_ids(r) for r in batch] == [_ids(store.query_by_embedding(q, 5)) for q in queries]
+
+
+def test_overwrite_delete_and_row_reuse(tmp_path):
+    store = LocalDocumentStore(str(tmp_path), DIM)
+    docs = _docs(10)
+    store.write_documents(docs)
+    store.write_documents([Document(id=docs[0].id, content="new", meta=docs[0].meta, embedding=docs[0].embedding)])
+    assert store.count_documents() == 10
+    assert store.get_documents_by_id([docs[0].id])[0].content == "new"
+
+    assert store.delete_by_meta({"source": "a.txt", "chunk": {">": 5}}) == 5
+    assert store.count_documents() == 5
+    assert all(d.meta["chunk"] <= 5 for d in store.query_by_embedding(docs[9].embedding, top_k=10))
+    store.write_documents(_docs(3, seed=1, source="b.txt"))
+    assert store._n_rows == 10  # freed rows were reused
+
+
+def test_filters(tmp_path):
+    store = LocalDocumentStore(str(tmp_path), DIM)
+    store.write_documents(_docs(6) + _docs(4, seed=1, source="b.txt"))
+    assert store.count_by_meta({"source": "b.txt"}) == 4
+    assert store.count_by_meta({"chunk": {">=": 2, "<": 4}}) == 4
+    assert store.count_by_meta({"source": {"in": ["a.txt", "b.txt"]}, "chunk": 1}) == 2
+    assert store.count_by_meta({"source": {"not in": ["a.txt"]}}) == 4
+    assert store.count_by_meta({"chunk": {"!=": 1}}) == 8
+    assert set(store.get_meta_by_id(["a.txt-0", "missing"])) == {"a.txt-0"}
+
+
+@pytest.mark.parametrize("quantization", ["none", "int8"])
+def test_reload_keeps_documents_and_codes(tmp_path, quantization):
+    docs = _docs(40)
+    store = LocalDocumentStore(str(tmp_path), DIM, quantization=quantization, prefix_dim=8)
+    store.write_documents(docs)
+    store.delete_by_meta({"chunk": 1})
+    expected = _ids(store.query_by_embedding(docs[7].embedding, 5))
+    code_files = sorted(f for f in os.listdir(tmp_path) if f.endswith(".npy") and f != "vectors.npy")
+    stamps = {f: os.path.getmtime(tmp_path / f) for f in code_files}
+
+    reloaded = LocalDocumentStore(str(tmp_path), DIM, quantization=quantization, prefix_dim=8)
+    assert reloaded.count_documents() == 39
+    assert _ids(reloaded.query_by_embedding(docs[7].embedding, 5)) == expected
+    assert _ids(reloaded.query_two_stage(docs[7].embedding, 5, candidates=20))[0] == docs[7].id
+    assert {f: os.path.getmtime(tmp_path / f) for f in code_files} == stamps  # mapped, not rebuilt
+
+
+def test_two_stage_matches_exact_search(tmp_path):
+    store = LocalDocumentStore(str(tmp_path), DIM, prefix_dim=8)
+    docs = _docs(60)
+    store.write_documents(docs)
+    query = docs[11].embedding
+    # with every row a candidate, stage 2 is an exact full-dimension search
+    assert _ids(store.query_two_stage(query, 5, candidates=60)) == _ids(store.query_by_embedding(query, 5))
+    assert store.query_two_stage(query, 3, candidates=10)[0].id == docs[11].id
+    assert _ids(LocalDocumentStore(str(tmp_path / "flat"), DIM).query_two_stage(query, 5)) == []
+
+
+def test_capacity_grows(tmp_path, monkeypatch):
+    monkeypatch.setattr("app.local_store.INITIAL_CAPACITY", 8)
+    store = LocalDocumentStore(str(tmp_path), DIM, quantization="binary")
+    docs = _docs(30)
+    store.write_documents(docs)
+    assert store.query_by_embedding(docs[29].embedding, 1)[0].id == docs[29].id
+    assert LocalDocumentStore(str(tmp_path), DIM, quantization="binary").count_documents() == 30
+
+
+def test_dimension_mismatch(tmp_path):
+    LocalDocumentStore(str(tmp_path), DIM)
+    with pytest.raises(ValueError):
+        LocalDocumentStore(str(tmp_path), DIM * 2)
+    with pytest.raises(ValueError):
+        LocalDocumentStore(str(tmp_path / "other"), DIM).write_documents(
+            [Document(content="x", embedding=[1.0] * (DIM + 1))]
+        )
+
+
+def test_async_methods(tmp_path):
+    store = LocalDocumentStore(str(tmp_path), DIM)
+    docs = _docs(5)
+
+    async def scenario():
+        await store.write_documents_async(docs)
+        found = await LocalEmbeddingRetriever(store).run_async(docs[3].embedding, top_k=1)
+        assert found["documents"][0].id == docs[3].id
+        assert await store.count_by_meta_async({"source": "a.txt"}) == 5
+        assert await store.delete_by_meta_async({"chunk": 1}) == 1
+
+    asyncio.run(scenario())
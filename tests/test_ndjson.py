@@ -0,0 +1,126 @@
+import asyncio
+import gzip
+import json
+import zlib
+
+import pytest
+
+from app.ndjson import LineTooLong, StreamError, UnsupportedEncoding, iter_ndjson, stream_ingest
+
+
+async def _body(data: bytes, size: int = 64):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+def _parse(data: bytes, encoding=None, max_line_bytes=1 << 20, size=64):
+    async def collect():
+        return [item async for item in iter_ndjson(_body(data, size), encoding, max_line_bytes)]
+
+    return asyncio.run(collect())
+
+
+def _lines(n: int) -> bytes:
+    return b"".join(json.dumps({"content": f"doc {i}"}).encode() + b"\n" for i in range(n))
+
+
+def test_lines_are_numbered_and_blank_lines_skipped():
+    items = _parse(b'{"a": 1}\n\n{"a": 2}\nnot json\n{"a": 3}')
+    assert [(n, obj) for n, obj in items if not isinstance(obj, Exception)] == [(1, {"a": 1}), (3, {"a": 2}), (5, {"a": 3})]
+    assert isinstance(items[2][1], ValueError) and items[2][0] == 4
+
+
+@pytest.mark.parametrize("encoding,compress", [
+    ("gzip", gzip.compress),
+    ("deflate", zlib.compress),
+    (None, lambda data: data),
+])
+def test_encodings(encoding, compress):
+    assert len(_parse(compress(_lines(500)), encoding)) == 500
+
+
+def test_concatenated_gzip_members():
+    data = gzip.compress(_lines(3)) + gzip.compress(_lines(2))
+    assert len(_parse(data, "gzip")) == 5
+
+
+def test_zstd():
+    zstandard = pytest.importorskip("zstandard")
+    assert len(_parse(zstandard.ZstdCompressor().compress(_lines(200)), "zstd")) == 200
+
+
+def test_line_limit_applies_to_complete_lines():
+    with pytest.raises(LineTooLong):
+        _parse(b'{"a": 1}\n' + b'"' + b"x" * 200 + b'"\n', max_line_bytes=100, size=1000)
+
+
+def test_line_limit_applies_while_buffering():
+    async def endless():
+        yield b'"'
+        while True:
+            yield b"x" * 64
+
+    async def collect():
+        return [item async for item in iter_ndjson(endless(), max_line_bytes=1000)]
+
+    with pytest.raises(LineTooLong):
+        asyncio.run(collect())
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "zstd"])
+def test_decompression_bomb_stops_at_the_line_limit(encoding):
+    bomb = b"x" * (64 * 1024 * 1024)  # one 64 MiB line, a few KiB compressed
+    if encoding == "gzip":
+        data = gzip.compress(bomb)
+    else:
+        data = pytest.importorskip("zstandard").ZstdCompressor().compress(bomb)
+    assert len(data) < 1024 * 1024
+    with pytest.raises(LineTooLong):
+        _parse(data, encoding, max_line_bytes=1024 * 1024, size=len(data))
+
+
+def test_truncated_and_corrupt_bodies():
+    data = gzip.compress(_lines(100))
+    with pytest.raises(StreamError):
+        _parse(data[:len(data) // 2], "gzip")
+    with pytest.raises(StreamError):
+        _parse(b"definitely not gzip", "gzip")
+
+
+def test_unknown_encoding():
+    with pytest.raises(UnsupportedEncoding):
+        _parse(b"", "br")
+
+
+def test_stream_ingest_batches_and_reports_invalid_lines():
+    batches = []
+
+    async def ingest(batch):
+        batches.append(batch)
+        return {"embedded": len(batch), "skipped": 0}
+
+    async def run():
+        body = _lines(5) + b'{"meta": {}}\n' + _lines(2)
+        return await stream_ingest(iter_ndjson(_body(body)), ingest, batch_size=3)
+
+    summary, error = asyncio.run(run())
+    assert error is None
+    assert [len(b) for b in batches] == [3, 3, 1]
+    assert summary["ingested"] == 7 and summary["invalid"] == 1
+    assert summary["errors"][0]["line"] == 6
+
+
+def test_stream_ingest_keeps_documents_before_a_broken_stream():
+    ingested = []
+
+    async def ingest(batch):
+        ingested.extend(batch)
+        return {"embedded": len(batch)}
+
+    async def run():
+        body = _lines(4) + b'"' + b"x" * 500 + b'"\n'
+        return await stream_ingest(iter_ndjson(_body(body), max_line_bytes=100), ingest, batch_size=10)
+
+    summary, error = asyncio.run(run())
+    assert isinstance(error, LineTooLong)
+    assert len(ingested) == 4 and summary["status"] == "aborted"
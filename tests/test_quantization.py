@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from app.quantization import BinaryCodes, Int8Codes, PrefixCodes, make_codes, truncate
+
+DIM = 64
+
+
+@pytest.fixture
+def vectors():
+    rows = np.random.default_rng(0).normal(size=(200, DIM)).astype(np.float32)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+def _encoded(codes, vectors):
+    codes.resize(len(vectors))
+    codes.set(slice(0, len(vectors)), vectors)
+    return codes
+
+
+def test_int8_scores_approximate_dot_products(vectors):
+    codes = _encoded(Int8Codes(DIM), vectors)
+    query = vectors[3]
+    assert np.allclose(codes.scores(query, len(vectors)), vectors @ query, atol=0.02)
+    assert codes.nbytes < vectors.nbytes / 3
+
+
+def test_binary_scores_count_sign_agreement(vectors):
+    codes = _encoded(BinaryCodes(DIM), vectors)
+    query = vectors[5]
+    agree = ((vectors > 0) == (query > 0)).sum(axis=1)
+    assert np.array_equal(codes.scores(query, len(vectors)), (2 * agree - DIM).astype(np.float32))
+    assert codes.scores(query, len(vectors))[5] == DIM
+
+
+def test_prefix_scores_are_prefix_cosines(vectors):
+    codes = _encoded(PrefixCodes(DIM, 16), vectors)
+    query = vectors[7]
+    assert np.allclose(codes.scores(query, len(vectors)), truncate(vectors, 16) @ truncate(query, 16), atol=1e-6)
+    assert codes.name == "prefix16"
+
+
+def test_resize_keeps_existing_codes(vectors):
+    codes = _encoded(Int8Codes(DIM), vectors[:10])
+    before = codes.scores(vectors[0], 10)
+    codes.resize(50)
+    assert codes.codes.shape[0] == 50
+    assert np.array_equal(codes.scores(vectors[0], 10), before)
+
+
+def test_make_codes():
+    assert make_codes("none", DIM) is None
+    assert isinstance(make_codes("binary", DIM), BinaryCodes)
+    with pytest.raises(ValueError):
+        make_codes("pq", DIM)
+    with pytest.raises(ValueError):
+        PrefixCodes(DIM, DIM)
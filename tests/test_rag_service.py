@@ -0,0 +1,128 @@
+import asyncio
+
+from haystack import Document
+
+from app import rag_service
+from app.rag_service import GeminiDocumentEmbedder, split_batches
+
+
+def test_split_batches_bounds_items_and_tokens():
+    texts = ["x" * 30] * 7  # ~10 tokens each
+    assert split_batches(texts, max_items=3, max_tokens=1000) == [[0, 1, 2], [3, 4, 5], [6]]
+    assert split_batches(texts, max_items=100, max_tokens=25) == [[0, 1], [2, 3], [4, 5], [6]]
+    assert split_batches(["x" * 300], max_items=10, max_tokens=5) == [[0]]  # an oversized text still gets a batch
+    assert split_batches([], 10, 10) == []
+
+
+def _fake_embed(calls):
+    def embed(texts, model, task_type, dim, retries, retry_backoff):
+        calls.append(list(texts))
+        return [[float(len(t))] for t in texts]
+
+    async def aembed(*args):
+        return embed(*args)
+
+    return embed, aembed
+
+
+def test_document_embedder_batches_in_parallel_and_keeps_order(monkeypatch):
+    calls = []
+    embed, aembed = _fake_embed(calls)
+    monkeypatch.setattr(rag_service, "gemini_embed_batch", embed)
+    monkeypatch.setattr(rag_service, "gemini_embed_batch_async", aembed)
+    embedder = GeminiDocumentEmbedder(max_items=2, parallelism=3)
+
+    docs = [Document(content="a" * n) for n in range(1, 6)]
+    assert [d.embedding for d in embedder.run(docs)["documents"]] == [[float(n)] for n in range(1, 6)]
+    assert sorted(map(len, calls)) == [1, 2, 2]
+
+    docs = [Document(content="b" * n) for n in range(1, 6)]
+    assert [d.embedding for d in asyncio.run(embedder.run_async(docs))["documents"]] == [[float(n)] for n in range(1, 6)]
+
+
+def test_document_embedder_with_nothing_to_embed(monkeypatch):
+    calls = []
+    embed, aembed = _fake_embed(calls)
+    monkeypatch.setattr(rag_service, "gemini_embed_batch", embed)
+    monkeypatch.setattr(rag_service, "gemini_embed_batch_async", aembed)
+    embedder = GeminiDocumentEmbedder()
+    assert embedder.run([]) == {"documents": []}
+    assert asyncio.run(embedder.run_async([])) == {"documents": []}
+    assert calls == []
+
+
+class CountingEmbedder:
+    """Document embedder stand-in: deterministic vectors, remembers what it was asked to embed"""
+    model = "fake-embed"
+    dim = 8
+    task_type = "RETRIEVAL_DOCUMENT"
+
+    def __init__(self):
+        self.embedded = []
+
+    async def run_async(self, documents):
+        for doc in documents:
+            self.embedded.append(doc.content)
+            seed = sum(map(ord, doc.content))
+            doc.embedding = [float((seed * (i + 1)) % 7 + 1) for i in range(self.dim)]
+        return {"documents": documents}
+
+
+def _service(tmp_path, prefix_dim=0):
+    from app.local_store import LocalDocumentStore
+
+    embedder = CountingEmbedder()
+    doc_store = LocalDocumentStore(str(tmp_path / "main"), embedder.dim)
+    prefix_store = LocalDocumentStore(str(tmp_path / "prefix"), prefix_dim) if prefix_dim else None
+    service = rag_service.RAGService(
+        retriever=None, doc_store=doc_store, text_embedder=None, doc_embedder=embedder, prefix_store=prefix_store,
+    )
+    return service, embedder
+
+
+def _payload(*contents, **meta):
+    return [{"content": c, "meta": {"title": "a.txt", "chunk": i + 1, **meta}} for i, c in enumerate(contents)]
+
+
+def test_unchanged_chunks_are_skipped(tmp_path):
+    service, embedder = _service(tmp_path)
+    assert asyncio.run(service.aingest(_payload("one", "two", "three"))) == {"embedded": 3, "skipped": 0}
+    assert asyncio.run(service.aingest(_payload("one", "two", "three"))) == {"embedded": 0, "skipped": 3}
+    assert embedder.embedded == ["one", "two", "three"]
+
+
+def test_changed_content_is_reembedded(tmp_path):
+    service, embedder = _service(tmp_path)
+    asyncio.run(service.aingest(_payload("one", "two")))
+    assert asyncio.run(service.aingest(_payload("one", "2"))) == {"embedded": 1, "skipped": 1}
+    assert embedder.embedded[-1] == "2"
+    stored = service.doc_store.get_documents_by_id([service._to_documents(_payload("one", "2"))[1].id])[0]
+    assert stored.content == "2"
+
+
+def test_meta_only_change_rewrites_the_chunk(tmp_path):
+    service, embedder = _service(tmp_path)
+    asyncio.run(service.aingest(_payload("one", "two")))
+    assert asyncio.run(service.aingest(_payload("one", "two", source="docs/a.txt"))) == {"embedded": 2, "skipped": 0}
+    doc_id = service._to_documents(_payload("one"))[0].id
+    assert service.doc_store.get_meta_by_id([doc_id])[doc_id]["source"] == "docs/a.txt"
+
+
+def test_changed_documents_compares_the_stored_meta():
+    docs = rag_service.RAGService(None, None, None, CountingEmbedder())._to_documents(_payload("one", "two", "three"))
+    stored = {docs[0].id: dict(docs[0].meta), docs[1].id: {**docs[1].meta, "embed_dim": 4}}
+    assert rag_service.RAGService._changed_documents(docs, stored) == docs[1:]
+    # With a prefix sidecar, a document stored in full but missing its prefix vector is redone too
+    assert rag_service.RAGService._changed_documents(docs, stored, prefix_meta={}) == docs[1:] + docs[:1]
+
+
+def test_prefix_sidecar_is_written_and_backfilled(tmp_path):
+    service, embedder = _service(tmp_path)
+    asyncio.run(service.aingest(_payload("one", "two")))
+
+    service, embedder = _service(tmp_path, prefix_dim=4)  # Matryoshka turned on for an existing index
+    assert asyncio.run(service.aingest(_payload("one", "two"))) == {"embedded": 2, "skipped": 0}
+    assert service.prefix_store.count_documents() == 2
+    prefix = service.prefix_store.get_documents_by_id([service._to_documents(_payload("one"))[0].id])[0]
+    assert len(prefix.embedding) == 4
+    assert asyncio.run(service.aingest(_payload("one", "two"))) == {"embedded": 0, "skipped": 2}
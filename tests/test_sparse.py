@@ -0,0 +1,68 @@
+import json
+
+from haystack import Document
+
+from app.sparse import BM25Index, reciprocal_rank_fusion
+
+
+def _doc(doc_id, content, **meta):
+    return Document(id=doc_id, content=content, meta=meta)
+
+
+DOCS = [
+    _doc("1", "the quick brown fox", source="a", chunk=1),
+    _doc("2", "a lazy dog sleeps", source="a", chunk=2),
+    _doc("3", "the fox and the dog", source="b", chunk=1),
+]
+
+
+def test_rrf_sums_weighted_reciprocal_ranks():
+    fused = dict(reciprocal_rank_fusion([["a", "b"], ["b", "c"]], [1.0, 2.0], k=60))
+    assert fused["a"] == 1 / 61
+    assert fused["b"] == 1 / 62 + 2 / 61
+    assert fused["c"] == 2 / 62
+
+
+def test_rrf_orders_by_score_and_skips_zero_weights():
+    fused = reciprocal_rank_fusion([["a", "b"], ["b", "a", "z"]], [1.0, 0.0])
+    assert [doc_id for doc_id, _ in fused] == ["a", "b"]
+
+
+def test_search_ranks_matching_documents():
+    index = BM25Index()
+    index.add(DOCS)
+    hits = index.search("fox dog", top_k=3)
+    assert hits[0][0] == "3"
+    assert {doc_id for doc_id, _ in hits} == {"1", "2", "3"}
+    assert index.search("unicorn") == []
+    assert "1" in index and len(index) == 3
+
+
+def test_readd_replaces_terms():
+    index = BM25Index()
+    index.add(DOCS)
+    index.add([_doc("1", "completely different words", source="a", chunk=1)])
+    assert "1" not in {doc_id for doc_id, _ in index.search("fox")}
+    assert len(index) == 3
+
+
+def test_delete_by_meta_with_operators():
+    index = BM25Index()
+    index.add(DOCS)
+    assert index.delete_by_meta({"source": "a", "chunk": {">": 1}}) == 1
+    assert "2" not in index and "1" in index
+    assert index.delete_by_meta({"source": {"in": ["a", "b"]}}) == 2
+    assert len(index) == 0
+
+
+def test_log_is_replayed_on_load(tmp_path):
+    path = tmp_path / "bm25.jsonl"
+    index = BM25Index(str(path))
+    index.add(DOCS)
+    index.delete_by_meta({"source": "b"})
+    index.add([_doc("4", "a brown owl", source="c")])
+
+    reloaded = BM25Index(str(path))
+    assert len(reloaded) == 3 and "3" not in reloaded
+    assert reloaded.search("owl")[0][0] == "4"
+    assert [r for r in map(json.loads, path.read_text().splitlines()) if "delete" in r] == [{"delete": ["3"]}]